@@ -0,0 +1,217 @@
+# benchmarks/bench_crawl.py
+"""
+端到端抓取基准：在本地替身（fixture_server.py）上跑各种抓取模式，不访问 kickstarter.com。
+
+    python benchmarks/bench_crawl.py --pages 40 --latency_ms 50
+    python benchmarks/bench_crawl.py --save_baseline bench_baseline.json
+    python benchmarks/bench_crawl.py --baseline bench_baseline.json --tolerance 0.25   # CI：变慢则退出码 1
+
+模式：click（点击 Load more）、direct_graphql（重放 GraphQL）、no_block（不拦截资源）、
+incremental（先全量抓一次，再计时增量抓取）、batch（一个浏览器并发抓多个项目）、
+expand_replies（翻页后并发补全被截断的回复，替身按 --reply_page_size 截断回复）。
+每个模式在独立子进程中运行，报告 pages/s、抓取+解析耗时、Python 与 Chromium 的峰值 RSS。
+需要已安装 Playwright 的 Chromium（playwright install chromium）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告 RSS
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fixture_server import FixtureData, project_url, start_server  # noqa: E402
+
+MODES = ("click", "direct_graphql", "no_block", "incremental", "batch", "expand_replies")
+
+
+def peak_rss_mb():
+    """返回 (本进程峰值 RSS, 已退出子进程中最大的峰值 RSS)，单位 MB；Linux 上 ru_maxrss 为 KB"""
+    if resource is None:
+        return None, None
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / 1024 / 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1))
+
+
+def count_pages(path):
+    from page_store import iter_pages
+    pages = comments = 0
+    for page in iter_pages(path):
+        pages += 1
+        for edge in (page.get("comments") or {}).get("edges") or []:
+            node = edge.get("node") or {}
+            comments += 1 + len((node.get("replies") or {}).get("nodes") or [])
+    return pages, comments
+
+
+async def crawl_mode(mode, base_url, workdir, args, timings):
+    """运行一个模式的抓取，返回输出文件列表"""
+    from crawler import run_batch, run_crawler
+
+    crawl_kwargs = dict(
+        max_clicks=args.pages + 5,
+        click_timeout_ms=5000,
+        initial_wait_ms=2000,
+        scroll_min=200,
+        scroll_max=400,
+        scroll_sleep_min=0.0,
+        scroll_sleep_max=0.01,
+        direct_graphql=mode == "direct_graphql",
+        block_resources=mode != "no_block",
+        expand_replies=mode == "expand_replies",
+        timings=timings,
+    )
+    url = project_url(base_url)
+    if mode == "batch":
+        urls = [project_url(base_url, creator=f"fixture{i}") for i in range(args.batch_projects)]
+        results = await run_batch(urls, output_dir=os.path.join(workdir, "batch"), concurrency=args.concurrency,
+                                  per_host_concurrency=args.concurrency, **crawl_kwargs)
+        return [f for f in results.values() if f]
+    output_file = os.path.join(workdir, f"{mode}.jsonl")
+    if mode == "incremental":
+        # 先全量抓一次作为“上次的输出”（不计时），再计时增量抓取
+        previous = os.path.join(workdir, "previous.jsonl")
+        await run_crawler(url, output_file=previous, **{**crawl_kwargs, "timings": None})
+        crawl_kwargs.update(incremental_from=[previous], delta_file=os.path.join(workdir, "delta.jsonl"))
+        started = time.perf_counter()
+        await run_crawler(url, output_file=output_file, **crawl_kwargs)
+        return [output_file], time.perf_counter() - started
+    return [await run_crawler(url, output_file=output_file, **crawl_kwargs)]
+
+
+def run_child(args):
+    """子进程：跑一个模式，向 stdout 输出一行 JSON 结果"""
+    from instrumentation import Timings
+    from parser import parse_edges
+
+    timings = Timings()
+    started = time.perf_counter()
+    outputs = asyncio.run(crawl_mode(args.run_mode, args.base_url, args.workdir, args, timings))
+    crawl_seconds = time.perf_counter() - started
+    if isinstance(outputs, tuple):
+        outputs, crawl_seconds = outputs
+
+    pages = comments = 0
+    for path in outputs:
+        p, c = count_pages(path)
+        pages += p
+        comments += c
+
+    started = time.perf_counter()
+    rows = 0
+    for path in outputs:
+        rows += parse_edges(path, os.path.splitext(path)[0] + "." + args.format, fmt=args.format)
+    parse_seconds = time.perf_counter() - started
+
+    rss_self, rss_children = peak_rss_mb()
+    summary = timings.summary()
+    result = {
+        "mode": args.run_mode,
+        "pages": pages,
+        "comments": comments,
+        "rows": rows,
+        "crawl_seconds": round(crawl_seconds, 3),
+        "parse_seconds": round(parse_seconds, 3),
+        "total_seconds": round(crawl_seconds + parse_seconds, 3),
+        "pages_per_sec": round(pages / crawl_seconds, 2) if crawl_seconds else 0.0,
+        "peak_rss_mb": rss_self,
+        "browser_peak_rss_mb": rss_children,
+        "click_response_p50": (summary.get("click_response") or {}).get("p50"),
+    }
+    print(json.dumps(result))
+
+
+def compare_baseline(results, baseline, tolerance):
+    """pages/s 低于基线 (1 - tolerance) 倍的模式视为回归，返回回归列表"""
+    regressions = []
+    for mode, result in results.items():
+        base = baseline.get(mode)
+        if not base or not base.get("pages_per_sec"):
+            continue
+        floor = base["pages_per_sec"] * (1 - tolerance)
+        if result["pages_per_sec"] < floor:
+            regressions.append(f"{mode}: {result['pages_per_sec']} pages/s < {floor:.2f}"
+                               f"（基线 {base['pages_per_sec']}）")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="端到端抓取基准（本地替身，无需网络）")
+    ap.add_argument("--modes", type=str, nargs="+", default=list(MODES), choices=MODES)
+    ap.add_argument("--pages", type=int, default=20, help="每个项目的评论页数")
+    ap.add_argument("--page_size", type=int, default=25, help="每页顶层评论数")
+    ap.add_argument("--replies", type=int, default=3, help="每条评论的回复数")
+    ap.add_argument("--reply_depth", type=int, default=1, help="回复嵌套层数")
+    ap.add_argument("--latency_ms", type=int, default=30, help="/graph 响应延迟（毫秒）")
+    ap.add_argument("--error_rate", type=float, default=0.0, help="/graph 返回 502 的概率")
+    ap.add_argument("--rate_limit_rate", type=float, default=0.0, help="/graph 返回 429（Retry-After: 1）的概率")
+    ap.add_argument("--reply_page_size", type=int, default=2, help="随评论页返回的回复数（其余需展开）")
+    ap.add_argument("--batch_projects", type=int, default=4, help="batch 模式的项目数")
+    ap.add_argument("--concurrency", type=int, default=4, help="batch 模式并发数")
+    ap.add_argument("--format", type=str, default="csv", help="解析输出格式")
+    ap.add_argument("--baseline", type=str, help="基线 JSON；pages/s 低于基线超过 tolerance 时退出码为 1")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="允许的相对回退比例")
+    ap.add_argument("--save_baseline", type=str, help="把本次结果保存为基线 JSON")
+    # 内部使用：子进程参数
+    ap.add_argument("--run_mode", type=str, help=argparse.SUPPRESS)
+    ap.add_argument("--base_url", type=str, help=argparse.SUPPRESS)
+    ap.add_argument("--workdir", type=str, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_mode:
+        run_child(args)
+        return
+
+    data = FixtureData(args.pages, args.page_size, args.replies, args.reply_depth,
+                       args.latency_ms, args.error_rate, reply_page_size=args.reply_page_size,
+                       rate_limit_rate=args.rate_limit_rate)
+    server, base_url = start_server(data)
+    print(f"fixture: {base_url} ({len(data.pages)} pages, {data.total_comments} comments/project)")
+
+    results = {}
+    try:
+        for mode in args.modes:
+            workdir = tempfile.mkdtemp(prefix=f"ks_bench_{mode}_")
+            cmd = [sys.executable, os.path.abspath(__file__), "--run_mode", mode, "--base_url", base_url,
+                   "--workdir", workdir, "--pages", str(args.pages), "--format", args.format,
+                   "--batch_projects", str(args.batch_projects), "--concurrency", str(args.concurrency)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{mode:>15}: 失败\n{proc.stderr[-2000:]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[mode] = result
+            print(f"{mode:>15}: {result['pages']:4d} pages  {result['pages_per_sec']:7.2f} pages/s  "
+                  f"crawl {result['crawl_seconds']:6.2f}s  parse {result['parse_seconds']:5.2f}s  "
+                  f"rss {result['peak_rss_mb']} MB / chromium {result['browser_peak_rss_mb']} MB")
+    finally:
+        server.shutdown()
+    print(f"/graph requests: {data.graph_requests}, injected errors: {data.graph_errors}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"基线已保存: {args.save_baseline}")
+
+    failed = [m for m in args.modes if m not in results]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_baseline(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[regression] {line}")
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
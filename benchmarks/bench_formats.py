@@ -0,0 +1,48 @@
+# benchmarks/bench_formats.py
+"""
+输出格式基准：同一份合成 JSONL 分别写出 xlsx / csv / parquet / feather，比较写出耗时与文件大小。
+
+    python benchmarks/bench_formats.py --comments 200000
+
+Excel 超过 1,048,575 行会直接报错，此时跳过。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exporters import EXPORTERS, FORMAT_EXTENSIONS  # noqa: E402
+from parser import parse_edges  # noqa: E402
+from synthetic import write_dump  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description="输出格式基准：写出耗时与文件大小")
+    ap.add_argument("--comments", type=int, default=200_000, help="合成评论总数（含回复）")
+    ap.add_argument("--chunk_rows", type=int, default=100_000, help="每块行数")
+    ap.add_argument("--formats", type=str, nargs="+", default=list(EXPORTERS), help="要测试的格式")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ks_formats_")
+    dump = os.path.join(workdir, "dump.jsonl")
+    write_dump(dump, args.comments)
+    print(f"dump: {dump} ({os.path.getsize(dump) / 1e6:.1f} MB, {args.comments} comments)")
+
+    for fmt in args.formats:
+        out = os.path.join(workdir, "out" + FORMAT_EXTENSIONS[fmt])
+        t0 = time.perf_counter()
+        try:
+            parse_edges(dump, out, fmt=fmt, chunk_rows=args.chunk_rows)
+        except ValueError as e:
+            print(f"{fmt:>8}: 跳过（{e}）")
+            continue
+        elapsed = time.perf_counter() - t0
+        size = os.path.getsize(out) / 1e6
+        print(f"{fmt:>8}: {elapsed:7.2f}s  {args.comments / elapsed:10.0f} rows/s  {size:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_memory.py
+"""
+解析内存基准：在大合成 dump 上比较各种读取/解析方式的峰值 RSS（每种方式一个独立子进程）。
+
+    python benchmarks/bench_memory.py --comments 2000000
+
+方式：
+- json_load         ：旧做法，json.load 整个 .json 列表后展开为整表 DataFrame（parse_many 的单文件路径）
+- json_stream       ：.json 流式逐页读取（page_store.iter_json_array），展开方式不变
+- json_stream_compact：流式读取 + 紧凑列（作者表去重、字符串共享、时间戳数组）
+- jsonl_chunked / jsonl_chunked_compact：parse_edges 按块写出 csv（run.py 默认路径）的对照
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+CASES = ("json_load", "json_stream", "json_stream_compact", "jsonl_chunked", "jsonl_chunked_compact")
+
+
+def peak_rss_mb():
+    """本进程峰值 RSS（MB）。Linux 上读 VmHWM：ru_maxrss 会跨 exec 继承父进程（生成 dump 时）的峰值"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / 1024 / 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1)
+
+
+def run_case(case, json_path, jsonl_path):
+    """子进程：跑一种方式，输出一行 JSON 结果"""
+    import pandas  # noqa: F401  先导入，基线 RSS 里包含 pandas/numpy 本身
+    from page_store import iter_pages
+    from parser import build_dataframe, flatten_pages, parse_edges
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    if case == "json_load":
+        with open(json_path, "r", encoding="utf-8") as f:
+            pages = json.load(f)
+        rows = len(build_dataframe(flatten_pages(pages)))
+    elif case in ("json_stream", "json_stream_compact"):
+        rows = len(build_dataframe(flatten_pages(iter_pages(json_path), compact=case.endswith("compact"))))
+    else:
+        output = os.path.join(tempfile.gettempdir(), f"ks_bench_memory_{case}.csv")
+        rows = parse_edges(jsonl_path, output, fmt="csv", compact=case.endswith("compact"))
+        os.remove(output)
+    print(json.dumps({"case": case, "rows": rows, "seconds": round(time.perf_counter() - started, 2),
+                      "baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="解析峰值 RSS 基准")
+    ap.add_argument("--comments", type=int, default=2_000_000, help="合成评论总数（含回复）")
+    ap.add_argument("--cases", type=str, nargs="+", default=list(CASES), choices=CASES)
+    ap.add_argument("--dump", type=str, help="复用已有的 .json dump（同目录下生成同名 .jsonl）")
+    # 内部使用：子进程参数
+    ap.add_argument("--run_case", type=str, help=argparse.SUPPRESS)
+    ap.add_argument("--json_path", type=str, help=argparse.SUPPRESS)
+    ap.add_argument("--jsonl_path", type=str, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, args.json_path, args.jsonl_path)
+        return
+
+    from page_store import iter_pages
+    from synthetic import write_dump
+
+    json_path = args.dump or os.path.join(tempfile.gettempdir(), f"ks_synthetic_{args.comments}.json")
+    if not os.path.exists(json_path):
+        print(f"生成合成 dump: {json_path}")
+        write_dump(json_path, args.comments)
+    jsonl_path = os.path.splitext(json_path)[0] + ".jsonl"
+    if not os.path.exists(jsonl_path):
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for page in iter_pages(json_path):
+                f.write(json.dumps(page, ensure_ascii=False) + "\n")
+    print(f"dump: {json_path} ({os.path.getsize(json_path) / 1e6:.1f} MB)")
+
+    for case in args.cases:
+        cmd = [sys.executable, os.path.abspath(__file__), "--run_case", case,
+               "--json_path", json_path, "--jsonl_path", jsonl_path]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"{case:>22}: 失败\n{proc.stderr[-2000:]}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{case:>22}: {r['rows']} rows  {r['seconds']:6.2f}s  "
+              f"peak RSS {r['peak_rss_mb']} MB（导入 pandas 后 {r['baseline_rss_mb']} MB）")
+
+
+if __name__ == "__main__":
+    main()
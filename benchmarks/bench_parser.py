@@ -0,0 +1,136 @@
+# benchmarks/bench_parser.py
+"""
+解析器基准：对比旧的递归逐行实现与当前的列式迭代实现（flatten_pages + build_dataframe）。
+
+    python benchmarks/bench_parser.py --comments 1000000
+
+每个实现跑两次：一次只计时（comments/s），一次用 tracemalloc 统计 Python 峰值内存。
+只比较“读入 -> DataFrame”，不含 Excel 写出（两者写出代价相同）。
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pandas as pd  # noqa: E402
+
+from parser import build_dataframe, flatten_pages  # noqa: E402
+from page_store import iter_pages  # noqa: E402
+from synthetic import write_dump  # noqa: E402
+
+
+def legacy_parse(input_file):
+    """重构前的实现：json.load 整个文件 + 递归 process_comment_node + 逐值 datetime.fromtimestamp"""
+    with open(input_file, "r", encoding="utf-8") as f:
+        pages = json.load(f)
+
+    all_comments = []
+
+    def safe_timestamp(ts):
+        try:
+            return datetime.fromtimestamp(ts)
+        except Exception:
+            return None
+
+    def process_comment_node(node, parent_id=None):
+        if not node:
+            return
+        comment = {
+            "comment_id": node.get("id"),
+            "parent_id": parent_id or node.get("parentId"),
+            "body": node.get("body"),
+            "created_at": safe_timestamp(node.get("createdAt")),
+            "removed": node.get("removedPerGuidelines"),
+            "author_badges": node.get("authorBadges"),
+            "deleted": node.get("deleted"),
+            "pinned_at": safe_timestamp(node.get("pinnedAt")),
+            "author_canceled_pledge": node.get("authorCanceledPledge"),
+            "author_backing": node.get("authorBacking"),
+        }
+        author = node.get("author") or {}
+        comment.update({
+            "author_id": author.get("id"),
+            "author_name": author.get("name"),
+            "author_url": author.get("url"),
+            "author_avatar": author.get("imageUrl"),
+            "author_blocked": author.get("isBlocked"),
+        })
+        all_comments.append(comment)
+        for reply_node in (node.get("replies") or {}).get("nodes") or []:
+            process_comment_node(reply_node, parent_id=node.get("id"))
+
+    for page in pages:
+        for edge in (page.get("comments") or {}).get("edges") or []:
+            process_comment_node(edge.get("node"))
+    return pd.DataFrame(all_comments)
+
+
+def columnar_parse(input_file):
+    return build_dataframe(flatten_pages(iter_pages(input_file)))
+
+
+def measure(fn, path):
+    gc.collect()
+    t0 = time.perf_counter()
+    rows = len(fn(path))
+    elapsed = time.perf_counter() - t0
+
+    gc.collect()
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def main():
+    ap = argparse.ArgumentParser(description="parser 基准：旧递归实现 vs 列式迭代实现")
+    ap.add_argument("--comments", type=int, default=1_000_000, help="合成评论总数（含回复）")
+    ap.add_argument("--replies", type=int, default=3, help="每条评论的回复数")
+    ap.add_argument("--reply_depth", type=int, default=1, help="回复嵌套层数")
+    ap.add_argument("--dump", type=str, help="复用已有 dump（.json 列表格式，旧实现只能读这种）")
+    args = ap.parse_args()
+
+    path = args.dump
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"ks_synthetic_{args.comments}.json")
+        if not os.path.exists(path):
+            print(f"生成合成 dump: {path}")
+            write_dump(path, args.comments, replies_per_comment=args.replies, reply_depth=args.reply_depth)
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"dump: {path} ({size_mb:.1f} MB)")
+
+    # 同一份数据的 JSONL 版本：列式实现可以逐页读取，不必一次性 json.load
+    jsonl_path = os.path.splitext(path)[0] + ".jsonl"
+    if not os.path.exists(jsonl_path):
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for page in iter_pages(path):
+                f.write(json.dumps(page, ensure_ascii=False) + "\n")
+
+    results = {}
+    cases = (
+        ("legacy", legacy_parse, path),
+        ("columnar", columnar_parse, path),
+        ("columnar+jsonl", columnar_parse, jsonl_path),
+    )
+    for name, fn, input_file in cases:
+        rows, elapsed, peak = measure(fn, input_file)
+        results[name] = (elapsed, peak)
+        print(f"{name:>15}: {rows} rows  {elapsed:7.2f}s  {rows / elapsed:10.0f} comments/s  "
+              f"peak {peak / 1e6:8.1f} MB")
+
+    t_old, m_old = results["legacy"]
+    for name in ("columnar", "columnar+jsonl"):
+        t_new, m_new = results[name]
+        print(f"{name}: speedup {t_old / t_new:.2f}x, peak memory {m_new / m_old:.2f}x of legacy")
+
+
+if __name__ == "__main__":
+    main()
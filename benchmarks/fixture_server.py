@@ -0,0 +1,277 @@
+# benchmarks/fixture_server.py
+"""
+本地 Kickstarter 替身（只用标准库 http.server），用于离线跑 run_crawler / run_batch 的基准。
+
+- GET  /projects/<creator>/<project>/comments ：评论页，加载后请求首页评论，带可点击的 "Load more" 按钮
+- POST /graph ：返回 [{"data": {"commentable": ...}}]，按 variables.nextCursor 分页（与线上结构一致）；
+  reply_page_size > 0 时每条评论只带前几条回复，CommentRepliesQuery（variables.commentId / nextCursor）
+  返回 [{"data": {"comment": {"id", "replies"}}}]，页面上对应 "View more replies" 按钮
+- GET  /static/... ：占位图片，用于验证资源拦截
+
+    python benchmarks/fixture_server.py --pages 50 --latency_ms 80 --error_rate 0.02 --rate_limit_rate 0.05 --port 8765
+
+页数、每页评论数、回复数/层数、/graph 延迟、错误率（502）与限流率（429 + Retry-After）均可配置；合成数据来自 synthetic.py。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from synthetic import iter_synthetic_pages
+
+COMMENTS_HTML = """<!doctype html>
+<html>
+<head><meta charset="utf-8"><title>Fixture project comments</title></head>
+<body>
+<img src="/static/hero.png" alt="hero">
+<div id="comments"></div>
+<button class="kds-button" data-rac style="display:none">Load more</button>
+<script>
+const QUERY = "query CommentsQuery($commentableId: ID!, $nextCursor: String) { commentable(id: $commentableId) { comments(after: $nextCursor) { edges { node { id body } } pageInfo { endCursor hasNextPage } } } }";
+const REPLIES_QUERY = "query CommentRepliesQuery($commentId: ID!, $nextCursor: String) { comment(id: $commentId) { id replies(after: $nextCursor) { nodes { id body } pageInfo { endCursor hasNextPage } } } }";
+const list = document.getElementById("comments");
+const button = document.querySelector("button.kds-button");
+let cursor = null;
+let loading = false;
+
+async function loadPage() {
+  if (loading) return;
+  loading = true;
+  try {
+    const resp = await fetch("/graph", {
+      method: "POST",
+      headers: {"content-type": "application/json"},
+      body: JSON.stringify({operationName: "CommentsQuery", query: QUERY,
+                            variables: {commentableId: "UHJvamVjdC0x", nextCursor: cursor}}),
+    });
+    if (!resp.ok) return;  // 出错时保留按钮，允许重试
+    const body = await resp.json();
+    const comments = body[0].data.commentable.comments;
+    for (const edge of comments.edges) {
+      const div = document.createElement("div");
+      div.className = "comment";
+      div.textContent = edge.node.body;
+      list.appendChild(div);
+      const replies = edge.node.replies || {};
+      if (replies.pageInfo && replies.pageInfo.hasNextPage) {
+        const more = document.createElement("button");
+        more.className = "more-replies";
+        more.textContent = "View more replies";
+        let replyCursor = replies.pageInfo.endCursor;
+        more.addEventListener("click", async () => {
+          const r = await fetch("/graph", {
+            method: "POST",
+            headers: {"content-type": "application/json"},
+            body: JSON.stringify({operationName: "CommentRepliesQuery", query: REPLIES_QUERY,
+                                  variables: {commentId: edge.node.id, nextCursor: replyCursor}}),
+          });
+          if (!r.ok) return;
+          const page = (await r.json())[0].data.comment.replies;
+          replyCursor = page.pageInfo.endCursor;
+          if (!page.pageInfo.hasNextPage) more.remove();
+        });
+        div.appendChild(more);
+      }
+    }
+    cursor = comments.pageInfo.endCursor;
+    if (comments.pageInfo.hasNextPage) {
+      button.style.display = "";
+    } else {
+      button.remove();
+    }
+  } finally {
+    loading = false;
+  }
+}
+
+button.addEventListener("click", loadPage);
+loadPage();
+</script>
+</body>
+</html>
+"""
+
+# 1x1 PNG
+PLACEHOLDER_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+class FixtureData:
+    """预生成的分页数据与运行统计（多线程共享）"""
+
+    def __init__(self, pages=20, page_size=25, replies_per_comment=3, reply_depth=1,
+                 latency_ms=0, error_rate=0.0, seed=42, reply_page_size=0, rate_limit_rate=0.0):
+        per_comment = sum(replies_per_comment ** d for d in range(reply_depth + 1))
+        total = pages * page_size * per_comment
+        self.pages = list(iter_synthetic_pages(total, page_size=page_size,
+                                               replies_per_comment=replies_per_comment,
+                                               reply_depth=reply_depth, seed=seed))
+        self.reply_page_size = reply_page_size
+        self.replies = {}   # comment_id -> 完整回复列表（仅在截断时使用）
+        if reply_page_size:
+            for page in self.pages:
+                for edge in page["comments"]["edges"]:
+                    node = edge["node"]
+                    full = node["replies"]["nodes"]
+                    if len(full) > reply_page_size:
+                        self.replies[node["id"]] = full
+                        node["replies"] = self.reply_page(node["id"], None)
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.total_comments = total
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.graph_requests = 0
+        self.graph_errors = 0
+
+    def page_for_cursor(self, cursor):
+        """nextCursor 为 None 时返回首页；cursor-N 返回第 N+1 页；未知游标返回 None"""
+        if not cursor:
+            return self.pages[0]
+        try:
+            n = int(str(cursor).rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return None
+        return self.pages[n] if 0 <= n < len(self.pages) else None
+
+    def reply_page(self, comment_id, cursor):
+        """回复分页：cursor 为 r-<偏移>，None 为第一页"""
+        full = self.replies.get(comment_id) or []
+        try:
+            offset = int(str(cursor).rsplit("-", 1)[1]) if cursor else 0
+        except (IndexError, ValueError):
+            offset = 0
+        end = offset + self.reply_page_size
+        return {"nodes": full[offset:end],
+                "pageInfo": {"hasNextPage": end < len(full), "endCursor": f"r-{end}"}}
+
+    def should_fail(self):
+        """按错误率 / 限流率抽样：返回要模拟的错误状态码（502 / 429），正常时返回 None"""
+        with self._lock:
+            self.graph_requests += 1
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self.graph_errors += 1
+                return 502
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.graph_errors += 1
+                return 429
+        return None
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    data = None  # 由 make_server 绑定 FixtureData
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/projects/") and path.rstrip("/").endswith("/comments"):
+            self._send(200, COMMENTS_HTML.encode("utf-8"), "text/html; charset=utf-8")
+        elif path.startswith("/static/"):
+            self._send(200, PLACEHOLDER_PNG, "image/png")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/graph":
+            self._send(404, b"not found", "text/plain")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, b"bad json", "text/plain")
+            return
+        op = payload[0] if isinstance(payload, list) and payload else payload
+        variables = (op.get("variables") if isinstance(op, dict) else None) or {}
+
+        data = self.data
+        if data.latency_ms:
+            time.sleep(data.latency_ms / 1000)
+        status = data.should_fail()
+        if status == 429:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if status:
+            self._send(status, b"upstream error", "text/plain")
+            return
+        if variables.get("commentId"):
+            comment_id = variables["commentId"]
+            replies = data.reply_page(comment_id, variables.get("nextCursor"))
+            body = json.dumps([{"data": {"comment": {"id": comment_id, "replies": replies}}}], ensure_ascii=False)
+            self._send(200, body.encode("utf-8"), "application/json")
+            return
+        page = data.page_for_cursor(variables.get("nextCursor"))
+        if page is None:
+            self._send(400, b"unknown cursor", "text/plain")
+            return
+        body = json.dumps([{"data": {"commentable": page}}], ensure_ascii=False).encode("utf-8")
+        self._send(200, body, "application/json")
+
+
+def make_server(data, host="127.0.0.1", port=0):
+    """创建绑定 data 的服务器（port=0 时由系统分配端口，见 server.server_address）"""
+    handler = type("BoundFixtureHandler", (FixtureHandler,), {"data": data})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_server(data, host="127.0.0.1", port=0):
+    """在后台线程启动服务器，返回 (server, base_url)；用完调用 server.shutdown()"""
+    server = make_server(data, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def project_url(base_url, creator="fixture", project="demo"):
+    return f"{base_url}/projects/{creator}/{project}/comments"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="本地 Kickstarter 替身（评论页 + /graph）")
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--pages", type=int, default=20, help="评论页数")
+    ap.add_argument("--page_size", type=int, default=25, help="每页顶层评论数")
+    ap.add_argument("--replies", type=int, default=3, help="每条评论的回复数")
+    ap.add_argument("--reply_depth", type=int, default=1, help="回复嵌套层数")
+    ap.add_argument("--latency_ms", type=int, default=0, help="/graph 响应延迟（毫秒）")
+    ap.add_argument("--error_rate", type=float, default=0.0, help="/graph 返回 502 的概率")
+    ap.add_argument("--rate_limit_rate", type=float, default=0.0, help="/graph 返回 429（Retry-After: 1）的概率")
+    ap.add_argument("--reply_page_size", type=int, default=0, help="每条评论随评论页返回的回复数（0 为不截断）")
+    args = ap.parse_args()
+
+    data = FixtureData(args.pages, args.page_size, args.replies, args.reply_depth,
+                       args.latency_ms, args.error_rate, reply_page_size=args.reply_page_size,
+                       rate_limit_rate=args.rate_limit_rate)
+    server = make_server(data, args.host, args.port)
+    print(f"fixture: {project_url(f'http://{args.host}:{server.server_address[1]}')} "
+          f"({len(data.pages)} pages, {data.total_comments} comments)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/synthetic.py
+"""
+生成合成的 commentable 页（结构与 Kickstarter /graph 返回的一致），供基准测试使用。
+"""
+import json
+import random
+
+
+def make_node(cid, created_at, rng, author_pool):
+    author_id = rng.randrange(author_pool)
+    return {
+        "id": f"Q29tbWVudC0{cid}",
+        "parentId": None,
+        "body": "Great project! " * rng.randint(1, 8),
+        "createdAt": created_at,
+        "removedPerGuidelines": False,
+        "authorBadges": ["backer"] if author_id % 3 else ["creator"],
+        "deleted": False,
+        "pinnedAt": None,
+        "authorCanceledPledge": False,
+        "authorBacking": None,
+        "author": {
+            "id": f"VXNlci0{author_id}",
+            "name": f"Backer {author_id}",
+            "url": f"https://www.kickstarter.com/profile/{author_id}",
+            "imageUrl": f"https://ksr-ugc.imgix.net/avatars/{author_id}.png",
+            "isBlocked": False,
+        },
+        "replies": {"nodes": [], "pageInfo": {"hasNextPage": False, "endCursor": None}},
+    }
+
+
+def iter_synthetic_pages(total_comments, page_size=25, replies_per_comment=3, reply_depth=1,
+                         author_pool=5000, seed=42):
+    """
+    产出合成页，直到累计 total_comments 条评论（含回复）。
+    每个顶层评论带 replies_per_comment 条回复，回复再嵌套到 reply_depth 层。
+    """
+    rng = random.Random(seed)
+    produced = 0
+    cid = 0
+    created_at = 1_700_000_000
+    page_no = 0
+    while produced < total_comments:
+        edges = []
+        for _ in range(page_size):
+            if produced >= total_comments:
+                break
+            cid += 1
+            created_at -= rng.randint(1, 600)
+            root = make_node(cid, created_at, rng, author_pool)
+            produced += 1
+            level = [root]
+            for _depth in range(reply_depth):
+                next_level = []
+                for parent in level:
+                    for _ in range(replies_per_comment):
+                        if produced >= total_comments:
+                            break
+                        cid += 1
+                        reply = make_node(cid, created_at + rng.randint(1, 3600), rng, author_pool)
+                        reply["parentId"] = parent["id"]
+                        parent["replies"]["nodes"].append(reply)
+                        next_level.append(reply)
+                        produced += 1
+                level = next_level
+            edges.append({"node": root})
+        page_no += 1
+        yield {
+            "id": "UHJvamVjdC0x",
+            "comments": {
+                "edges": edges,
+                "pageInfo": {"endCursor": f"cursor-{page_no}", "hasNextPage": produced < total_comments},
+            },
+        }
+
+
+def write_dump(path, total_comments, **kwargs):
+    """写出合成 dump：.jsonl 每页一行，.json 为列表格式"""
+    pages = iter_synthetic_pages(total_comments, **kwargs)
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for page in pages:
+                f.write(json.dumps(page, ensure_ascii=False) + "\n")
+        else:
+            json.dump(list(pages), f, ensure_ascii=False)
+    return path
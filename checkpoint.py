@@ -0,0 +1,73 @@
+# checkpoint.py
+"""
+每个项目一个 SQLite 断点文件：保存已接受页的 endCursor、页指纹、评论 key 以及最近一页的 pageInfo，
+中断后用 --resume 重启时跳过已抓取的页，并从最后的 endCursor 继续。
+"""
+import json
+import os
+import sqlite3
+
+
+class CrawlCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cursors (token TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS hashes (hash TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS comments (key TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._conn.commit()
+
+    def reset(self):
+        """开始一次全新的抓取：清空旧断点"""
+        with self._conn:
+            self._conn.execute("DELETE FROM cursors")
+            self._conn.execute("DELETE FROM hashes")
+            self._conn.execute("DELETE FROM comments")
+            self._conn.execute("DELETE FROM meta")
+
+    def load_seen(self):
+        """返回 (seen_endcursors, seen_hashes, seen_comments)，用于恢复 DedupIndex"""
+        cursors = {r[0] for r in self._conn.execute("SELECT token FROM cursors")}
+        hashes = {r[0] for r in self._conn.execute("SELECT hash FROM hashes")}
+        comments = {r[0] for r in self._conn.execute("SELECT key FROM comments")}
+        return cursors, hashes, comments
+
+    def record_page(self, token, page_hash, page_info=None, comment_keys=()):
+        """记录一页已处理（add_commentable 调用），每页提交一次"""
+        with self._conn:
+            if comment_keys:
+                self._conn.executemany("INSERT OR IGNORE INTO comments (key) VALUES (?)",
+                                       ((k,) for k in comment_keys))
+            if token:
+                self._conn.execute("INSERT OR IGNORE INTO cursors (token) VALUES (?)", (token,))
+            if page_hash:
+                self._conn.execute("INSERT OR IGNORE INTO hashes (hash) VALUES (?)", (page_hash,))
+            if page_info:
+                self._set("page_info", json.dumps(page_info, ensure_ascii=False))
+
+    def last_page_info(self):
+        """最近一次接受的页的 pageInfo（含 endCursor / hasNextPage），没有则返回 {}"""
+        value = self.get("page_info")
+        return json.loads(value) if value else {}
+
+    def get(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key, value):
+        with self._conn:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        self._conn.close()
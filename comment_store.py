@@ -0,0 +1,258 @@
+# comment_store.py
+"""
+本地评论库（SQLite）：把每次解析的评论按 comment_id upsert 到同一个库，跨抓取/跨项目查询。
+
+- 索引：comment_id（主键）、parent_id、author_id、created_at、project（及 project + created_at）
+- 写入：按块 executemany，每块一个事务；时间戳按 Unix 秒存储，查询时再转换为 UTC 时间
+
+    python comment_store.py ingest --db comments.db outputs/*.jsonl
+    python comment_store.py query --db comments.db --author_id VXNlci0x --since 2025-01-01 --output by_author.csv
+    python comment_store.py stats --db comments.db
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from exporters import open_exporter
+from page_store import iter_pages
+from parser import COLUMNS, TIMESTAMP_COLUMNS, iter_column_chunks
+
+BOOL_COLUMNS = ("removed", "deleted", "author_canceled_pledge", "author_blocked")
+JSON_COLUMNS = ("author_badges", "author_backing")
+STORE_COLUMNS = COLUMNS + ["project"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS comments (
+    comment_id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    body TEXT,
+    created_at INTEGER,
+    removed INTEGER,
+    author_badges TEXT,
+    deleted INTEGER,
+    pinned_at INTEGER,
+    author_canceled_pledge INTEGER,
+    author_backing TEXT,
+    author_id TEXT,
+    author_name TEXT,
+    author_url TEXT,
+    author_avatar TEXT,
+    author_blocked INTEGER,
+    project TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_parent ON comments (parent_id);
+CREATE INDEX IF NOT EXISTS comments_author ON comments (author_id);
+CREATE INDEX IF NOT EXISTS comments_created ON comments (created_at);
+CREATE INDEX IF NOT EXISTS comments_project ON comments (project, created_at);
+"""
+
+_UPSERT = (
+    f"INSERT INTO comments ({', '.join(STORE_COLUMNS)}) VALUES ({', '.join('?' * len(STORE_COLUMNS))}) "
+    f"ON CONFLICT(comment_id) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in STORE_COLUMNS if c not in ("comment_id", "project"))
+    + ", project = COALESCE(excluded.project, comments.project)"
+)
+
+
+def project_from_filename(path):
+    """从输出文件名推断项目标识：去掉 _replay 与 _YYYYmmdd_HHMMSS 后缀"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"(_replay)?(_\d{8}_\d{6})?$", "", stem) or stem
+
+
+def _to_json_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _seconds(value):
+    """解析列中的原始时间戳（Python 或 numpy 数值，紧凑模式下缺失为 NaN）-> int 秒，无效值为 None"""
+    if isinstance(value, (int, float, np.number)) and value == value:
+        return int(value)
+    return None
+
+
+def _to_epoch(value):
+    """'2025-01-01' / ISO 时间 / 数值 -> Unix 秒（无时区的按 UTC）"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int(ts.timestamp())
+
+
+class CommentStore:
+    def __init__(self, path="comments.db"):
+        self.path = path
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def upsert_columns(self, cols, project=None):
+        """
+        写入 parser.flatten_pages / iter_column_chunks 产出的一块列（时间戳为原始 Unix 秒，可为 numpy 数组）。
+        同一 comment_id 以最后写入的为准；没有 id 的行跳过。返回写入的行数。
+        """
+        n = len(cols["comment_id"])
+        columns = []
+        for name in COLUMNS:
+            values = cols[name]
+            if name in JSON_COLUMNS:
+                values = [_to_json_text(v) for v in values]
+            elif name in TIMESTAMP_COLUMNS:
+                values = [_seconds(v) for v in values]
+            columns.append(values)
+        columns.append([project] * n)
+        rows = [row for row in zip(*columns) if row[0] is not None]
+        with self._conn:
+            self._conn.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def upsert_frame(self, df, project=None, path=None):
+        """
+        写入 parser.build_dataframe 产出的 DataFrame（时间戳列为 UTC datetime），用于已解析过的结果，
+        不必再读一遍原始文件；project 缺省按 path 的文件名推断。返回写入的行数。
+        """
+        epoch = pd.Timestamp(0, tz="UTC")
+        cols = {}
+        for name in COLUMNS:
+            values = df[name]
+            if name in TIMESTAMP_COLUMNS:
+                cols[name] = ((values - epoch) // pd.Timedelta(seconds=1)).to_numpy()
+            else:
+                cols[name] = values.astype(object).where(values.notna(), None).tolist()
+        if project is None and path is not None:
+            project = project_from_filename(path)
+        return self.upsert_columns(cols, project)
+
+    def ingest_pages(self, pages, project=None, chunk_rows=50_000):
+        return sum(self.upsert_columns(cols, project) for cols in iter_column_chunks(pages, chunk_rows))
+
+    def ingest_file(self, path, project=None, chunk_rows=50_000):
+        """导入一个 JSON/JSONL 抓取结果；project 缺省按文件名推断"""
+        return self.ingest_pages(iter_pages(path), project or project_from_filename(path), chunk_rows)
+
+    def _where(self, project=None, author_id=None, author_name=None, parent_id=None, since=None, until=None):
+        clauses, params = [], []
+        for column, value in (("project", project), ("author_id", author_id), ("author_name", author_name),
+                              ("parent_id", parent_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(_to_epoch(since))
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(_to_epoch(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def iter_query(self, chunk_rows=100_000, limit=None, **filters):
+        """按条件分块产出 DataFrame（列与解析输出相同，另加 project），按 created_at 倒序"""
+        where, params = self._where(**filters)
+        sql = f"SELECT {', '.join(STORE_COLUMNS)} FROM comments{where} ORDER BY created_at DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        for df in pd.read_sql_query(sql, self._conn, params=params, chunksize=chunk_rows):
+            yield self._decode(df)
+
+    def query(self, limit=None, **filters):
+        chunks = list(self.iter_query(limit=limit, **filters))
+        if not chunks:
+            return self._decode(pd.DataFrame(columns=STORE_COLUMNS))
+        return pd.concat(chunks, ignore_index=True)
+
+    @staticmethod
+    def _decode(df):
+        for name in TIMESTAMP_COLUMNS:
+            df[name] = pd.to_datetime(pd.to_numeric(df[name], errors="coerce"), unit="s", utc=True)
+        for name in BOOL_COLUMNS:
+            df[name] = df[name].map(lambda v: None if v is None or pd.isna(v) else bool(v)).astype(object)
+        for name in JSON_COLUMNS:
+            df[name] = df[name].map(lambda v: json.loads(v) if isinstance(v, str) and v[:1] in "[{" else v)
+        return df
+
+    def export(self, output_file, fmt=None, chunk_rows=100_000, **filters):
+        """按条件导出到 xlsx / csv / parquet / feather，返回行数"""
+        exporter = open_exporter(output_file, fmt)
+        try:
+            for df in self.iter_query(chunk_rows=chunk_rows, **filters):
+                exporter.write(df)
+            if exporter.rows == 0:
+                exporter.write(self._decode(pd.DataFrame(columns=STORE_COLUMNS)))
+        finally:
+            exporter.close()
+        return exporter.rows
+
+    def stats(self):
+        total = self._conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0]
+        projects = self._conn.execute(
+            "SELECT project, COUNT(*), MIN(created_at), MAX(created_at) FROM comments GROUP BY project").fetchall()
+        return total, projects
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="本地评论库：导入抓取结果，跨项目查询与导出")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="导入 JSON/JSONL 抓取结果")
+    p_ingest.add_argument("files", nargs="+")
+    p_ingest.add_argument("--project", type=str, help="项目标识（默认按文件名推断）")
+
+    p_query = sub.add_parser("query", help="查询并打印或导出")
+    p_query.add_argument("--project", type=str)
+    p_query.add_argument("--author_id", type=str)
+    p_query.add_argument("--author_name", type=str)
+    p_query.add_argument("--parent_id", type=str, help="某条评论的全部回复")
+    p_query.add_argument("--since", type=str, help="createdAt >= 该时间（如 2025-01-01）")
+    p_query.add_argument("--until", type=str, help="createdAt < 该时间")
+    p_query.add_argument("--limit", type=int)
+    p_query.add_argument("--output", type=str, help="导出文件（.xlsx/.csv/.parquet/.feather），不指定则打印")
+
+    sub.add_parser("stats", help="各项目评论数与时间范围")
+
+    for p in (p_ingest, p_query, sub.choices["stats"]):
+        p.add_argument("--db", type=str, default="comments.db", help="评论库文件")
+    args = ap.parse_args()
+
+    store = CommentStore(args.db)
+    try:
+        if args.command == "ingest":
+            for path in args.files:
+                print(f"[导入] {path}: {store.ingest_file(path, args.project)} 条")
+        elif args.command == "query":
+            filters = dict(project=args.project, author_id=args.author_id, author_name=args.author_name,
+                           parent_id=args.parent_id, since=args.since, until=args.until, limit=args.limit)
+            if args.output:
+                print(f"[导出] {store.export(args.output, **filters)} 条 -> {args.output}")
+            else:
+                df = store.query(**filters)
+                with pd.option_context("display.max_rows", 50, "display.width", 200):
+                    print(df[["comment_id", "project", "created_at", "author_name", "body"]])
+        else:
+            total, projects = store.stats()
+            print(f"共 {total} 条评论")
+            for project, count, first, last in projects:
+                span = [pd.to_datetime(t, unit="s", utc=True) if t is not None else None for t in (first, last)]
+                print(f"  {project}: {count} 条（{span[0]} ~ {span[1]}）")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,386 @@
 # crawler.py
 import asyncio
 import json
-import hashlib
+import logging
+import copy
 import random
 import time
 import os
+import re
+from urllib.parse import urlparse
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from playwright_stealth import Stealth
 import yaml
 
-def _commentable_hash(obj):
-    """对 commentable 对象生成稳定哈希（JSON 排序）"""
-    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+from checkpoint import CrawlCheckpoint
+from instrumentation import Timings, log_event, setup_logging
+from dedup import DedupIndex, comment_key, iter_edge_nodes, page_fingerprint
+from export_pipeline import ExportPipeline
+from incremental import IncrementalState, load_previous_comments
+from page_store import is_jsonl, open_page_writer, read_last_page
+from replies import MORE_REPLIES_SELECTOR, ReplyExpander, extract_replies, replies_page
+from resilience import (BREAKER_KINDS, RETRYABLE_KINDS, CircuitBreaker, CircuitOpenError, CrawlStats, FetchGuard,
+                        HostRateLimiter, RetryPolicy, classify_status, parse_retry_after)
+from session_pool import SessionPool, is_challenge_page
 
-def add_commentable(commentable, graphql_pages, seen_endcursors, seen_hashes, source="unknown"):
+logger = logging.getLogger("crawler")
+
+def add_commentable(commentable, graphql_pages, index, source="unknown", checkpoint=None, timings=None):
     """
-    统一去重并保存 commentable（仅由 on_response 调用）。
+    统一去重并保存 commentable（由 on_response / replay 调用）。
+    graphql_pages 可以是 list，也可以是 page_store 的写入器（append 即落盘）。
+    index 为 DedupIndex：endCursor 新出现时直接按评论 key 过滤，endCursor 已见或缺失时
+    先用页指纹（只含评论 id/updatedAt）判断整页是否重复；已见过的评论（按 id）会从页中剔除。
+    checkpoint 不为 None 时，每个处理过的页在写入（flush）之后同步写入断点（cursor、指纹、评论 key、pageInfo）。
+    timings 不为 None 时分别记录 dedup 与 write 阶段耗时。
     返回 True 表示新加入，False 表示重复跳过。
     """
+    timings = timings or Timings()
     try:
-        page_info = (commentable.get("comments", {}) or {}).get("pageInfo", {}) or {}
-        end_cursor = page_info.get("endCursor")
-        print(f"[{source}] raw endCursor repr: {repr(end_cursor)}")
-
-        token = end_cursor.strip() if isinstance(end_cursor, str) and end_cursor.strip() else None
-        h = _commentable_hash(commentable)
-
-        if token:
-            if token in seen_endcursors:
-                print(f"[{source}] token 已见，跳过: {repr(token)}")
-                if h not in seen_hashes:
-                    graphql_pages.append(commentable)
-                    seen_hashes.add(h)
-                    print(f"[{source}] token 已见但 hash 新，补存。hash={h}")
-                    return True
-                return False
-            graphql_pages.append(commentable)
-            seen_endcursors.add(token)
-            seen_hashes.add(h)
-            print(f"[{source}] 新 page 保存：token={repr(token)} hash={h}")
-            return True
-        else:
-            if h in seen_hashes:
-                print(f"[{source}] 无 token，hash 已见，跳过。hash={h}")
+        with timings.time("dedup"):
+            comments = commentable.get("comments", {}) or {}
+            page_info = comments.get("pageInfo", {}) or {}
+            end_cursor = page_info.get("endCursor")
+            token = end_cursor.strip() if isinstance(end_cursor, str) and end_cursor.strip() else None
+            h = page_fingerprint(commentable)
+
+            if not token or token in index.seen_endcursors:
+                if h in index.seen_hashes:
+                    log_event(logger, "page_duplicate", "整页重复，跳过", logging.DEBUG,
+                              source=source, has_token=bool(token), hash=h[:12])
+                    timings.incr("pages_duplicate")
+                    return False
+
+            edges = comments.get("edges") or []
+            new_edges, new_keys = index.filter_new_edges(commentable)
+
+            if edges and not new_edges:
+                index.mark(token, h, new_keys)
+                if checkpoint is not None:
+                    checkpoint.record_page(token, h, page_info, new_keys)
+                log_event(logger, "page_all_seen", "本页评论全部已见，跳过", logging.DEBUG, source=source)
+                timings.incr("pages_duplicate")
                 return False
+            if len(new_edges) != len(edges) or any(a is not b for a, b in zip(new_edges, edges)):
+                # 只保存未见过的评论（与相邻页重叠的部分被剔除）
+                commentable = {**commentable, "comments": {**comments, "edges": new_edges}}
+                log_event(logger, "page_trimmed", "剔除重复评论", logging.DEBUG,
+                          source=source, kept=len(new_edges), edges=len(edges))
+        with timings.time("write"):
             graphql_pages.append(commentable)
-            seen_hashes.add(h)
-            print(f"[{source}] 无 token，按 hash 保存。hash={h}")
-            return True
+        # 先落盘再记断点：两者之间崩溃时，续抓最多重抓这一页（被评论 key 去重），不会把没写进文件的页记为已见
+        index.mark(token, h, new_keys)
+        if checkpoint is not None:
+            checkpoint.record_page(token, h, page_info, new_keys)
+        timings.incr("pages_saved")
+        log_event(logger, "page_saved", "新 page 保存", logging.DEBUG,
+                  source=source, edges=len(new_edges), hash=h[:12])
+        return True
     except Exception as e:
-        print(f"[{source}] add_commentable 异常: {repr(e)}")
+        log_event(logger, "add_commentable_error", "add_commentable 异常", logging.ERROR,
+                  source=source, error=repr(e))
         return False
 
+async def wait_writable(graphql_pages):
+    """流水线导出（export_pipeline）时等待导出队列腾出空间，在事件循环上让出而不阻塞；普通写入器无需等待"""
+    wait = getattr(graphql_pages, "wait_writable", None)
+    if wait is not None:
+        await wait()
+
+
+def reconcile_last_page(output_file, index, checkpoint):
+    """
+    续抓时核对输出文件的最后一页：add_commentable 先写页再记断点，两者之间崩溃时最后一页已在文件里
+    但不在断点中。此时补记它的 cursor / 评论 key / pageInfo，避免续抓时重复写出。
+    返回补记的 pageInfo（无需补记时返回 None）。
+    """
+    if not is_jsonl(output_file) or not os.path.exists(output_file):
+        return None
+    last = read_last_page(output_file)
+    if not last:
+        return None
+    comments = last.get("comments") or {}
+    keys = [comment_key(n) for edge in comments.get("edges") or [] for n in iter_edge_nodes(edge)]
+    if not keys or all(k in index.seen_comments for k in keys):
+        return None
+    page_info = comments.get("pageInfo") or {}
+    end_cursor = page_info.get("endCursor")
+    token = end_cursor.strip() if isinstance(end_cursor, str) and end_cursor.strip() else None
+    h = page_fingerprint(last)
+    index.mark(token, h, keys)
+    checkpoint.record_page(token, h, page_info, keys)
+    return page_info
+
+
+async def _read_json(response):
+    """读取响应原始字节并解码 JSON，返回 (raw, body)；录制缓存需要原始字节，避免再取一次 body"""
+    raw = await response.body()
+    return raw, json.loads(raw)
+
+def _extract_commentable(body):
+    """从 /graph 响应 body（列表）中取出 data.commentable，不符合预期结构时返回 None"""
+    if not isinstance(body, (list, tuple)) or len(body) == 0:
+        return None
+    first_item = body[0]
+    if not isinstance(first_item, dict):
+        return None
+    return (first_item.get("data") or {}).get("commentable")
+
+# GraphQL 查询中可能承载分页游标的变量名（按优先级）
+_CURSOR_VARIABLES = ("nextCursor", "cursor", "after")
+# 重放请求时不应沿用的请求头（由 Playwright 或 context 的 cookie 自动处理）
+_REPLAY_SKIP_HEADERS = {"host", "content-length", "cookie", "connection", "accept-encoding"}
+
+def _with_cursor(post_body, cursor):
+    """复制录制到的 GraphQL 请求体，并把分页游标替换为 cursor"""
+    payload = copy.deepcopy(post_body)
+    operations = payload if isinstance(payload, list) else [payload]
+    for op in operations:
+        if not isinstance(op, dict):
+            continue
+        variables = op.setdefault("variables", {}) or {}
+        key = next((k for k in _CURSOR_VARIABLES if k in variables), _CURSOR_VARIABLES[0])
+        variables[key] = cursor
+        op["variables"] = variables
+    return payload
+
+async def _replay_request(context, template, cursor, timeout_ms, guard=None, timings=None, page=None):
+    """
+    发出一次重放请求。guard 不为 None 时先按域名限速，并对限流 / 5xx / 网络错误退避后原地重试
+    （连续失败达到阈值时抛出 CircuitOpenError）；其他错误（如 challenge）原样返回，由调用方回退到点击模式。
+    """
+    timings = timings or Timings()
+    while True:
+        if guard is not None:
+            await guard.acquire()
+        try:
+            with timings.time("replay_request"):
+                resp = await context.request.post(
+                    template["url"],
+                    data=json.dumps(_with_cursor(template["post_body"], cursor)),
+                    headers=template["headers"],
+                    timeout=timeout_ms,
+                )
+        except Exception as e:
+            if guard is None:
+                raise
+            await guard.failure("network", page=page, error=repr(e))
+            continue
+        kind = None if resp.ok else classify_status(resp.status, resp.headers)
+        if guard is None or kind not in RETRYABLE_KINDS:
+            return resp
+        await guard.failure(kind, retry_after=parse_retry_after(resp.headers.get("retry-after")),
+                            page=page, status=resp.status)
+
+async def replay_comments(
+    context,
+    template,
+    page_info,
+    graphql_pages,
+    index,
+    max_pages=30,
+    timeout_ms=15000,
+    checkpoint=None,
+    incremental=None,
+    pacer=None,
+    timings=None,
+    response_cache=None,
+    project=None,
+    replies=None,
+    guard=None,
+):
+    """
+    直接重放录制到的评论 GraphQL 请求翻页（不点击 "Load more"）。
+    template 为 on_response 录制的 {"url", "post_body", "headers"}，page_info 为起始页的 pageInfo
+    （通常是最近捕获的一页；--resume 时是断点中保存的最后一页）。
+    incremental 不为 None 时，遇到全部是已知评论的页即停止（视为已完成）。
+    response_cache 不为 None 时，原始响应以 project 为键写入缓存。
+    replies 为 ReplyExpander 时记录每页中回复被截断的评论。
+    guard 为 resilience.FetchGuard 时按域名限速，限流 / 5xx / 网络错误退避重试，熔断时抛出 CircuitOpenError。
+    返回 True 表示已翻到最后一页（hasNextPage == False），False 表示需要回退到点击模式。
+    """
+    timings = timings or Timings()
+    for n in range(1, max_pages + 1):
+        if not page_info.get("hasNextPage"):
+            log_event(logger, "replay_done", "hasNextPage == False -> 到达最后一页", pages=n - 1)
+            return True
+        cursor = page_info.get("endCursor")
+        if not cursor:
+            log_event(logger, "replay_no_cursor", "没有 endCursor，无法继续重放", logging.WARNING)
+            return False
+
+        if pacer is not None:
+            await pacer.pause()
+        started = time.monotonic()
+        resp = await _replay_request(context, template, cursor, timeout_ms, guard, timings, page=n)
+        if pacer is not None:
+            pacer.observe(time.monotonic() - started)
+        if not resp.ok:
+            log_event(logger, "replay_http_error", "/graph 返回错误，回退到点击模式", logging.WARNING,
+                      page=n, status=resp.status)
+            return False
+        try:
+            with timings.time("json_decode"):
+                raw, body = await _read_json(resp)
+        except Exception:
+            log_event(logger, "replay_bad_json", "/graph 响应不是 JSON，回退到点击模式", logging.WARNING, page=n)
+            return False
+        commentable = _extract_commentable(body)
+        if not commentable:
+            log_event(logger, "replay_no_commentable", "响应无 commentable 字段，回退到点击模式", logging.WARNING, page=n)
+            return False
+        if response_cache is not None:
+            response_cache.put(project, template["url"], raw)
+        if guard is not None:
+            guard.success()
+
+        if replies is not None:
+            replies.observe(commentable)
+        added = add_commentable(commentable, graphql_pages, index,
+                                source=f"replay#{n}", checkpoint=checkpoint, timings=timings)
+        await wait_writable(graphql_pages)
+        if added and incremental is not None:
+            incremental.observe(commentable)
+            if incremental.caught_up:
+                log_event(logger, "incremental_caught_up", "本页评论全部已知，停止翻页", page=n)
+                return True
+        page_info = (commentable.get("comments") or {}).get("pageInfo") or {}
+
+    log_event(logger, "replay_max_pages", "已达到最大翻页数", max_pages=max_pages)
+    return True
+
+# 精简页面模式：默认拦截的资源类型与第三方统计/广告域名（子串匹配）
+DEFAULT_BLOCK_RESOURCE_TYPES = ("image", "media", "font")
+DEFAULT_BLOCK_URL_PATTERNS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net",
+    "connect.facebook.com", "hotjar.com", "segment.io", "segment.com", "bat.bing.com",
+    "snap.licdn.com", "ads.linkedin.com", "analytics.tiktok.com", "nr-data.net", "sentry.io",
+)
+# 永远放行（Cloudflare challenge 相关）；/graph 始终放行
+DEFAULT_ALLOW_URL_PATTERNS = ("challenges.cloudflare.com", "/cdn-cgi/")
+
+async def install_resource_blocking(page, block_resource_types=None, block_url_patterns=None, allow_url_patterns=None):
+    """
+    用 page.route 拦截不需要的请求（图片/媒体/字体与统计脚本），放行文档、脚本与 /graph。
+    同时统计实际下载的字节数。返回统计 dict（crawl 过程中持续更新）。
+    """
+    block_types = set(DEFAULT_BLOCK_RESOURCE_TYPES if block_resource_types is None else block_resource_types)
+    deny = tuple(DEFAULT_BLOCK_URL_PATTERNS if block_url_patterns is None else block_url_patterns)
+    allow = tuple(DEFAULT_ALLOW_URL_PATTERNS if allow_url_patterns is None else allow_url_patterns)
+    stats = {"blocked": {}, "blocked_total": 0, "requests": 0, "bytes": 0}
+
+    async def handle(route):
+        request = route.request
+        url = request.url
+        if "/graph" in url or any(p in url for p in allow):
+            await route.continue_()
+            return
+        if request.resource_type in block_types or any(p in url for p in deny):
+            key = request.resource_type if request.resource_type in block_types else "tracker"
+            stats["blocked"][key] = stats["blocked"].get(key, 0) + 1
+            stats["blocked_total"] += 1
+            await route.abort()
+            return
+        await route.continue_()
+
+    async def on_request_finished(request):
+        try:
+            sizes = await request.sizes()
+            stats["requests"] += 1
+            stats["bytes"] += sizes.get("responseBodySize", 0) + sizes.get("responseHeadersSize", 0)
+        except Exception:
+            pass
+
+    await page.route("**/*", handle)
+    page.on("requestfinished", on_request_finished)
+    return stats
+
+LOAD_MORE_SELECTOR = 'button:has-text("Load more")'
+
+class AdaptivePacer:
+    """
+    翻页节奏控制：正常时不额外等待；响应明显变慢或出错时，按观测到的服务器延迟指数退避。
+    同时累计空等时间与延迟样本，供结束时输出统计。
+    """
+
+    def __init__(self, min_delay=0.0, max_delay=10.0, alpha=0.3):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.alpha = alpha
+        self.latency_ema = None
+        self.last_latency = None
+        self.errors = 0
+        self.samples = 0
+        self.latency_total = 0.0
+        self.idle = 0.0
+
+    def observe(self, latency):
+        """记录一次成功请求的延迟（秒），并清零连续错误计数"""
+        self.last_latency = latency
+        self.samples += 1
+        self.latency_total += latency
+        if self.latency_ema is None:
+            self.latency_ema = latency
+        else:
+            self.latency_ema = self.alpha * latency + (1 - self.alpha) * self.latency_ema
+        self.errors = 0
+
+    def error(self):
+        self.errors += 1
+
+    def delay(self):
+        base = self.latency_ema or 1.0
+        if self.errors:
+            return min(self.max_delay, base * (2 ** self.errors))
+        if self.last_latency is not None and self.last_latency > 2 * base:
+            # 服务器变慢：等待与本次延迟相当的时间再继续
+            return min(self.max_delay, self.last_latency)
+        return self.min_delay
+
+    async def pause(self):
+        d = self.delay()
+        if d > 0:
+            await asyncio.sleep(d)
+            self.idle += d
+        return d
+
+async def wait_until_ready(page, graph_seen, timeout_ms, need_graph=False):
+    """
+    等待页面就绪：Load more 按钮可见或首个评论 /graph 响应到达（先到者为准），最多 timeout_ms。
+    need_graph=True（direct_graphql 需要录制请求）时只等 /graph。返回实际等待秒数。
+    """
+    started = time.monotonic()
+    deadline = started + timeout_ms / 1000
+    graph_waiter = asyncio.ensure_future(graph_seen.wait())
+    button_waiter = None
+    if not need_graph:
+        button_waiter = asyncio.ensure_future(
+            page.wait_for_selector(LOAD_MORE_SELECTOR, state="visible", timeout=timeout_ms))
+    pending = {w for w in (graph_waiter, button_waiter) if w is not None}
+    button_ready = False
+    while pending and not graph_seen.is_set() and not button_ready:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        # wait_for_selector 出错（例如超时）不算就绪：继续等 /graph 直到 timeout_ms
+        button_ready = button_waiter in done and button_waiter.exception() is None
+    for task in pending:
+        task.cancel()
+    if button_waiter is not None and button_waiter.done() and not button_waiter.cancelled():
+        button_waiter.exception()   # 取出异常，避免 "exception was never retrieved"
+    waited = time.monotonic() - started
+    if graph_seen.is_set():
+        log_event(logger, "page_ready", "Initial /graph response observed", trigger="graph", waited=round(waited, 3))
+    elif button_ready:
+        log_event(logger, "page_ready", "Load more button appeared", trigger="button", waited=round(waited, 3))
+    else:
+        log_event(logger, "page_not_ready", "Page not ready within timeout; continuing", logging.WARNING,
+                  timeout_ms=timeout_ms)
+    return waited
+
 async def human_like_scroll(page, scroll_min=50, scroll_max=150, sleep_min=0.1, sleep_max=0.4):
     """模拟人类滚动（小幅度抖动）"""
     try:
@@ -64,167 +393,717 @@ async def human_like_scroll(page, scroll_min=50, scroll_max=150, sleep_min=0.1,
         await page.evaluate(f"window.scrollBy(0, {scroll_y})")
         await asyncio.sleep(random.uniform(sleep_min, sleep_max))
 
-async def run_crawler(
+def project_slug(url):
+    """从评论页 URL 提取项目标识（creator_project），用于批量模式的输出文件名"""
+    parts = [p for p in urlparse(url).path.split("/") if p]
+    if "projects" in parts:
+        parts = parts[parts.index("projects") + 1:]
+    parts = [p for p in parts if p != "comments"]
+    slug = "_".join(parts[:2]) or urlparse(url).netloc or "project"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", slug)
+
+async def crawl_page(
+    page,
     url,
-    output_file="kickstarter_comments.json",
+    output_file="kickstarter_comments.jsonl",
     max_clicks=30,
     click_timeout_ms=15000,
     initial_wait_ms=6000,
-    headless=True,
-    window_width=1400,
-    window_height=900,
     scroll_min=50,
     scroll_max=150,
     scroll_sleep_min=0.1,
     scroll_sleep_max=0.4,
+    direct_graphql=False,
+    checkpoint_file=None,
+    resume=False,
+    incremental_from=None,
+    delta_file=None,
+    block_resources=True,
+    block_resource_types=None,
+    block_url_patterns=None,
+    allow_url_patterns=None,
+    timings=None,
+    response_cache=None,
+    session=None,
+    expand_replies=False,
+    reply_concurrency=4,
+    reply_max_pages=50,
+    rate_limiter=None,
+    rate_per_host=0.0,
+    retry_base_delay=1.0,
+    retry_max_delay=60.0,
+    circuit_failures=5,
+    circuit_cooldown_seconds=300,
+    stats=None,
+    export=None,
 ):
     """
-    运行爬虫，参数全部可传入（run.py 将调用此函数）。
-    返回保存的 output_file 路径。
+    在一个已打开的 page 上抓取单个项目的评论（不负责启动/关闭浏览器）。
+    run_crawler 与 run_batch 共用此函数。返回保存的 output_file 路径。
+    direct_graphql=True 时录制首个评论 GraphQL 请求并直接重放翻页，失败再回退到点击模式。
+    checkpoint_file 指定断点文件；resume=True 时沿用上次的输出文件与去重集合，从最后的 endCursor 继续
+    （点击模式无法跳页，从第一页重新点击，断点中已有的页不计入 max_clicks）。
+    incremental_from 为上一次输出文件（列表）时进入增量模式：一页评论全部已知即停止翻页，
+    新增/变化的评论写入 delta_file。
+    block_resources=True 时拦截图片/媒体/字体与统计请求（名单为 None 时使用默认值），结束时报告流量。
+    timings 为 instrumentation.Timings，用于累计各阶段耗时（批量模式下多个项目共用）。
+    response_cache 为 response_cache.ResponseCache 时，每个评论 /graph 原始响应都写入缓存，供无浏览器重放。
+    session 为 session_pool.Session 时，goto 后检测 challenge 页并记录到 session.challenged。
+    expand_replies=True 时，翻页结束后用录制到的回复请求并发（reply_concurrency）补全被截断的回复线程，
+    每个线程最多 reply_max_pages 页。
+    /graph 请求按域名限速（rate_limiter 为多个项目共用的 resilience.HostRateLimiter，None 时按 rate_per_host 新建），
+    失败（限流 / challenge / 5xx / 超时）按 retry_base_delay ~ retry_max_delay 指数退避重试，不消耗 max_clicks；
+    连续 circuit_failures 次失败（challenge 2 次）时抛出 CircuitOpenError，由调用方暂停
+    circuit_cooldown_seconds 秒后重新排队（有断点时续抓）。stats 为 resilience.CrawlStats（批量模式下共用）。
+    export 为 export_pipeline.ExportPipeline 时边抓边解析导出（结果见 export.output_file / export.rows）。
     """
-    graphql_pages = []      # 保存被捕获的 commentable 对象（每页）
-    seen_endcursors = set() # 用 endCursor 去重
-    seen_hashes = set()     # 回退去重
+    timings = timings or Timings()
+    project = project_slug(url)
 
-    async with Stealth().use_async(async_playwright()) as pw:
-        browser = await pw.chromium.launch(
-            headless=headless,
-            args=[f"--window-size={window_width},{window_height}"]
-        )
-        context = await browser.new_context()
-        page = await context.new_page()
+    def emit(event, msg=None, level=logging.INFO, **fields):
+        log_event(logger, event, msg, level, project=project, **fields)
 
-        # 全局响应监听器
-        async def on_response(response):
+    index = DedupIndex()    # endCursor / 页指纹 / 评论 key 去重
+    checkpoint = CrawlCheckpoint(checkpoint_file) if checkpoint_file else None
+    resume_page_info = {}
+    if checkpoint is not None:
+        previous_output = checkpoint.get("output_file")
+        if resume and previous_output and os.path.exists(previous_output):
+            output_file = previous_output
+            index = DedupIndex(*checkpoint.load_seen())
+            resume_page_info = checkpoint.last_page_info()
+            emit("resume", "从断点继续", pages=len(index.seen_hashes), comments=len(index.seen_comments),
+                 output_file=output_file, has_cursor=bool(resume_page_info.get("endCursor")))
+        else:
+            if resume:
+                emit("resume_unavailable", "没有可用的断点，从头开始抓取", logging.WARNING)
+            resume = False
+            checkpoint.reset()
+            checkpoint.set("output_file", output_file)
+            checkpoint.set("url", url)
+    graphql_pages = open_page_writer(output_file, append=resume)  # 每页 append 即写盘（.jsonl 流式）
+    if resume and checkpoint is not None:
+        reconciled = reconcile_last_page(output_file, index, checkpoint)
+        if reconciled is not None:
+            resume_page_info = reconciled
+            emit("resume_reconciled", "最后一页已写入但未记入断点，已补记", logging.WARNING,
+                 has_cursor=bool(reconciled.get("endCursor")))
+    # 点击模式续抓时从第一页重新点击：断点中已有的页不消耗 max_clicks
+    saved_cursors = set(index.seen_endcursors) if resume else set()
+    if export is not None:
+        graphql_pages = export.wrap(graphql_pages, output_file, append=resume, project=project, timings=timings)
+    incremental = None
+    if incremental_from:
+        known, newest = load_previous_comments(incremental_from)
+        incremental = IncrementalState(known, newest, delta_file)
+        emit("incremental_loaded", "已加载已知评论", known=len(known), newest_created_at=newest, delta_file=delta_file)
+    graph_seen = asyncio.Event()  # 首个评论 /graph 响应到达
+    pacer = AdaptivePacer()
+    project_stats = CrawlStats()
+    guard = FetchGuard(
+        project,
+        bucket=(rate_limiter or HostRateLimiter(rate_per_host)).bucket(url),
+        policy=RetryPolicy(retry_base_delay, retry_max_delay),
+        breaker=CircuitBreaker(circuit_failures, cooldown_seconds=circuit_cooldown_seconds),
+        stats=project_stats,
+        timings=timings,
+    )
+    graph_template = {}     # 录制到的评论 GraphQL 请求（url/post_body/headers）
+    last_page_info = {}     # 最近一次捕获到的 pageInfo
+    graph_ok = {"at": None}  # 最近一次成功解析出评论页的 /graph 响应时间（monotonic）
+    replies = ReplyExpander(reply_concurrency, reply_max_pages, click_timeout_ms) if expand_replies else None
+    reply_template_seen = asyncio.Event()
+    decoded_bodies = {}     # response -> 解码任务（raw, body）；on_response 与点击路径共用同一次 JSON 解码
+
+    def decode_body(response):
+        task = decoded_bodies.get(response)
+        if task is None:
+            task = asyncio.ensure_future(_read_json(response))
+            decoded_bodies[response] = task
+            if len(decoded_bodies) > 32:
+                decoded_bodies.pop(next(iter(decoded_bodies)))
+        return task
+
+    # 全局响应监听器
+    async def on_response(response):
+        try:
+            if "/graph" not in response.url or response.status != 200:
+                return
             try:
-                if "/graph" not in response.url or response.status != 200:
-                    return
+                with timings.time("json_decode"):
+                    raw, body = await decode_body(response)
+            except Exception:
+                return
+            commentable = _extract_commentable(body)
+            if not commentable:
+                extracted = extract_replies(body) if replies is not None else None
+                if extracted:
+                    await on_replies_response(response, raw, *extracted)
+                return
+            graph_seen.set()
+            graph_ok["at"] = time.monotonic()
+            if response_cache is not None:
+                response_cache.put(project, response.url, raw)
+            if replies is not None:
+                replies.observe(commentable)
+            if direct_graphql and not graph_template:
+                request = response.request
+                post_body = request.post_data_json
+                if post_body:
+                    headers = await request.all_headers()
+                    graph_template.update(
+                        url=response.url,
+                        post_body=post_body,
+                        headers={k: v for k, v in headers.items()
+                                 if not k.startswith(":") and k.lower() not in _REPLAY_SKIP_HEADERS},
+                    )
+                    emit("graphql_template_recorded", "已录制评论 GraphQL 请求模板")
+            page_info = (commentable.get("comments") or {}).get("pageInfo") or {}
+            if page_info:
+                last_page_info.clear()
+                last_page_info.update(page_info)
+            added = add_commentable(commentable, graphql_pages, index,
+                                    source="on_response", checkpoint=checkpoint, timings=timings)
+            if added and incremental is not None:
+                incremental.observe(commentable)
+            await wait_writable(graphql_pages)
+        except Exception as e:
+            emit("on_response_error", "on_response 捕获异常", logging.ERROR, error=repr(e))
+
+    async def add_reply_page(commentable):
+        added = add_commentable(commentable, graphql_pages, index,
+                                source="replies", checkpoint=checkpoint, timings=timings)
+        if added and incremental is not None:
+            incremental.observe(commentable)
+        await wait_writable(graphql_pages)
+
+    # 页面自己发出的回复请求（点击 "View more replies"）：录制模板并保存这一页回复
+    async def on_replies_response(response, raw, comment_id, reply_list):
+        if not replies.template:
+            request = response.request
+            headers = await request.all_headers()
+            replies.record_template(
+                response.url,
+                request.post_data_json,
+                {k: v for k, v in headers.items() if not k.startswith(":") and k.lower() not in _REPLAY_SKIP_HEADERS},
+                comment_id,
+                reply_list,
+            )
+            reply_template_seen.set()
+        if response_cache is not None:
+            response_cache.put(project, response.url, raw)
+        replies.observe_replies(comment_id, reply_list)
+        await add_reply_page(replies_page(replies.commentable_id, comment_id, reply_list))
+
+    page.on("response", on_response)
+    net_stats = None
+    if block_resources:
+        net_stats = await install_resource_blocking(
+            page, block_resource_types, block_url_patterns, allow_url_patterns)
+
+    try:
+        # 打开页面并等待初始化（Cloudflare JS challenge）：按钮或首个 /graph 出现即继续，
+        # 最长等待 initial_wait_ms + 5s（与原先的固定等待 + /graph 探测相同）
+        emit("goto", "goto", url=url)
+        with timings.time("goto"):
+            goto_response = await page.goto(url)
+        if session is not None:
+            session.challenged = await is_challenge_page(page, goto_response)
+            emit("session", "会话状态", reused=session.reused, challenged=session.challenged)
+        with timings.time("challenge_wait"):
+            ready_wait = await wait_until_ready(page, graph_seen, initial_wait_ms + 5000, need_graph=direct_graphql)
+
+        finished = False
+        if direct_graphql:
+            if graph_template and last_page_info:
+                # --resume 时直接从断点保存的最后一页继续，跳过已抓取的页
+                start_page_info = resume_page_info if resume_page_info.get("endCursor") else dict(last_page_info)
                 try:
-                    body = await response.json()
-                except Exception:
-                    return
-                if not isinstance(body, (list, tuple)) or len(body) == 0:
-                    return
-                first_item = body[0]
-                commentable = first_item.get("data", {}).get("commentable")
-                if not commentable:
-                    return
-                add_commentable(commentable, graphql_pages, seen_endcursors, seen_hashes, source="on_response")
-            except Exception as e:
-                print("on_response 捕获异常:", repr(e))
+                    finished = await replay_comments(
+                        page.context,
+                        graph_template,
+                        start_page_info,
+                        graphql_pages,
+                        index,
+                        max_pages=max_clicks,
+                        timeout_ms=click_timeout_ms,
+                        checkpoint=checkpoint,
+                        incremental=incremental,
+                        pacer=pacer,
+                        timings=timings,
+                        response_cache=response_cache,
+                        project=project,
+                        replies=replies,
+                        guard=guard,
+                    )
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    emit("replay_error", "重放异常，回退到点击模式", logging.WARNING, error=repr(e))
+            else:
+                emit("replay_unavailable", "未录制到评论 GraphQL 请求，回退到点击模式", logging.WARNING)
 
-        page.on("response", on_response)
+        # 重放已翻到最后一页时跳过点击循环。
+        # clicks 只统计拿到评论页的点击：超时 / 限流 / challenge / 5xx 由 guard 退避后重试，不消耗 max_clicks，
+        # 连续失败过多时 guard 抛出 CircuitOpenError（暂停项目、稍后重新排队）
+        click_budget = 0 if finished else max_clicks
+        clicks = 0
+        attempt = 0
 
-        # 打开页面并等待初始化（Cloudflare JS challenge)
-        print("goto:", url)
-        await page.goto(url)
-        await asyncio.sleep(initial_wait_ms / 1000)  # 毫秒->秒
+        async def click_failed(kind, event, msg, retry_after=None, **fields):
+            nonlocal clicks
+            if kind not in BREAKER_KINDS:
+                clicks += 1  # 结构不符的响应重试也拿不到评论页，仍消耗一次点击（不计入熔断）
+            emit(event, msg, logging.WARNING, kind=kind, attempt=attempt, clicks=clicks, **fields)
+            pacer.error()
+            if kind == "challenge" and session is not None:
+                session.challenged = True
+            await guard.failure(kind, retry_after=retry_after, attempt=attempt)
 
-        try:
-            async with page.expect_response(lambda r: "/graph" in r.url and r.status == 200, timeout=5000) as resp_ctx:
-                pass
-            print("Initial /graph response observed.")
-        except PlaywrightTimeoutError:
-            print("No initial /graph response observed within timeout; continuing.")
+        def is_graph(response):
+            return "/graph" in response.url
 
-        for attempt in range(1, max_clicks + 1):
-            print(f"\nAttempt {attempt}/{max_clicks} to click Load more... (time {time.strftime('%X')})")
+        def timeout_kind(since):
+            """点击等待超时：期间 /graph 仍在成功返回时是按钮没有触发请求（click_timeout，只消耗一次点击），否则为 network"""
+            return "click_timeout" if graph_ok["at"] is not None and graph_ok["at"] >= since else "network"
 
-            button = await page.query_selector('button:has-text("Load more")')
-            if not button:
-                button = await page.query_selector('button.kds-button[data-rac]')
+        while clicks < click_budget:
+            attempt += 1
+            if incremental is not None and incremental.caught_up:
+                emit("incremental_caught_up", "已翻到已知评论，停止翻页")
+                break
+            emit("click_attempt", "click Load more", logging.DEBUG, attempt=attempt, clicks=clicks,
+                 max_clicks=max_clicks)
+
+            # 只找 Load more：页面上还有许多其他 kds 按钮，误点会白白消耗点击次数与退避
+            with timings.time("button_lookup"):
+                button = await page.query_selector(LOAD_MORE_SELECTOR)
 
             if not button:
-                print("Load more 按钮未找到，可能已到底或页面结构变化。退出循环。")
+                if await is_challenge_page(page):
+                    # 页面被重新 challenge：退避，等浏览器通过 challenge 后按钮重新出现
+                    await click_failed("challenge", "challenge_detected", "页面停在 challenge，Load more 按钮不可用")
+                    with timings.time("challenge_wait"):
+                        await wait_until_ready(page, graph_seen, initial_wait_ms + 5000)
+                    continue
+                emit("button_missing", "Load more 按钮未找到，可能已到底或页面结构变化，退出循环", attempt=attempt)
                 break
 
             response = None
             try:
-                await button.evaluate("(el) => el.scrollIntoView({block: 'center', behavior: 'auto'})")
-                await human_like_scroll(page, scroll_min, scroll_max, scroll_sleep_min, scroll_sleep_max)
+                with timings.time("scroll"):
+                    await button.evaluate("(el) => el.scrollIntoView({block: 'center', behavior: 'auto'})")
+                    await human_like_scroll(page, scroll_min, scroll_max, scroll_sleep_min, scroll_sleep_max)
 
                 visible = await button.is_visible()
                 enabled = await button.is_enabled()
                 box = await button.bounding_box()
-                print("button visible/enabled/box:", visible, enabled, box)
+                emit("button_state", "button visible/enabled/box", logging.DEBUG,
+                     visible=visible, enabled=enabled, box=box)
 
+                await guard.acquire()
                 if not visible or not enabled or not box:
-                    print("按钮可能不可点击，尝试用 JS click。")
+                    emit("js_click", "按钮可能不可点击，尝试用 JS click", logging.DEBUG, attempt=attempt)
                     try:
-                        async with page.expect_response(lambda r: "/graph" in r.url and r.status == 200, timeout=click_timeout_ms) as resp_ctx:
+                        click_started = time.monotonic()
+                        async with page.expect_response(is_graph, timeout=click_timeout_ms) as resp_ctx:
                             await button.evaluate("(el) => el.click()")
                         response = await resp_ctx.value
                     except PlaywrightTimeoutError:
-                        print("JS click 等待 /graph 超时，跳过本次尝试。")
+                        await click_failed(timeout_kind(click_started), "click_timeout",
+                                           "JS click 等待 /graph 超时，退避后重试", method="js")
                         continue
                 else:
                     await page.mouse.move(box["x"] + box["width"]/2, box["y"] + box["height"]/2)
-                    await asyncio.sleep(random.uniform(0.15, 0.5))
                     try:
-                        async with page.expect_response(lambda r: "/graph" in r.url and r.status == 200, timeout=click_timeout_ms) as resp_ctx:
+                        click_started = first_click_started = time.monotonic()
+                        async with page.expect_response(is_graph, timeout=click_timeout_ms) as resp_ctx:
                             await button.click()
                         response = await resp_ctx.value
                     except PlaywrightTimeoutError:
-                        print(f"等待 /graph 响应超时（{click_timeout_ms}ms）。尝试 force click 或 JS click。")
+                        emit("click_timeout", "等待 /graph 响应超时，尝试 force click", logging.WARNING,
+                             attempt=attempt, method="click", timeout_ms=click_timeout_ms)
+                        pacer.error()
                         try:
-                            async with page.expect_response(lambda r: "/graph" in r.url and r.status == 200, timeout=click_timeout_ms) as resp_ctx:
+                            click_started = time.monotonic()
+                            async with page.expect_response(is_graph, timeout=click_timeout_ms) as resp_ctx:
                                 await button.click(force=True)
                             response = await resp_ctx.value
                         except PlaywrightTimeoutError:
-                            print("force click 也超时，继续下次尝试。")
-                            await page.wait_for_timeout(800)
+                            await click_failed(timeout_kind(first_click_started), "click_timeout",
+                                               "force click 也超时，退避后重试", method="force")
                             continue
 
+            except CircuitOpenError:
+                raise
             except Exception as e:
-                print("点击或滚动阶段抛出异常:", repr(e))
-                await page.wait_for_timeout(800)
+                await click_failed("network", "click_error", "点击或滚动阶段抛出异常", error=repr(e))
                 continue
 
             if response is None:
-                print("本次点击未捕获到 /graph response，跳过解析。")
-                await page.wait_for_timeout(800)
+                await click_failed("network", "no_response", "本次点击未捕获到 /graph response")
+                continue
+            click_latency = time.monotonic() - click_started
+            timings.observe("click_response", click_latency)
+            pacer.observe(click_latency)
+
+            if response.status != 200:
+                headers = response.headers
+                await click_failed(classify_status(response.status, headers) or "bad_response", "graph_http_error",
+                                   "/graph 返回错误状态，退避后重试", status=response.status,
+                                   retry_after=parse_retry_after(headers.get("retry-after")))
                 continue
 
-            # 只用于判断是否继续（不保存）
+            # 只用于判断是否继续（不保存）；与 on_response 共用解码结果
             try:
-                body = await response.json()
+                _, body = await decode_body(response)
             except Exception:
-                print("本次 /graph 响应不是 JSON，跳过 hasNextPage 判断。")
-                await page.wait_for_timeout(800)
+                await click_failed("bad_response", "bad_json", "本次 /graph 响应不是 JSON，跳过 hasNextPage 判断")
                 continue
 
             if not isinstance(body, (list, tuple)) or len(body) == 0:
-                print("响应 body 不是预期的列表，跳过 hasNextPage 判断。")
-                await page.wait_for_timeout(800)
+                await click_failed("bad_response", "bad_body", "响应 body 不是预期的列表，跳过 hasNextPage 判断")
                 continue
 
-            first_item = body[0]
-            commentable = first_item.get("data", {}).get("commentable")
+            commentable = _extract_commentable(body)
             if not commentable:
-                print("本次 /graph 响应无 commentable 字段，跳过 hasNextPage 判断。")
-                await page.wait_for_timeout(800)
+                await click_failed("bad_response", "no_commentable",
+                                   "本次 /graph 响应无 commentable 字段，跳过 hasNextPage 判断")
                 continue
 
+            guard.success()
             page_info = commentable.get("comments", {}).get("pageInfo", {}) or {}
             has_next = bool(page_info.get("hasNextPage"))
             end_cursor = page_info.get("endCursor")
-            print(f"[click-path#{attempt}] hasNextPage={has_next}, endCursor repr: {repr(end_cursor)}")
+            saved = end_cursor in saved_cursors
+            if saved:
+                saved_cursors.discard(end_cursor)  # 每个已保存的 cursor 只豁免一次
+            else:
+                clicks += 1
+            emit("click_page", "click-path page", logging.DEBUG, attempt=attempt, clicks=clicks, has_next=has_next,
+                 latency=round(click_latency, 3), has_cursor=bool(end_cursor), saved=saved)
 
             if not has_next:
-                print("hasNextPage == False -> 到达最后一页，停止翻页。")
+                emit("last_page", "hasNextPage == False -> 到达最后一页，停止翻页", attempt=attempt)
                 break
 
-            await page.wait_for_timeout(800)
+            # 正常情况下不等待；服务器变慢或连续出错时按观测延迟退避
+            await pacer.pause()
 
-        # 保存结果
-        print(f"\n抓取完成，总共捕获 {len(graphql_pages)} pages (去重后)。")
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(graphql_pages, f, ensure_ascii=False, indent=2)
+        if replies is not None and replies.pending:
+            if not replies.template:
+                # 点击一次 "View more replies" 录制回复请求，之后的线程都直接重放
+                button = await page.query_selector(MORE_REPLIES_SELECTOR)
+                if button:
+                    try:
+                        await button.click()
+                        await asyncio.wait_for(reply_template_seen.wait(), click_timeout_ms / 1000)
+                    except Exception as e:
+                        emit("reply_template_error", "录制回复请求失败", logging.WARNING, error=repr(e))
+            with timings.time("reply_expand"):
+                await replies.expand(page.context, add_reply_page, response_cache, project, timings, guard=guard)
+    except CircuitOpenError as e:
+        e.output_file = output_file  # 已保存的页仍在这里（run_crawler 放弃续抓时解析它们）
+        raise
+    finally:
+        # 保存结果（.jsonl 已逐页落盘，这里只负责关闭/写出旧 JSON 格式）
+        with timings.time("final_write"):
+            if export is not None:
+                await graphql_pages.aclose()   # 等待导出线程收尾，不阻塞事件循环
+            else:
+                graphql_pages.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if incremental is not None:
+            incremental.close()
+        # 熔断暂停时也报告：有效 pages/min 与各类错误数
+        if stats is not None:
+            stats.merge(project_stats)
+        emit("fetch_stats", "请求统计", **project_stats.fields())
 
-        await browser.close()
+    emit("crawl_done", "抓取完成", pages=len(graphql_pages), output_file=output_file,
+         dropped_comments=index.dropped_comments)
+    if export is not None:
+        if export.error is not None:
+            raise export.error
+        emit("export_done", "流水线导出完成", rows=export.rows, export_file=export.output_file)
+    # 与旧的固定等待比较：initial_wait_ms + 5s 探测 + 每页 800ms + 每次点击前平均 0.325s
+    fixed_idle = initial_wait_ms / 1000 + 5 + pacer.samples * (0.8 + 0.325)
+    mean_latency = pacer.latency_total / pacer.samples if pacer.samples else 0.0
+    timings.observe("backoff_idle", pacer.idle)
+    emit("idle_stats", "等待统计", ready_wait=round(ready_wait, 3), backoff_idle=round(pacer.idle, 3),
+         mean_latency=round(mean_latency, 3), requests=pacer.samples, fixed_idle_estimate=round(fixed_idle, 3),
+         idle_saved=round(fixed_idle - ready_wait - pacer.idle, 3))
+    if net_stats is not None:
+        timings.incr("bytes_downloaded", net_stats["bytes"])
+        timings.incr("requests_blocked", net_stats["blocked_total"])
+        emit("network_stats", "流量统计", requests=net_stats["requests"], bytes=net_stats["bytes"],
+             blocked_total=net_stats["blocked_total"], blocked=net_stats["blocked"])
+    if replies is not None:
+        emit("reply_stats", "回复展开统计", threads=replies.threads_expanded,
+             truncated=replies.threads_truncated, pages=replies.pages_fetched,
+             errors=replies.errors, unexpanded=len(replies.pending))
+    if incremental is not None:
+        emit("incremental_stats", "增量统计", new=incremental.new_count, changed=incremental.changed_count,
+             delta_file=delta_file)
 
     return output_file
 
+async def run_crawler(
+    url,
+    output_file="kickstarter_comments.jsonl",
+    max_clicks=30,
+    click_timeout_ms=15000,
+    initial_wait_ms=6000,
+    headless=True,
+    window_width=1400,
+    window_height=900,
+    scroll_min=50,
+    scroll_max=150,
+    scroll_sleep_min=0.1,
+    scroll_sleep_max=0.4,
+    direct_graphql=False,
+    checkpoint_file=None,
+    resume=False,
+    incremental_from=None,
+    delta_file=None,
+    block_resources=True,
+    block_resource_types=None,
+    block_url_patterns=None,
+    allow_url_patterns=None,
+    timings=None,
+    response_cache=None,
+    session_dir=None,
+    session_ttl_seconds=1800,
+    expand_replies=False,
+    reply_concurrency=4,
+    rate_per_host=0.0,
+    retry_base_delay=1.0,
+    retry_max_delay=60.0,
+    circuit_failures=5,
+    circuit_cooldown_seconds=300,
+    max_pauses=2,
+    export=None,
+):
+    """
+    运行爬虫，参数全部可传入（run.py 将调用此函数）。
+    session_dir 不为 None 时从中复用该域名保存的会话（storage_state），跳过已通过的 JS challenge，
+    结束时保存最新会话；抓取失败则删除保存的会话。
+    熔断（CircuitOpenError）时丢弃当前会话，等待冷却后用新会话重试（有断点时续抓），最多 max_pauses 次；
+    仍未恢复时停止抓取，返回已保存的页（之后可用 --resume 从断点继续）。
+    export 为 export_pipeline.ExportPipeline 时边抓边导出（见 crawl_page）。
+    返回保存的 output_file 路径。
+    """
+    stats = CrawlStats()
+    async with Stealth().use_async(async_playwright()) as pw:
+        browser = await pw.chromium.launch(
+            headless=headless,
+            args=[f"--window-size={window_width},{window_height}"]
+        )
+        pool = SessionPool(browser, session_dir, session_ttl_seconds, warm_contexts=0)
+        try:
+            pauses = 0
+            while True:
+                session = await pool.acquire(url)
+                ok = False
+                try:
+                    page = await session.context.new_page()
+                    output_file = await crawl_page(
+                        page,
+                        url,
+                        output_file=output_file,
+                        max_clicks=max_clicks,
+                        click_timeout_ms=click_timeout_ms,
+                        initial_wait_ms=initial_wait_ms,
+                        scroll_min=scroll_min,
+                        scroll_max=scroll_max,
+                        scroll_sleep_min=scroll_sleep_min,
+                        scroll_sleep_max=scroll_sleep_max,
+                        direct_graphql=direct_graphql,
+                        checkpoint_file=checkpoint_file,
+                        resume=resume,
+                        incremental_from=incremental_from,
+                        delta_file=delta_file,
+                        block_resources=block_resources,
+                        block_resource_types=block_resource_types,
+                        block_url_patterns=block_url_patterns,
+                        allow_url_patterns=allow_url_patterns,
+                        timings=timings,
+                        response_cache=response_cache,
+                        session=session,
+                        expand_replies=expand_replies,
+                        reply_concurrency=reply_concurrency,
+                        rate_per_host=rate_per_host,
+                        retry_base_delay=retry_base_delay,
+                        retry_max_delay=retry_max_delay,
+                        circuit_failures=circuit_failures,
+                        circuit_cooldown_seconds=circuit_cooldown_seconds,
+                        stats=stats,
+                        export=export,
+                    )
+                    ok = True
+                    break
+                except CircuitOpenError as e:
+                    output_file = getattr(e, "output_file", output_file)
+                    if pauses >= max_pauses:
+                        log_event(logger, "project_gave_up", "熔断暂停次数用完，停止抓取并保留已抓取的页",
+                                  logging.WARNING, url=url, kind=e.kind, pauses=pauses, output_file=output_file)
+                        break
+                    pauses += 1
+                    stats.paused += 1
+                    cooldown = e.retry_after
+                    log_event(logger, "project_paused", "项目熔断，冷却后重试", logging.WARNING, url=url,
+                              kind=e.kind, cooldown=cooldown, pause=pauses, max_pauses=max_pauses)
+                finally:
+                    await pool.release(session, ok=ok)
+                await asyncio.sleep(cooldown)
+                resume = checkpoint_file is not None
+        finally:
+            await pool.close()
+            await browser.close()
+
+    log_event(logger, "throughput", "有效吞吐", **stats.fields())
+    return output_file
+
+async def run_batch(
+    urls,
+    output_dir="outputs",
+    concurrency=4,
+    per_host_concurrency=2,
+    append_timestamp=True,
+    file_ext=".jsonl",
+    checkpoint_dir=None,
+    headless=True,
+    window_width=1400,
+    window_height=900,
+    session_dir=None,
+    session_ttl_seconds=1800,
+    warm_contexts=1,
+    max_pauses=2,
+    pipeline_format=None,
+    pipeline_compact=False,
+    pipeline_store_db=None,
+    pipeline_queue_pages=64,
+    **crawl_kwargs,
+):
+    """
+    批量模式：只启动一个 Chromium，每个项目使用独立的 BrowserContext/page 并发抓取。
+    concurrency 控制全局并发数，per_host_concurrency 限制同一域名的并发数。
+    checkpoint_dir 不为 None 时每个项目在其中保存 <slug>.sqlite 断点（配合 crawl_kwargs 中的 resume）。
+    context 来自 SessionPool：同一域名的项目复用已通过 challenge 的热 context（最多 warm_contexts 个），
+    session_dir 不为 None 时会话跨运行保存（session_ttl_seconds 后过期）。
+    crawl_kwargs 透传给 crawl_page（max_clicks、click_timeout_ms 等）；所有项目共用一个按域名的令牌桶
+    （crawl_kwargs 中的 rate_per_host）。项目熔断时释放并发配额，冷却后重新排队（有断点时续抓），
+    最多 max_pauses 次。
+    pipeline_format 不为 None 时每个项目边抓边导出为 <输出名>.<pipeline_format>（见 export_pipeline.py），
+    pipeline_store_db 为评论库路径。
+    返回 {url: output_file}，失败的项目对应 None。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    ts = time.strftime("%Y%m%d_%H%M%S") if append_timestamp else None
+    results = {}
+    global_sem = asyncio.Semaphore(max(1, concurrency))
+    host_sems = {}
+    crawl_kwargs.setdefault("rate_limiter", HostRateLimiter(crawl_kwargs.pop("rate_per_host", 0.0)))
+    stats = crawl_kwargs.setdefault("stats", CrawlStats())
+
+    async with Stealth().use_async(async_playwright()) as pw:
+        browser = await pw.chromium.launch(
+            headless=headless,
+            args=[f"--window-size={window_width},{window_height}"]
+        )
+        pool = SessionPool(browser, session_dir, session_ttl_seconds, warm_contexts)
+
+        async def crawl_one(url):
+            host = urlparse(url).netloc
+            host_sem = host_sems.setdefault(host, asyncio.Semaphore(max(1, per_host_concurrency)))
+            name = project_slug(url) + (f"_{ts}" if ts else "") + file_ext
+            output_file = os.path.join(output_dir, name)
+            checkpoint_file = os.path.join(checkpoint_dir, project_slug(url) + ".sqlite") if checkpoint_dir else None
+            kwargs = dict(crawl_kwargs)
+            for pause in range(max_pauses + 1):
+                cooldown = None
+                # 先拿域名配额再拿全局配额，避免占着全局名额等待同一域名
+                async with host_sem:
+                    async with global_sem:
+                        started = time.monotonic()
+                        session = await pool.acquire(url)
+                        ok = False
+                        try:
+                            page = await session.context.new_page()
+                            export = (ExportPipeline(fmt=pipeline_format, compact=pipeline_compact,
+                                                     store_db=pipeline_store_db, queue_pages=pipeline_queue_pages)
+                                      if pipeline_format else None)
+                            output_file = await crawl_page(page, url, output_file=output_file,
+                                                           checkpoint_file=checkpoint_file, session=session,
+                                                           export=export, **kwargs)
+                            ok = True
+                            results[url] = output_file
+                            log_event(logger, "batch_project_done", "项目完成", url=url, output_file=output_file,
+                                      seconds=round(time.monotonic() - started, 2))
+                        except CircuitOpenError as e:
+                            results[url] = None
+                            if pause < max_pauses:
+                                cooldown = e.retry_after
+                            log_event(logger, "batch_project_paused" if cooldown else "batch_project_failed",
+                                      "项目熔断，冷却后重新排队" if cooldown else "项目熔断次数用尽",
+                                      logging.WARNING if cooldown else logging.ERROR, url=url, kind=e.kind,
+                                      cooldown=cooldown, pause=pause + 1, max_pauses=max_pauses)
+                        except Exception as e:
+                            results[url] = None
+                            log_event(logger, "batch_project_failed", "项目失败", logging.ERROR, url=url, error=repr(e))
+                        finally:
+                            await pool.release(session, ok=ok)
+                if cooldown is None:
+                    return
+                # 已释放并发配额：其他项目继续抓取，本项目冷却后续抓
+                stats.paused += 1
+                await asyncio.sleep(cooldown)
+                if checkpoint_file is not None:
+                    kwargs["resume"] = True
+
+        started = time.monotonic()
+        try:
+            await asyncio.gather(*(crawl_one(u) for u in urls))
+        finally:
+            await pool.close()
+            await browser.close()
+
+    elapsed = time.monotonic() - started
+    done = sum(1 for v in results.values() if v)
+    rate = done / elapsed * 3600 if elapsed > 0 else 0.0
+    log_event(logger, "batch_done", "批量抓取完成", done=done, total=len(urls), seconds=round(elapsed, 2),
+              projects_per_hour=round(rate, 1), **stats.fields())
+    return results
+
+def replay_from_cache(response_cache, project, output_file, since=None, timings=None):
+    """
+    无浏览器重放：把缓存中某个项目捕获的原始 /graph 响应按捕获顺序送入 add_commentable，
+    写出与在线抓取相同格式的 output_file（多次抓取之间重叠的页/评论照常去重）。
+    since 为时间戳，只重放之后的捕获。返回保存的页数。
+    """
+    timings = timings or Timings()
+    index = DedupIndex()
+    graphql_pages = open_page_writer(output_file)
+    responses = 0
+    try:
+        for url, raw in response_cache.iter_captures(project, since=since):
+            responses += 1
+            try:
+                with timings.time("json_decode"):
+                    body = json.loads(raw)
+            except ValueError:
+                continue
+            commentable = _extract_commentable(body)
+            if commentable:
+                add_commentable(commentable, graphql_pages, index, source="cache", timings=timings)
+    finally:
+        with timings.time("final_write"):
+            graphql_pages.close()
+    log_event(logger, "cache_replay_done", "缓存重放完成", project=project, responses=responses,
+              pages=len(graphql_pages), output_file=output_file)
+    return len(graphql_pages)
+
 # 当直接运行 crawler.py 时从 config.yaml 读取参数并运行
 if __name__ == "__main__":
     cfg_path = os.path.join(os.path.dirname(__file__), "config.yaml")
@@ -237,10 +1116,11 @@ if __name__ == "__main__":
             cfg = yaml.safe_load(f)
     else:
         raise RuntimeError("找不到 config.yaml，请在项目根目录放置 config.yaml 或指定参数运行。")
+    setup_logging(cfg.get("log_level", "INFO"), cfg.get("log_format", "text"), cfg.get("log_file"))
 
     # 从 config 读取或使用默认
     url = cfg.get("comments_page")
-    output = cfg.get("output_json", "kickstarter_comments.json")
+    output = cfg.get("output_json", "kickstarter_comments.jsonl")
     max_clicks = cfg.get("max_clicks", 30)
     click_timeout_ms = cfg.get("click_timeout_ms", 15000)
     initial_wait_ms = cfg.get("initial_wait_ms", 6000)
@@ -251,6 +1131,8 @@ if __name__ == "__main__":
     scroll_max = cfg.get("scroll_max", 150)
     scroll_sleep_min = cfg.get("scroll_sleep_min", 0.1)
     scroll_sleep_max = cfg.get("scroll_sleep_max", 0.4)
+    direct_graphql = cfg.get("direct_graphql", False)
+    block_resources = cfg.get("block_resources", True)
 
     asyncio.run(run_crawler(
         url=url,
@@ -265,4 +1147,9 @@ if __name__ == "__main__":
         scroll_max=scroll_max,
         scroll_sleep_min=scroll_sleep_min,
         scroll_sleep_max=scroll_sleep_max,
+        direct_graphql=direct_graphql,
+        block_resources=block_resources,
+        block_resource_types=cfg.get("block_resource_types"),
+        block_url_patterns=cfg.get("block_url_patterns"),
+        allow_url_patterns=cfg.get("allow_url_patterns"),
     ))
@@ -0,0 +1,467 @@
+# daemon.py
+"""
+守护进程模式：常驻一个浏览器与会话池，从 SQLite 任务队列（job_queue.py）领取 crawl / parse 任务执行。
+
+- 任务通过 python run.py --submit 或本地 HTTP 接口提交：
+    POST /jobs              {"kind": "crawl", "url": "...", "priority": 5, "max_clicks": 50}
+    POST /jobs              {"kind": "parse", "input_json": ["a.jsonl", "b.jsonl"], "output_file": "m.parquet",
+                             "compact": true}
+    GET  /jobs?status=queued&limit=20
+    GET  /jobs/<id>
+    POST /jobs/<id>/cancel
+    GET  /health
+- concurrency 为同时执行的任务数，per_host_concurrency 限制同一域名的并发抓取，
+  project_interval_seconds 为同一项目两次抓取开始之间的最小间隔（按项目限速）
+- SIGINT / SIGTERM 时不再领取新任务，等待进行中的任务完成后退出
+- 分片 worker（lease_seconds > 0）：领取任务时加租约并定期续约，失败按 max_attempts 重试；
+  exit_when_idle 时该次运行（run_id）的任务全部结束后退出，见 sharding.py
+- 所有任务共用按域名的令牌桶（rate_per_host）；项目熔断时任务暂停 circuit_cooldown_seconds 后重新排队，
+  不计入 max_attempts（最多 max_pauses 次）；重试 / 暂停后的任务在有断点时续抓
+- pipeline_export 时 crawl 任务边抓边解析导出（export_pipeline.py），抓取结束即有结果文件，不再单独解析一遍
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from playwright.async_api import async_playwright
+from playwright_stealth import Stealth
+
+from comment_store import CommentStore, project_from_filename
+from crawler import crawl_page, project_slug
+from exporters import format_from_path
+from export_pipeline import ExportPipeline
+from instrumentation import Timings, log_event
+from job_queue import JobQueue
+from parser import parse_edges, parse_many
+from resilience import CircuitOpenError, CrawlStats, HostRateLimiter
+from session_pool import SessionPool
+
+logger = logging.getLogger("daemon")
+
+# crawl 任务 payload 中可覆盖的 crawl_page 参数
+CRAWL_OPTIONS = (
+    "max_clicks", "click_timeout_ms", "initial_wait_ms", "scroll_min", "scroll_max",
+    "scroll_sleep_min", "scroll_sleep_max", "direct_graphql", "resume", "incremental_from", "delta_file",
+    "block_resources", "block_resource_types", "block_url_patterns", "allow_url_patterns",
+    "expand_replies", "reply_concurrency", "reply_max_pages",
+    "retry_base_delay", "retry_max_delay", "circuit_failures", "circuit_cooldown_seconds",
+)
+
+
+# payload 字段的类型校验（HTTP 提交的 JSON 不可信）
+_NUMBER_OPTIONS = (
+    "max_clicks", "click_timeout_ms", "initial_wait_ms", "scroll_min", "scroll_max", "scroll_sleep_min",
+    "scroll_sleep_max", "reply_concurrency", "reply_max_pages", "retry_base_delay", "retry_max_delay",
+    "circuit_failures", "circuit_cooldown_seconds", "workers",
+)
+_BOOL_OPTIONS = ("direct_graphql", "resume", "block_resources", "expand_replies", "parse", "compact")
+_STR_OPTIONS = ("url", "output_file", "format", "delta_file")
+_STR_LIST_OPTIONS = ("input_json", "incremental_from", "block_resource_types", "block_url_patterns",
+                     "allow_url_patterns")
+
+
+def _validate_payload(payload):
+    """校验 payload 中已知字段的类型，字符串形式的列表字段包成单元素列表；不合法时抛 ValueError"""
+    if not isinstance(payload, dict):
+        raise ValueError("payload 必须是 JSON 对象")
+    payload = dict(payload)
+    for key, value in payload.items():
+        if value is None:
+            continue
+        if key in _NUMBER_OPTIONS:
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        elif key in _BOOL_OPTIONS:
+            ok = isinstance(value, bool)
+        elif key in _STR_OPTIONS:
+            ok = isinstance(value, str)
+        elif key in _STR_LIST_OPTIONS:
+            if isinstance(value, str):
+                value = payload[key] = [value]
+            ok = isinstance(value, list) and all(isinstance(v, str) for v in value)
+        else:
+            continue
+        if not ok:
+            raise ValueError(f"字段 {key} 类型不正确: {value!r}")
+    return payload
+
+
+def submit_job(queue, kind, payload, priority=0, run_id=None, max_attempts=1):
+    """提交任务：crawl 任务需要 payload["url"]，按项目标识记录 project（用于限速）"""
+    payload = _validate_payload(payload)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        raise ValueError(f"priority 必须是整数: {priority!r}")
+    if isinstance(max_attempts, bool) or not isinstance(max_attempts, int) or max_attempts < 1:
+        raise ValueError(f"max_attempts 必须是正整数: {max_attempts!r}")
+    project = None
+    if kind == "crawl":
+        if not payload.get("url"):
+            raise ValueError("crawl 任务需要 url")
+        project = project_slug(payload["url"])
+    elif kind == "parse":
+        if not payload.get("input_json"):
+            raise ValueError("parse 任务需要 input_json")
+    else:
+        raise ValueError(f"未知的任务类型: {kind!r}")
+    return queue.submit(kind, payload, priority=priority, project=project, run_id=run_id,
+                        max_attempts=max_attempts)
+
+
+class _JobHandler(BaseHTTPRequestHandler):
+    queue_path = None  # 由 start_http_server 绑定
+    journal_mode = "WAL"
+
+    def log_message(self, fmt, *args):
+        log_event(logger, "http_request", fmt % args, logging.DEBUG)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        queue = JobQueue(self.queue_path, self.journal_mode)
+        try:
+            if parts == ["health"]:
+                self._send_json(200, {"status": "ok", "jobs": queue.counts()})
+            elif parts == ["jobs"]:
+                qs = parse_qs(url.query)
+                status = (qs.get("status") or [None])[0]
+                limit = (qs.get("limit") or ["50"])[0]
+                if not limit.isdigit() or int(limit) < 1:
+                    self._send_json(400, {"error": f"limit 必须是正整数: {limit!r}"})
+                    return
+                self._send_json(200, queue.list(status=status, limit=int(limit)))
+            elif len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+                job = queue.get(int(parts[1]))
+                self._send_json(200 if job else 404, job or {"error": "not found"})
+            else:
+                self._send_json(404, {"error": "not found"})
+        finally:
+            queue.close()
+
+    def do_POST(self):
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        queue = JobQueue(self.queue_path, self.journal_mode)
+        try:
+            if parts == ["jobs"]:
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    if length < 0:
+                        raise ValueError(f"Content-Length 不合法: {length}")
+                    data = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(data, dict):
+                        raise ValueError("请求体必须是 JSON 对象")
+                    kind = data.pop("kind", "crawl")
+                    priority = data.pop("priority", 0)
+                    max_attempts = data.pop("max_attempts", 1)
+                    job_id = submit_job(queue, kind, data, priority=priority, max_attempts=max_attempts)
+                except (ValueError, TypeError) as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                self._send_json(201, {"id": job_id})
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[1].isdigit() and parts[2] == "cancel":
+                ok = queue.cancel(int(parts[1]))
+                self._send_json(200 if ok else 409, {"cancelled": ok})
+            else:
+                self._send_json(404, {"error": "not found"})
+        finally:
+            queue.close()
+
+
+def start_http_server(queue_path, host="127.0.0.1", port=8787, journal_mode="WAL"):
+    handler = type("BoundJobHandler", (_JobHandler,), {"queue_path": queue_path, "journal_mode": journal_mode})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class CrawlDaemon:
+    def __init__(
+        self,
+        queue_path="jobs.sqlite",
+        concurrency=4,
+        per_host_concurrency=2,
+        project_interval_seconds=0,
+        poll_interval=1.0,
+        output_dir="outputs",
+        output_format="xlsx",
+        checkpoint_dir=None,
+        http_host="127.0.0.1",
+        http_port=8787,
+        headless=True,
+        window_width=1400,
+        window_height=900,
+        session_dir=None,
+        session_ttl_seconds=1800,
+        warm_contexts=1,
+        response_cache=None,
+        store_db=None,
+        timings=None,
+        worker_id=None,
+        lease_seconds=0,
+        retry_delay_seconds=30,
+        run_id=None,
+        exit_when_idle=False,
+        queue_journal_mode="WAL",
+        rate_per_host=0.0,
+        max_pauses=2,
+        pipeline_export=False,
+        pipeline_queue_pages=64,
+        **crawl_defaults,
+    ):
+        self.queue_path = queue_path
+        self.concurrency = max(1, concurrency)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.project_interval_seconds = project_interval_seconds
+        self.poll_interval = poll_interval
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.checkpoint_dir = checkpoint_dir
+        self.http_host = http_host
+        self.http_port = http_port
+        self.headless = headless
+        self.window_width = window_width
+        self.window_height = window_height
+        self.session_dir = session_dir
+        self.session_ttl_seconds = session_ttl_seconds
+        self.warm_contexts = warm_contexts
+        self.response_cache = response_cache
+        self.store_db = store_db
+        self.timings = timings or Timings()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.retry_delay_seconds = retry_delay_seconds
+        self.run_id = run_id
+        self.exit_when_idle = exit_when_idle
+        self.queue_journal_mode = queue_journal_mode
+        self.max_pauses = max_pauses
+        self.pipeline_export = pipeline_export
+        self.pipeline_queue_pages = pipeline_queue_pages
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.stats = CrawlStats()
+        self.crawl_defaults = crawl_defaults
+        self._active_jobs = set()
+        self._running_projects = set()
+        self._last_started = {}   # project -> 最近一次开始抓取的时间
+        self._host_sems = {}
+        self._stop = None
+        self._queue_lock = threading.Lock()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _queue_call(self, method, *args, **kwargs):
+        """在线程中执行队列操作：sqlite 忙等待最长 30s，不能阻塞事件循环；同一连接由锁串行使用"""
+        def call():
+            with self._queue_lock:
+                return method(*args, **kwargs)
+        return await asyncio.to_thread(call)
+
+    def _blocked_projects(self):
+        """正在抓取或距上次开始不足 project_interval_seconds 的项目"""
+        blocked = set(self._running_projects)
+        if self.project_interval_seconds:
+            now = time.monotonic()
+            blocked.update(p for p, t in self._last_started.items() if now - t < self.project_interval_seconds)
+        return blocked
+
+    def _parse(self, input_file, output_file, fmt, project, compact=False):
+        """在线程池中运行：解析并（配置了 store_db 时）写入评论库；sqlite 连接在本线程内打开"""
+        store = CommentStore(self.store_db) if self.store_db else None
+        try:
+            return parse_edges(input_file, output_file, fmt=fmt, store=store, project=project, compact=compact)
+        finally:
+            if store is not None:
+                store.close()
+
+    async def _run_crawl(self, job, pool):
+        payload = job["payload"]
+        url = payload["url"]
+        slug = project_slug(url)
+        os.makedirs(self.output_dir, exist_ok=True)
+        output_file = payload.get("output_file") or os.path.join(
+            self.output_dir, f"{slug}_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+        checkpoint_file = os.path.join(self.checkpoint_dir, slug + ".sqlite") if self.checkpoint_dir else None
+        kwargs = {**self.crawl_defaults, **{k: payload[k] for k in CRAWL_OPTIONS if k in payload}}
+        if checkpoint_file and "resume" not in payload and (job.get("pauses") or job["attempts"] > 1):
+            kwargs["resume"] = True   # 重试 / 熔断暂停后从断点续抓
+
+        parse = payload.get("parse", True)
+        fmt = payload.get("format") or self.output_format
+        export = (ExportPipeline(fmt=fmt, compact=bool(payload.get("compact")), store_db=self.store_db,
+                                 queue_pages=self.pipeline_queue_pages)
+                  if parse and self.pipeline_export else None)
+
+        host = urlparse(url).netloc
+        host_sem = self._host_sems.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with host_sem:
+            session = await pool.acquire(url)
+            ok = False
+            try:
+                page = await session.context.new_page()
+                output_file = await crawl_page(page, url, output_file=output_file, checkpoint_file=checkpoint_file,
+                                               timings=self.timings, response_cache=self.response_cache,
+                                               session=session, rate_limiter=self.rate_limiter,
+                                               stats=self.stats, export=export, **kwargs)
+                ok = True
+            finally:
+                await pool.release(session, ok=ok)
+
+        result = {"output_file": output_file}
+        if export is not None:
+            result["rows"] = export.rows
+            result["parsed_file"] = export.output_file
+        elif parse:
+            parsed_file = f"{os.path.splitext(output_file)[0]}.{fmt}"
+            loop = asyncio.get_running_loop()
+            result["rows"] = await loop.run_in_executor(
+                None, lambda: self._parse(output_file, parsed_file, fmt, slug, bool(payload.get("compact"))))
+            result["parsed_file"] = parsed_file
+        return result
+
+    async def _run_parse(self, job):
+        payload = job["payload"]
+        inputs = payload["input_json"]
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        output_file = payload.get("output_file")
+        fmt = payload.get("format") or (format_from_path(output_file, self.output_format) if output_file
+                                        else self.output_format)
+        output_file = output_file or f"{os.path.splitext(inputs[0])[0]}.{fmt}"
+        loop = asyncio.get_running_loop()
+        if len(inputs) == 1:
+            rows = await loop.run_in_executor(
+                None, lambda: self._parse(inputs[0], output_file, fmt, project_from_filename(inputs[0]),
+                                          bool(payload.get("compact"))))
+        else:
+            rows = await loop.run_in_executor(
+                None, lambda: parse_many(inputs, output_file, fmt=fmt, workers=payload.get("workers"),
+                                         compact=bool(payload.get("compact"))))
+        return {"output_file": output_file, "rows": rows}
+
+    async def _idle(self, queue):
+        """exit_when_idle：本进程空闲，且本次运行已没有排队或（任何 worker）进行中的任务"""
+        if self._active_jobs:
+            return False
+        counts = await self._queue_call(queue.counts, self.run_id)
+        return not counts.get("queued") and not counts.get("running")
+
+    async def _heartbeat(self, queue):
+        """每隔 lease_seconds / 3 为进行中的任务续约；租约丢失（例如长时间卡住）时记录警告"""
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            active = set(self._active_jobs)
+            lost = active - await self._queue_call(queue.heartbeat, active, self.worker_id, self.lease_seconds)
+            for job_id in lost:
+                log_event(logger, "lease_lost", "任务租约已丢失，结果将不会被记录", logging.WARNING,
+                          worker=self.worker_id, job_id=job_id)
+
+    async def _worker(self, n, queue, pool):
+        while not self._stop.is_set():
+            job = await self._queue_call(queue.claim, skip_projects=self._blocked_projects(), worker=self.worker_id,
+                                         lease_seconds=self.lease_seconds or None, run_id=self.run_id)
+            if job is None:
+                if self.exit_when_idle and await self._idle(queue):
+                    self.stop()
+                    break
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            project = job.get("project")
+            if project:
+                self._running_projects.add(project)
+                self._last_started[project] = time.monotonic()
+            self._active_jobs.add(job["id"])
+            owner = self.worker_id if self.lease_seconds else None
+            log_event(logger, "job_started", "开始任务", worker=n, job_id=job["id"], kind=job["kind"], project=project,
+                      attempt=job["attempts"])
+            started = time.monotonic()
+            try:
+                if job["kind"] == "crawl":
+                    result = await self._run_crawl(job, pool)
+                else:
+                    result = await self._run_parse(job)
+                if await self._queue_call(queue.finish, job["id"], result, worker=owner):
+                    log_event(logger, "job_done", "任务完成", worker=n, job_id=job["id"],
+                              seconds=round(time.monotonic() - started, 2), **result)
+                else:
+                    log_event(logger, "job_lease_lost", "任务已被其他 worker 接手，丢弃本次结果", logging.WARNING,
+                              worker=n, job_id=job["id"])
+            except CircuitOpenError as e:
+                pauses = job.get("pauses") or 0
+                if pauses < self.max_pauses and await self._queue_call(queue.pause, job["id"], e.retry_after,
+                                                                       repr(e), worker=owner):
+                    self.stats.paused += 1
+                    log_event(logger, "job_paused", "项目熔断，冷却后重新排队", logging.WARNING, worker=n,
+                              job_id=job["id"], kind=e.kind, cooldown=e.retry_after, pauses=pauses + 1)
+                else:
+                    status = await self._queue_call(queue.fail, job["id"], repr(e), worker=owner,
+                                                   retry_delay=self.retry_delay_seconds)
+                    log_event(logger, "job_failed", "任务熔断" + ("，稍后重试" if status == "queued" else ""),
+                              logging.ERROR, worker=n, job_id=job["id"], attempt=job["attempts"], error=repr(e))
+            except Exception as e:
+                status = await self._queue_call(queue.fail, job["id"], repr(e), worker=owner,
+                                                retry_delay=self.retry_delay_seconds)
+                log_event(logger, "job_failed", "任务失败" + ("，稍后重试" if status == "queued" else ""), logging.ERROR,
+                          worker=n, job_id=job["id"], attempt=job["attempts"], error=repr(e))
+            finally:
+                self._active_jobs.discard(job["id"])
+                self._running_projects.discard(project)
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows 不支持 add_signal_handler，依赖 KeyboardInterrupt
+
+        # 队列操作在线程中执行（见 _queue_call）
+        queue = JobQueue(self.queue_path, self.queue_journal_mode, check_same_thread=False)
+        # 有租约的分片 worker 不做启动时重排：其他 worker 的任务靠租约过期接手
+        requeued = 0 if self.lease_seconds else await self._queue_call(queue.requeue_running)
+        server = (start_http_server(self.queue_path, self.http_host, self.http_port, self.queue_journal_mode)
+                  if self.http_port else None)
+        log_event(logger, "daemon_started", "守护进程已启动", queue=self.queue_path, requeued=requeued,
+                  concurrency=self.concurrency, worker=self.worker_id, run_id=self.run_id,
+                  http=f"http://{self.http_host}:{self.http_port}" if server else None)
+        try:
+            async with Stealth().use_async(async_playwright()) as pw:
+                browser = await pw.chromium.launch(
+                    headless=self.headless,
+                    args=[f"--window-size={self.window_width},{self.window_height}"]
+                )
+                pool = SessionPool(browser, self.session_dir, self.session_ttl_seconds, self.warm_contexts)
+                heartbeat = asyncio.create_task(self._heartbeat(queue)) if self.lease_seconds else None
+                try:
+                    await asyncio.gather(*(self._worker(i, queue, pool) for i in range(self.concurrency)))
+                finally:
+                    if heartbeat is not None:
+                        self.stop()
+                        await heartbeat
+                    await pool.close()
+                    await browser.close()
+        finally:
+            if server is not None:
+                server.shutdown()
+            queue.close()
+            log_event(logger, "daemon_stopped", "守护进程已退出", **self.stats.fields())
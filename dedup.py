@@ -0,0 +1,91 @@
+# dedup.py
+"""
+抓取去重索引：endCursor、页指纹与评论级 key（评论 id）。
+
+页指纹只对每条评论的 id/updatedAt 求哈希，不再对整页做 json.dumps(sort_keys=True)；
+评论级 key 用于丢弃在相邻页中重复出现的评论，而不仅仅是完全相同的整页。
+评论级 key 只用 id：两次取页之间被编辑（updatedAt 变化）的评论不应再输出一次。
+"""
+import hashlib
+import json
+
+
+def comment_key(node):
+    """单条评论的去重 key：评论 id"""
+    return str(node.get("id"))
+
+
+def _fingerprint_key(node):
+    """页指纹中的单条评论：id + updatedAt（编辑过的评论使整页指纹变化）"""
+    updated = node.get("updatedAt")
+    return f"{node.get('id')}|{updated}" if updated is not None else str(node.get("id"))
+
+
+def iter_edge_nodes(edge):
+    """产出一个 edge 的顶层评论及其 replies.nodes"""
+    node = edge.get("node")
+    if not node:
+        return
+    yield node
+    for reply in (node.get("replies") or {}).get("nodes") or []:
+        if reply:
+            yield reply
+
+
+def page_fingerprint(commentable):
+    """页指纹：对所有评论的 id/updatedAt 求 SHA-1；没有评论的页退回整页序列化"""
+    keys = [_fingerprint_key(n) for edge in (commentable.get("comments") or {}).get("edges") or []
+            for n in iter_edge_nodes(edge)]
+    if not keys:
+        payload = json.dumps(commentable, sort_keys=True, ensure_ascii=False)
+    else:
+        payload = "\n".join(keys)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class DedupIndex:
+    """add_commentable 使用的去重状态，可由断点恢复"""
+
+    def __init__(self, seen_endcursors=None, seen_hashes=None, seen_comments=None):
+        self.seen_endcursors = set(seen_endcursors or ())
+        self.seen_hashes = set(seen_hashes or ())
+        self.seen_comments = set(seen_comments or ())
+        self.dropped_comments = 0
+
+    def filter_new_edges(self, commentable):
+        """
+        返回 (new_edges, new_keys)：去掉已见过的评论。
+        顶层评论已见但有新回复时，新回复作为独立 edge 保留（带 parentId），避免父评论重复输出。
+        """
+        new_edges = []
+        new_keys = []
+        for edge in (commentable.get("comments") or {}).get("edges") or []:
+            node = edge.get("node")
+            if not node:
+                continue
+            key = comment_key(node)
+            if key not in self.seen_comments:
+                new_edges.append(edge)
+                new_keys.extend(comment_key(n) for n in iter_edge_nodes(edge))
+                continue
+            self.dropped_comments += 1
+            for reply in (node.get("replies") or {}).get("nodes") or []:
+                if not reply:
+                    continue
+                reply_key = comment_key(reply)
+                if reply_key in self.seen_comments:
+                    self.dropped_comments += 1
+                    continue
+                reply_node = dict(reply)
+                if not reply_node.get("parentId"):
+                    reply_node["parentId"] = node.get("id")
+                new_edges.append({"node": reply_node})
+                new_keys.append(reply_key)
+        return new_edges, new_keys
+
+    def mark(self, token, page_hash, comment_keys):
+        if token:
+            self.seen_endcursors.add(token)
+        if page_hash:
+            self.seen_hashes.add(page_hash)
+        self.seen_comments.update(comment_keys)
@@ -0,0 +1,168 @@
+# export_pipeline.py
+"""
+流水线导出：抓取的同时解析并写出结果文件，而不是等抓取结束后再从磁盘重新读一遍 JSON。
+
+- crawl_page 的页写入器被 PipelinedPageWriter 包一层：add_commentable 保存的每一页照常落盘（断点 / --resume
+  仍依赖 .jsonl），同时放进有界队列；后台线程从队列取页，用 parser.export_pages 按块展开并写出
+- 队列满（导出跟不上抓取）时 append 把页暂存，调用方随后 await wait_writable()，在事件循环上让出直到导出线程
+  取走积压的页（不阻塞事件循环：其他项目、Playwright 事件与租约心跳照常运行）；内存中最多 queue_pages 页
+  加上每个等待中的调用方一页，以及一块（chunk_rows 行）未写出的列
+- 与先抓后解析（parse_edges）走同一个 export_pages、按同样的页顺序与分块，输出完全相同；
+  续抓时先导出文件中已有的页，再接上新抓到的页
+- 导出线程与事件循环共用 GIL：重叠的是浏览器 / 网络等待时间（抓取的大部分耗时），不是两份 CPU 计算
+"""
+import asyncio
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+
+from comment_store import CommentStore
+from instrumentation import Timings, log_event
+from page_store import is_jsonl, iter_pages
+from parser import export_pages
+
+logger = logging.getLogger("export_pipeline")
+
+_DONE = object()  # 队列结束标记
+_POLL_SECONDS = 0.005  # 队列满时在事件循环上轮询的间隔
+
+
+class ExportPipeline:
+    """
+    一个项目的流水线导出配置（传给 crawl_page 的 export 参数）；结束后 output_file / rows 为导出结果，
+    导出失败时 error 为其异常（crawl_page 在收尾后抛出）。
+    output_file 为空时按页文件名换成 fmt 的扩展名（与先抓后解析时的命名相同）。
+    store_db 不为空时同时 upsert 到评论库（连接在导出线程内打开）。
+    """
+
+    def __init__(self, output_file=None, fmt="xlsx", chunk_rows=100_000, compact=False, store_db=None,
+                 queue_pages=64):
+        self.output_file = output_file
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.compact = compact
+        self.store_db = store_db
+        self.queue_pages = max(1, queue_pages)
+        self.rows = None
+        self.error = None
+
+    def wrap(self, writer, pages_file, append=False, project=None, timings=None):
+        """包装 page_store 写入器；append=True（续抓）时先导出 pages_file 中已有的页"""
+        self.output_file = self.output_file or f"{os.path.splitext(pages_file)[0]}.{self.fmt}"
+        existing = None
+        if append and os.path.exists(pages_file):
+            # .jsonl 只读打开时已有的字节；旧 .json 在写入器 close() 之前不会被改写
+            existing = iter_pages(pages_file, os.path.getsize(pages_file) if is_jsonl(pages_file) else None)
+        return PipelinedPageWriter(writer, self, existing, project, timings)
+
+
+class PipelinedPageWriter:
+    """page_store 写入器的包装：append 落盘后把页放进有界队列，由导出线程展开写出"""
+
+    def __init__(self, writer, pipeline, existing=None, project=None, timings=None):
+        self._writer = writer
+        self._pipeline = pipeline
+        self._existing = existing
+        self._project = project
+        self._timings = timings or Timings()
+        self._queue = queue.Queue(maxsize=pipeline.queue_pages)
+        self._pending = collections.deque()  # 队列满时暂存的页（按顺序等待 wait_writable 放入队列）
+        self._closed = False
+        self._drained = False   # 已取到结束标记
+        self._thread = threading.Thread(target=self._run, name="export-pipeline", daemon=True)
+        self._thread.start()
+
+    def _iter_queue(self):
+        if self._existing is not None:
+            yield from self._existing
+        while True:
+            page = self._queue.get()
+            if page is _DONE:
+                self._drained = True
+                return
+            yield page
+
+    def _run(self):
+        p = self._pipeline
+        store = None
+        try:
+            store = CommentStore(p.store_db) if p.store_db else None
+            p.rows = export_pages(self._iter_queue(), p.output_file, p.fmt, p.chunk_rows, store, self._project,
+                                  p.compact)
+        except BaseException as e:
+            p.error = e
+            log_event(logger, "export_failed", "流水线导出失败", logging.ERROR, output_file=p.output_file,
+                      error=repr(e))
+            # 继续取走队列中的页，避免抓取端在 put() 上永久阻塞
+            while not self._drained and self._queue.get() is not _DONE:
+                pass
+        finally:
+            if store is not None:
+                store.close()
+
+    def _offer(self, page):
+        try:
+            self._queue.put_nowait(page)
+            return True
+        except queue.Full:
+            return False
+
+    def append(self, commentable):
+        """落盘后放入导出队列；队列满（或已有积压）时暂存，由调用方 await wait_writable() 等待（不阻塞）"""
+        self._writer.append(commentable)
+        if self._pending or not self._offer(commentable):
+            self._pending.append(commentable)
+
+    async def wait_writable(self):
+        """背压：在事件循环上等待导出线程取走暂存的页（按 append 顺序放入队列）"""
+        if not self._pending:
+            return
+        started = time.monotonic()
+        while self._pending:
+            if self._offer(self._pending[0]):
+                self._pending.popleft()
+            else:
+                await asyncio.sleep(_POLL_SECONDS)
+        self._timings.observe("export_backpressure", time.monotonic() - started)
+
+    def __len__(self):
+        return len(self._writer)
+
+    async def aclose(self):
+        """close() 的异步版本（crawl_page 使用）：在线程中等待导出收尾，不阻塞事件循环"""
+        if self._closed:
+            return
+        try:
+            await self.wait_writable()
+            while not self._offer(_DONE):
+                await asyncio.sleep(_POLL_SECONDS)
+            self._closed = True
+            with self._timings.time("export_drain"):
+                await asyncio.to_thread(self._thread.join)
+        finally:
+            if not self._closed:
+                self.close()
+            self._writer.close()
+
+    def close(self):
+        """等待导出线程写完剩余的页并收尾，再关闭页写入器（导出失败记录在 pipeline.error，不在这里抛出）"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            while self._pending:
+                self._queue.put(self._pending.popleft())
+            self._queue.put(_DONE)
+            with self._timings.time("export_drain"):
+                self._thread.join()
+        finally:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,190 @@
+# exporters.py
+"""
+解析结果的输出层：按块（DataFrame chunk）写出，避免大抓取构建一个巨大的 DataFrame。
+
+支持的格式（--format）：
+- xlsx    ：openpyxl，最多 1,048,576 行（含表头）
+- csv     ：流式追加写出
+- parquet ：pyarrow.parquet.ParquetWriter，每块一个 row group
+- feather ：Arrow IPC 文件，每块一个 record batch
+parquet / feather 需要安装 pyarrow。
+"""
+import json
+import os
+
+import pandas as pd
+
+EXCEL_MAX_ROWS = 1_048_576
+
+FORMAT_EXTENSIONS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+
+
+def format_from_path(path, default="xlsx"):
+    """按扩展名推断输出格式（.arrow / .ipc 视为 feather）"""
+    ext = os.path.splitext(str(path))[1].lower()
+    for fmt, fmt_ext in FORMAT_EXTENSIONS.items():
+        if ext == fmt_ext:
+            return fmt
+    if ext in (".arrow", ".ipc"):
+        return "feather"
+    return default
+
+
+def with_format_extension(path, fmt):
+    """把 path 的扩展名换成 fmt 对应的扩展名"""
+    return os.path.splitext(str(path))[0] + FORMAT_EXTENSIONS[fmt]
+
+
+class ExcelExporter:
+    def __init__(self, path):
+        self.path = path
+        self._writer = pd.ExcelWriter(path, engine="openpyxl")
+        self._row = 0
+        self.rows = 0
+
+    def write(self, df):
+        if self.rows + len(df) >= EXCEL_MAX_ROWS:
+            raise ValueError(f"Excel 最多 {EXCEL_MAX_ROWS} 行，请改用 --format csv/parquet/feather")
+        df = df.copy()
+        # Excel 不支持带时区的时间，写出 UTC 的本地表示
+        for name in df.columns:
+            if isinstance(df[name].dtype, pd.DatetimeTZDtype):
+                df[name] = df[name].dt.tz_localize(None)
+        header = self._row == 0
+        df.to_excel(self._writer, index=False, header=header, startrow=self._row)
+        self._row += len(df) + (1 if header else 0)
+        self.rows += len(df)
+
+    def close(self):
+        self._writer.close()
+
+
+class CsvExporter:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "w", encoding="utf-8-sig", newline="")
+        self._header = True
+        self.rows = 0
+
+    def write(self, df):
+        df.to_csv(self._f, index=False, header=self._header)
+        self._header = False
+        self.rows += len(df)
+
+    def close(self):
+        self._f.close()
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("parquet / feather 输出需要 pyarrow：pip install pyarrow")
+    return pyarrow
+
+
+def _to_json_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+# 已知列的 Arrow 类型；未列出的列按 JSON 文本存为 string
+_ARROW_BOOL_COLUMNS = {"removed", "deleted", "author_canceled_pledge", "author_blocked"}
+_ARROW_TIMESTAMP_COLUMNS = {"created_at", "pinned_at"}
+_ARROW_LIST_COLUMNS = {"author_badges"}
+
+
+class _ArrowExporter:
+    """parquet / feather 共用：按列名固定 schema，保证各块类型一致（全空的块也不会推断成 null 类型）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._pa = _require_pyarrow()
+        self._schema = None
+
+    def _field(self, name):
+        pa = self._pa
+        if name in _ARROW_BOOL_COLUMNS:
+            return pa.field(name, pa.bool_())
+        if name in _ARROW_TIMESTAMP_COLUMNS:
+            return pa.field(name, pa.timestamp("s", tz="UTC"))
+        if name in _ARROW_LIST_COLUMNS:
+            return pa.field(name, pa.list_(pa.string()))
+        return pa.field(name, pa.string())
+
+    def _table(self, df):
+        pa = self._pa
+        if self._schema is None:
+            self._schema = pa.schema([self._field(name) for name in df.columns])
+        df = df.copy()
+        for field in self._schema:
+            if pa.types.is_timestamp(field.type):
+                continue
+            # 按 object 交给 Arrow 转换（空块的列会被 pandas 推断成 float64）
+            df[field.name] = df[field.name].astype(object)
+            if pa.types.is_string(field.type):
+                # 结构不固定的值（如 author_backing）统一存为 JSON 文本
+                df[field.name] = df[field.name].map(_to_json_text)
+        return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+
+class ParquetExporter(_ArrowExporter):
+    def __init__(self, path):
+        super().__init__(path)
+        self._writer = None
+
+    def write(self, df):
+        import pyarrow.parquet as pq
+        table = self._table(df)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class FeatherExporter(_ArrowExporter):
+    def __init__(self, path):
+        super().__init__(path)
+        self._sink = None
+        self._writer = None
+
+    def write(self, df):
+        import pyarrow.ipc as ipc
+        table = self._table(df)
+        if self._writer is None:
+            self._sink = self._pa.OSFile(self.path, "wb")
+            self._writer = ipc.new_file(self._sink, table.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+
+
+EXPORTERS = {
+    "xlsx": ExcelExporter,
+    "csv": CsvExporter,
+    "parquet": ParquetExporter,
+    "feather": FeatherExporter,
+}
+
+
+def open_exporter(path, fmt=None):
+    """按 fmt（缺省按扩展名推断）创建输出器：write(df) 逐块写出，close() 收尾"""
+    fmt = fmt or format_from_path(path)
+    if fmt not in EXPORTERS:
+        raise ValueError(f"不支持的输出格式: {fmt}（可选：{', '.join(EXPORTERS)}）")
+    return EXPORTERS[fmt](path)
@@ -0,0 +1,102 @@
+# incremental.py
+"""
+增量抓取（只抓新评论）：从上一次的输出中加载已知评论的 id 与指纹，
+翻页时一旦某页的评论全部已知且未变化就停止，并把新增/变化的评论写入 delta 文件。
+评论按时间倒序返回，因此已知页之后不会再有新的顶层评论。
+"""
+import hashlib
+import json
+
+from page_store import iter_pages, open_page_writer
+
+
+# 不参与指纹的字段：replies 单独计算；parentId 由抓取端注入（回复被拆成独立 edge 时，见
+# dedup.DedupIndex.filter_new_edges / replies.replies_page），同一条回复嵌套出现时没有它
+_UNSTABLE_KEYS = ("replies", "parentId")
+
+
+def comment_fingerprint(node):
+    """单条评论的指纹（不含 replies 与 parentId），用于判断评论是否被修改/删除"""
+    fields = {k: v for k, v in node.items() if k not in _UNSTABLE_KEYS}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def iter_comment_nodes(commentable):
+    """产出 (node, parent_id)：顶层评论及其 replies.nodes（与 parser 的遍历顺序一致）"""
+    for edge in (commentable.get("comments") or {}).get("edges") or []:
+        node = edge.get("node")
+        if not node:
+            continue
+        yield node, None
+        for reply in (node.get("replies") or {}).get("nodes") or []:
+            if reply:
+                yield reply, node.get("id")
+
+
+def load_previous_comments(paths):
+    """
+    读取上一次（或多次）的输出文件，返回 (known, newest_created_at)：
+    known 为 {comment_id: fingerprint}，newest_created_at 为其中最新的 createdAt 时间戳。
+    paths 也可以是单个路径字符串。
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    known = {}
+    newest = None
+    for path in paths:
+        for page in iter_pages(path):
+            for node, _ in iter_comment_nodes(page):
+                cid = node.get("id")
+                if not cid:
+                    continue
+                known[cid] = comment_fingerprint(node)
+                created = node.get("createdAt")
+                if isinstance(created, (int, float)) and (newest is None or created > newest):
+                    newest = created
+    return known, newest
+
+
+class IncrementalState:
+    """抓取过程中的增量判断：observe() 每页调用一次，caught_up 为 True 时应停止翻页"""
+
+    def __init__(self, known, newest_created_at=None, delta_file=None):
+        self.known = known
+        self.newest_created_at = newest_created_at
+        self.delta = open_page_writer(delta_file) if delta_file else None
+        self.delta_file = delta_file
+        self.new_count = 0
+        self.changed_count = 0
+        self.caught_up = False
+
+    def observe(self, commentable):
+        """比较一页评论与已知评论；把新增/变化的评论写入 delta，返回本页新增+变化的条数"""
+        edges = []
+        for node, parent_id in iter_comment_nodes(commentable):
+            cid = node.get("id")
+            if not cid:
+                continue
+            fp = comment_fingerprint(node)
+            old = self.known.get(cid)
+            if old == fp:
+                continue
+            if old is None:
+                self.new_count += 1
+            else:
+                self.changed_count += 1
+            self.known[cid] = fp
+            # delta 中每条评论单独成为一个 edge；回复带上 parentId 以便 parser 还原层级
+            delta_node = {k: v for k, v in node.items() if k != "replies"}
+            if parent_id and not delta_node.get("parentId"):
+                delta_node["parentId"] = parent_id
+            edges.append({"node": delta_node})
+
+        if edges and self.delta is not None:
+            page_info = (commentable.get("comments") or {}).get("pageInfo") or {}
+            self.delta.append({"comments": {"edges": edges, "pageInfo": page_info}})
+        if not edges and self.known:
+            self.caught_up = True
+        return len(edges)
+
+    def close(self):
+        if self.delta is not None:
+            self.delta.close()
@@ -0,0 +1,173 @@
+# instrumentation.py
+"""
+结构化日志与分阶段计时。
+
+- log_event(logger, event, msg, level=..., **fields)：输出带事件名与字段的日志
+  （--log_format json 时每行一个 JSON 对象，text 时为可读文本）
+- Timings：按阶段（goto、challenge_wait、click_response ...）累计耗时直方图，
+  可输出运行结束摘要与 Prometheus 文本格式
+"""
+import json
+import logging
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+# 直方图分桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON：ts / level / logger / event / msg / 额外字段"""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": getattr(record, "event", None),
+            "msg": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """可读文本：时间 级别 [logger] 消息 key=value ..."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} [{record.name}] {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level="INFO", fmt="text", log_file=None):
+    """配置根 logger：fmt 为 json 或 text；log_file 为空时输出到 stderr"""
+    handler = logging.FileHandler(log_file, encoding="utf-8") if log_file else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+
+def log_event(logger, event, msg=None, level=logging.INFO, **fields):
+    """记录一个结构化事件；未达到日志级别时不做任何格式化"""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg or event, extra={"event": event, "fields": fields})
+
+
+class Histogram:
+    """
+    分桶计数 + 有界蓄水池采样：p50/p95 取自最多 reservoir_size 个均匀抽样的观测值，
+    内存不随观测次数增长（守护进程中所有任务共用一个 Timings）；观测数未超过上限时分位数是精确的。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, reservoir_size=1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reservoir_size = reservoir_size
+        self.samples = []
+        self._rng = random.Random(0)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.reservoir_size:
+            self.samples.append(value)
+        else:
+            # Algorithm R：第 n 个观测值以 k/n 的概率替换蓄水池中的一个
+            j = self._rng.randrange(self.count)
+            if j < self.reservoir_size:
+                self.samples[j] = value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Timings:
+    """分阶段计时：with timings.time("goto"): ...（在 async 函数中同样适用）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.phases = {}
+        self.counters = {}
+        self.started = time.monotonic()
+
+    def observe(self, phase, seconds):
+        hist = self.phases.get(phase)
+        if hist is None:
+            hist = self.phases[phase] = Histogram(self.buckets)
+        hist.observe(seconds)
+
+    @contextmanager
+    def time(self, phase):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - t0)
+
+    def incr(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """返回按总耗时排序的摘要 dict：{phase: {count, total, mean, p50, p95, max}}"""
+        out = {}
+        for phase, h in sorted(self.phases.items(), key=lambda kv: -kv[1].total):
+            out[phase] = {
+                "count": h.count,
+                "total": round(h.total, 4),
+                "mean": round(h.total / h.count, 4) if h.count else 0.0,
+                "p50": round(h.quantile(0.5), 4),
+                "p95": round(h.quantile(0.95), 4),
+                "max": round(h.max, 4),
+            }
+        return out
+
+    def log_summary(self, logger):
+        wall = time.monotonic() - self.started
+        log_event(logger, "timing_summary", f"运行总耗时 {wall:.2f}s", wall_seconds=round(wall, 3),
+                  counters=self.counters)
+        for phase, stats in self.summary().items():
+            log_event(logger, "timing_phase", phase, phase=phase, **stats)
+
+    def prometheus_text(self, prefix="ks_crawl"):
+        """Prometheus 文本格式：每个阶段一个 histogram，计数器为 counter"""
+        lines = [
+            f"# HELP {prefix}_phase_seconds Time spent per crawl phase.",
+            f"# TYPE {prefix}_phase_seconds histogram",
+        ]
+        for phase, h in sorted(self.phases.items()):
+            cumulative = 0
+            for upper, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{prefix}_phase_seconds_bucket{{phase="{phase}",le="{upper}"}} {cumulative}')
+            lines.append(f'{prefix}_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{phase}"}} {h.total:.6f}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{phase}"}} {h.count}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="ks_crawl"):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(prefix))
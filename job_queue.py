@@ -0,0 +1,253 @@
+# job_queue.py
+"""
+SQLite 任务队列（守护进程 / 分片模式使用）：crawl / parse 任务按优先级排队，可查询状态与结果。
+
+每个进程/线程各自打开一个 JobQueue（sqlite 连接不跨线程共享）；claim() 用 BEGIN IMMEDIATE
+保证多个连接不会领取同一个任务。
+
+分片模式下多个进程（或多台机器，队列文件放在共享存储上）共用同一个队列作为工作账本：
+- 领取时带 worker 与 lease_seconds：任务在租约到期前归该 worker 所有，worker 定期 heartbeat() 续约；
+  worker 崩溃或失联后租约过期，任务可被其他 worker 重新领取
+- fail() 时若 attempts < max_attempts 则按指数退避重新排队，否则标记为 failed
+- pause()：项目熔断（连续限流 / challenge）时重新排队并延后领取，不计入 attempts（pauses 加一）
+- 同一个项目同一时间只会被一个 worker 抓取（租约有效的 running 任务所在项目不会被再次领取）
+- run_id 把一次分片运行的任务归为一组，便于只领取/统计/合并这一组
+"""
+import json
+import sqlite3
+import time
+
+JOB_KINDS = ("crawl", "parse")
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+# 旧版本队列文件升级时补充的列
+_MIGRATIONS = (
+    ("run_id", "TEXT"),
+    ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("max_attempts", "INTEGER NOT NULL DEFAULT 1"),
+    ("worker", "TEXT"),
+    ("lease_until", "REAL"),
+    ("available_at", "REAL"),
+    ("pauses", "INTEGER NOT NULL DEFAULT 0"),
+)
+
+
+class JobQueue:
+    def __init__(self, path, journal_mode="WAL", check_same_thread=True):
+        """
+        journal_mode：本地磁盘用 WAL；队列文件在网络文件系统（NFS/SMB）上时用 DELETE（WAL 需要共享内存）。
+        check_same_thread=False 时连接可在其他线程中使用，调用方需自行保证同一时刻只有一个线程访问。
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=check_same_thread)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                project TEXT,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id);
+            """
+        )
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        for name, decl in _MIGRATIONS:
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id, status)")
+
+    def submit(self, kind, payload, priority=0, project=None, run_id=None, max_attempts=1):
+        """提交任务，返回任务 id；priority 越大越先执行，失败后最多共执行 max_attempts 次"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"未知任务类型: {kind}（可选：{', '.join(JOB_KINDS)}）")
+        cur = self._conn.execute(
+            "INSERT INTO jobs (kind, project, payload, priority, created_at, run_id, max_attempts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, project, json.dumps(payload, ensure_ascii=False), int(priority), time.time(), run_id,
+             max(1, int(max_attempts))))
+        return cur.lastrowid
+
+    def claim(self, skip_projects=(), worker=None, lease_seconds=None, run_id=None):
+        """
+        领取优先级最高、最早提交的可执行任务，没有则返回 None。
+        可执行：排队中且已过重试退避时间，或 running 但租约已过期（原 worker 失联）。
+        跳过 skip_projects 中的项目以及其他 worker 正在（租约有效地）抓取的项目。
+        lease_seconds 为空时不设租约（单进程守护模式）；run_id 非空时只领取该次运行的任务。
+        """
+        now = time.time()
+        skip = [p for p in skip_projects if p]
+        where = ("((status = 'queued' AND (available_at IS NULL OR available_at <= :now))"
+                 " OR (status = 'running' AND lease_until < :now))"
+                 " AND (project IS NULL OR project NOT IN (SELECT project FROM jobs WHERE status = 'running'"
+                 " AND project IS NOT NULL AND (lease_until IS NULL OR lease_until >= :now)))")
+        params = {"now": now}
+        if skip:
+            names = [f"skip{i}" for i in range(len(skip))]
+            where += f" AND (project IS NULL OR project NOT IN ({', '.join(':' + n for n in names)}))"
+            params.update(zip(names, skip))
+        if run_id is not None:
+            where += " AND run_id = :run_id"
+            params["run_id"] = run_id
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约过期且已用完重试次数的任务直接判为失败
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, worker = NULL, lease_until = NULL,"
+                " error = COALESCE(error, 'lease expired') "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+            row = self._conn.execute(
+                f"SELECT * FROM jobs WHERE {where} ORDER BY priority DESC, id LIMIT 1", params).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            lease_until = now + lease_seconds if lease_seconds else None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, worker = ?,"
+                " lease_until = ? WHERE id = ?", (now, worker, lease_until, row["id"]))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        job = self._to_dict(row)
+        job.update(status="running", attempts=job["attempts"] + 1, worker=worker, lease_until=lease_until)
+        return job
+
+    def heartbeat(self, job_ids, worker, lease_seconds):
+        """为 worker 仍持有的 running 任务续约，返回续约成功的任务 id 集合（不在其中的说明租约已丢失）"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return set()
+        marks = ",".join("?" * len(job_ids))
+        self._conn.execute(
+            f"UPDATE jobs SET lease_until = ? WHERE status = 'running' AND worker = ? AND id IN ({marks})",
+            [time.time() + lease_seconds, worker, *job_ids])
+        rows = self._conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'running' AND worker = ? AND id IN ({marks})", [worker, *job_ids])
+        return {r["id"] for r in rows}
+
+    def finish(self, job_id, result=None, worker=None):
+        """标记完成；给出 worker 时只有仍持有该任务的 worker 才能提交结果，返回是否生效"""
+        sql = "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, lease_until = NULL WHERE id = ?"
+        params = [time.time(), json.dumps(result, ensure_ascii=False), job_id]
+        if worker is not None:
+            sql += " AND status = 'running' AND worker = ?"
+            params.append(worker)
+        return self._conn.execute(sql, params).rowcount > 0
+
+    def fail(self, job_id, error, worker=None, retry_delay=0):
+        """
+        任务失败：还有重试次数时重新排队（退避 retry_delay * 2^(attempts-1) 秒），否则标记为 failed。
+        返回新状态（queued / failed）；worker 已不再持有该任务时返回 None。
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute("SELECT status, worker, attempts, max_attempts FROM jobs WHERE id = ?",
+                                     (job_id,)).fetchone()
+            if row is None or (worker is not None and (row["status"] != "running" or row["worker"] != worker)):
+                self._conn.execute("COMMIT")
+                return None
+            now = time.time()
+            if row["attempts"] < row["max_attempts"]:
+                status = "queued"
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, worker = NULL, lease_until = NULL,"
+                    " available_at = ? WHERE id = ?",
+                    (str(error), now + retry_delay * 2 ** max(0, row["attempts"] - 1), job_id))
+            else:
+                status = "failed"
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, lease_until = NULL WHERE id = ?",
+                    (now, str(error), job_id))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return status
+
+    def pause(self, job_id, delay, reason, worker=None):
+        """
+        熔断暂停：任务重新排队，delay 秒后才可再被领取；本次执行不计入 attempts（pauses 加一）。
+        返回是否生效；给出 worker 时只有仍持有该任务的 worker 才能暂停。
+        """
+        sql = ("UPDATE jobs SET status = 'queued', error = ?, worker = NULL, lease_until = NULL, available_at = ?,"
+               " attempts = MAX(0, attempts - 1), pauses = pauses + 1 WHERE id = ? AND status = 'running'")
+        params = [str(reason), time.time() + delay, job_id]
+        if worker is not None:
+            sql += " AND worker = ?"
+            params.append(worker)
+        return self._conn.execute(sql, params).rowcount > 0
+
+    def cancel(self, job_id):
+        """取消排队中的任务；已开始的任务无法取消，返回 False"""
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id))
+        return cur.rowcount > 0
+
+    def requeue_running(self):
+        """
+        守护进程启动时调用：上次异常退出时仍为 running 的无租约任务重新排队，返回个数。
+        带租约的任务可能属于其他仍在运行的 worker，等租约过期后由 claim() 接手。
+        """
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL, worker = NULL "
+            "WHERE status = 'running' AND lease_until IS NULL")
+        return cur.rowcount
+
+    def get(self, job_id):
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=50, run_id=None):
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if run_id is not None:
+            clauses.append("run_id = ?")
+            params.append(run_id)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn.execute(f"SELECT * FROM jobs{where} ORDER BY id DESC LIMIT ?", (*params, limit))
+        return [self._to_dict(r) for r in rows]
+
+    def counts(self, run_id=None):
+        if run_id is None:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        else:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY status", (run_id,))
+        return {r[0]: r[1] for r in rows}
+
+    def activity(self, run_id=None):
+        """
+        (租约有效的 running 任务数, 排队任务中最晚的可执行时间)：判断一次运行是否还有 worker 在推进。
+        没有租约的 running 任务（单进程守护模式）也算在执行；可执行时间未设置或已过时为 None。
+        """
+        now = time.time()
+        scope, params = ("", ()) if run_id is None else (" AND run_id = ?", (run_id,))
+        live = self._conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'running' AND (lease_until IS NULL OR lease_until >= ?)"
+            + scope, (now, *params)).fetchone()[0]
+        waiting_until = self._conn.execute(
+            "SELECT MAX(available_at) FROM jobs WHERE status = 'queued' AND available_at > ?" + scope,
+            (now, *params)).fetchone()[0]
+        return live, waiting_until
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"]) if job.get("payload") else {}
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,205 @@
+# page_store.py
+"""
+commentable 页面的读写：crawler 逐页写入，parser 逐页读取。
+
+- .jsonl：每行一个 commentable，写入后立即 flush，崩溃也只丢当前页
+- .json ：旧格式（整个列表 + indent=2），在 close() 时一次性写出；读取时流式逐页解码，不整体 json.load
+"""
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger("page_store")
+
+_SKIP_WS = re.compile(r"\s*")
+
+
+def _truncate_partial_line(path):
+    """把文件截断到最后一个完整的（以换行结尾的）行：崩溃时最后一行可能只写了一半"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            i = f.read(pos - start).rfind(b"\n")
+            if i >= 0:
+                pos = start + i + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+            logger.warning("截掉末尾不完整的行（%d 字节）: %s", end - pos, path)
+
+
+class JsonlPageWriter:
+    """逐页追加写入 JSONL，供 add_commentable 直接 append；续写（append=True）前先截掉不完整的末行"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._count = 0
+        if append and os.path.exists(path):
+            _truncate_partial_line(path)
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+
+    def append(self, commentable):
+        self._f.write(json.dumps(commentable, ensure_ascii=False))
+        self._f.write("\n")
+        self._f.flush()
+        self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonPageWriter:
+    """兼容旧的 .json 输出：内存中缓存所有页，close() 时一次性写出"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._pages = list(iter_pages(path)) if append and os.path.exists(path) else []
+        self._closed = False
+
+    def append(self, commentable):
+        self._pages.append(commentable)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self._pages, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_jsonl(path):
+    return str(path).lower().endswith(".jsonl")
+
+
+def open_page_writer(path, append=False):
+    """按扩展名选择写入器：.jsonl 流式写入，其余按旧 JSON 列表格式"""
+    return JsonlPageWriter(path, append) if is_jsonl(path) else JsonPageWriter(path, append)
+
+
+def read_last_page(path, block_size=65536):
+    """JSONL 文件最后一个完整行的 commentable（从文件末尾向前读），没有或无法解析时返回 None"""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        while pos > 0:
+            start = max(0, pos - block_size)
+            f.seek(start)
+            tail = f.read(pos - start) + tail
+            pos = start
+            # 末尾的换行之前再出现一个换行，说明最后一行已完整读入
+            if tail.rstrip(b"\n").rfind(b"\n") >= 0:
+                break
+    lines = [line for line in tail.split(b"\n") if line.strip()]
+    if not lines or not tail.endswith(b"\n"):
+        return None
+    try:
+        return json.loads(lines[-1])
+    except ValueError:
+        return None
+
+
+def _lines_before(f, stop_at):
+    """逐行产出，直到已读满 stop_at 字节"""
+    consumed = 0
+    for line in f:
+        if consumed >= stop_at:
+            return
+        consumed += len(line)
+        yield line
+
+
+def iter_pages(path, stop_at=None):
+    """
+    逐页产出 commentable（生成器）。JSONL 逐行读取；旧 JSON 列表流式逐个产出。
+    stop_at 为字节数时 JSONL 只读取前 stop_at 字节（续抓时文件中已有的页，不读之后追加的页）。
+    """
+    if is_jsonl(path):
+        with open(path, "rb") as f:
+            for line in (f if stop_at is None else _lines_before(f, stop_at)):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能写了一半，跳过即可
+                    logger.warning("跳过无法解析的行: %s", path)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        yield from iter_json_array(f)
+
+
+def iter_json_array(f, chunk_size=1 << 20):
+    """
+    流式读取顶层 JSON 列表，逐个产出元素（raw_decode 按元素解码）。
+    内存中只保留读缓冲与当前元素，而不是整个列表；元素跨越缓冲区边界时再多读一块。
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    while buf.isspace():
+        buf = f.read(chunk_size)
+    pos = _SKIP_WS.match(buf).end()
+    if buf[pos:pos + 1] != "[":
+        raise ValueError(f"不是 JSON 列表: {getattr(f, 'name', f)}")
+    pos += 1
+    expect_value = True
+    while True:
+        pos = _SKIP_WS.match(buf, pos).end()
+        if pos >= len(buf):
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError(f"JSON 列表未结束: {getattr(f, 'name', f)}")
+            buf, pos = buf[pos:] + more, 0
+            continue
+        ch = buf[pos]
+        if ch == "]":
+            return
+        if not expect_value:
+            if ch != ",":
+                raise ValueError(f"JSON 列表缺少逗号: {getattr(f, 'name', f)}")
+            pos += 1
+            expect_value = True
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buf, pos = buf[pos:] + more, 0
+            continue
+        nxt = _SKIP_WS.match(buf, end).end()
+        if buf[nxt:nxt + 1] not in (",", "]"):
+            # 元素后面还没读到分隔符（例如数字 4.5 可能只读到 "4."），多读一块再解码
+            more = f.read(chunk_size)
+            if more:
+                buf, pos = buf[pos:] + more, 0
+                continue
+        yield obj
+        pos = end
+        expect_value = False
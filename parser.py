@@ -1,61 +1,337 @@
-import json
+import collections
+import itertools
+import logging
+import math
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-from datetime import datetime, timezone
 
-def parse_edges_to_excel(input_file, output_file):
-    with open(input_file, "r", encoding="utf-8") as f:
-        pages = json.load(f)
+from exporters import open_exporter
+from instrumentation import log_event, setup_logging
+from page_store import iter_pages
+
+logger = logging.getLogger("parser")
+
+# 输出列（顺序即 DataFrame 列顺序）
+COLUMNS = [
+    "comment_id", "parent_id", "body", "created_at", "removed", "author_badges", "deleted",
+    "pinned_at", "author_canceled_pledge", "author_backing",
+    "author_id", "author_name", "author_url", "author_avatar", "author_blocked",
+]
+# 原始字段为 Unix 秒的列，建 DataFrame 时统一向量化转换
+TIMESTAMP_COLUMNS = ["created_at", "pinned_at"]
+# 作者字段：紧凑模式下放在去重的作者表里，评论行只存行号（author_ref）
+AUTHOR_COLUMNS = ["author_id", "author_name", "author_url", "author_avatar", "author_blocked"]
+
+
+def _new_columns():
+    return {name: [] for name in COLUMNS}
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class AuthorTable:
+    """
+    去重的作者表：每个不同的作者（五个字段完全相同视为同一行）只保存一份，字符串已 intern。
+    同一作者在大项目里会出现成百上千次，评论行只需保存一个整数行号。
+    """
+
+    __slots__ = ("_index", "rows")
+
+    def __init__(self):
+        self._index = {}
+        self.rows = []
+
+    def ref(self, author):
+        key = (author.get("id"), author.get("name"), author.get("url"), author.get("imageUrl"),
+               author.get("isBlocked"))
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[key] = len(self.rows)
+            self.rows.append(tuple(_intern(v) for v in key))
+        return i
+
+    def __len__(self):
+        return len(self.rows)
+
+    def expand(self, refs):
+        """按行号展开为 {列名: object ndarray}（数组里是共享的字符串引用，不复制字符串）"""
+        refs = np.frombuffer(refs, dtype=np.int64) if isinstance(refs, array) else np.asarray(refs, dtype=np.int64)
+        table = np.empty((len(self.rows), len(AUTHOR_COLUMNS)), dtype=object)
+        if self.rows:
+            table[:] = self.rows
+        return {name: table[refs, j] for j, name in enumerate(AUTHOR_COLUMNS)}
+
+
+class CompactColumns:
+    """
+    flatten_pages(compact=True) 的结果：
+    - 作者字段放在 AuthorTable 中，每行只存 author_ref（array('q')）
+    - 时间戳存为 array('d')（缺失为 NaN），不再为每行保留一个 int 对象
+    - 重复的短字符串（parent_id、徽章列表）共享同一个对象
+    to_dict() 展开为与非紧凑模式相同的 {列名: 序列}，供 build_dataframe / 评论库使用。
+    """
+
+    __slots__ = ("authors", "author_ref", "timestamps", "values")
+
+    def __init__(self, authors=None):
+        self.authors = authors if authors is not None else AuthorTable()
+        self.author_ref = array("q")
+        self.timestamps = {name: array("d") for name in TIMESTAMP_COLUMNS}
+        self.values = {name: [] for name in COLUMNS if name not in AUTHOR_COLUMNS and name not in TIMESTAMP_COLUMNS}
+
+    def __len__(self):
+        return len(self.author_ref)
+
+    def to_dict(self):
+        cols = dict(self.values)
+        for name, values in self.timestamps.items():
+            seconds = np.frombuffer(values, dtype=np.float64) if len(values) else np.empty(0)
+            # 没有缺失值时转回 int64，与非紧凑模式得到的列类型一致
+            cols[name] = seconds.astype(np.int64) if not np.isnan(seconds).any() else seconds
+        if not len(self.author_ref):
+            # 空结果与非紧凑模式一样用空列表（由 pandas 推断列类型）
+            cols.update({name: [] for name in AUTHOR_COLUMNS})
+            return cols
+        cols.update(self.authors.expand(self.author_ref))
+        # 展开的作者列是 object 数组；author_blocked 全是 bool 时转为 bool 列，与非紧凑模式（列表推断）的列类型一致
+        if pd.api.types.infer_dtype(cols["author_blocked"], skipna=False) == "boolean":
+            cols["author_blocked"] = cols["author_blocked"].astype(bool)
+        return cols
+
+
+def _timestamp(value):
+    return float(value) if type(value) in (int, float) else math.nan
 
-    all_comments = []
 
-    def safe_timestamp(ts):
-        """把时间戳转换为 datetime（UTC），无效则返回 None"""
-        try:
-            return datetime.fromtimestamp(ts)
-        except Exception:
-            return None
+def _flatten_page(page, cols):
+    """把一页 commentable 的评论（含任意深度的回复）追加到 cols"""
+    comment_id, parent, body = cols["comment_id"], cols["parent_id"], cols["body"]
+    created, removed, badges = cols["created_at"], cols["removed"], cols["author_badges"]
+    deleted, pinned, canceled = cols["deleted"], cols["pinned_at"], cols["author_canceled_pledge"]
+    backing, author_id, author_name = cols["author_backing"], cols["author_id"], cols["author_name"]
+    author_url, author_avatar, author_blocked = cols["author_url"], cols["author_avatar"], cols["author_blocked"]
 
-    def process_comment_node(node, parent_id=None):
+    edges = (page.get("comments") or {}).get("edges") or []
+    stack = [(edge.get("node"), None) for edge in reversed(edges)]
+    while stack:
+        node, parent_id = stack.pop()
         if not node:
-            return
-
-        comment = {
-            "comment_id": node.get("id"),
-            "parent_id": parent_id or node.get("parentId"),
-            "body": node.get("body"),
-            "created_at": safe_timestamp(node.get("createdAt")),
-            "removed": node.get("removedPerGuidelines"),
-            "author_badges": node.get("authorBadges"),
-            "deleted": node.get("deleted"),
-            "pinned_at": safe_timestamp(node.get("pinnedAt")),
-            "author_canceled_pledge": node.get("authorCanceledPledge"),
-            "author_backing": node.get("authorBacking"),
-        }
+            continue
+        node_id = node.get("id")
+        comment_id.append(node_id)
+        parent.append(parent_id or node.get("parentId"))
+        body.append(node.get("body"))
+        created.append(node.get("createdAt"))
+        removed.append(node.get("removedPerGuidelines"))
+        badges.append(node.get("authorBadges"))
+        deleted.append(node.get("deleted"))
+        pinned.append(node.get("pinnedAt"))
+        canceled.append(node.get("authorCanceledPledge"))
+        backing.append(node.get("authorBacking"))
 
         author = node.get("author") or {}
-        comment.update({
-            "author_id": author.get("id"),
-            "author_name": author.get("name"),
-            "author_url": author.get("url"),
-            "author_avatar": author.get("imageUrl"),
-            "author_blocked": author.get("isBlocked"),
-        })
+        author_id.append(author.get("id"))
+        author_name.append(author.get("name"))
+        author_url.append(author.get("url"))
+        author_avatar.append(author.get("imageUrl"))
+        author_blocked.append(author.get("isBlocked"))
 
-        all_comments.append(comment)
+        # 回复逆序压栈，保证按原顺序出栈
+        replies = (node.get("replies") or {}).get("nodes") or []
+        for reply_node in reversed(replies):
+            stack.append((reply_node, node_id))
 
-        # 递归解析 replies
-        for reply_node in (node.get("replies") or {}).get("nodes") or []:
-            process_comment_node(reply_node, parent_id=node.get("id"))
 
+def _flatten_page_compact(page, cols, badge_pool):
+    """_flatten_page 的紧凑版本：作者进 AuthorTable，时间戳进 array('d')，徽章列表按内容共享"""
+    values = cols.values
+    comment_id, parent, body = values["comment_id"], values["parent_id"], values["body"]
+    removed, badges, deleted = values["removed"], values["author_badges"], values["deleted"]
+    canceled, backing = values["author_canceled_pledge"], values["author_backing"]
+    created, pinned = cols.timestamps["created_at"], cols.timestamps["pinned_at"]
+    author_ref, author_table = cols.author_ref, cols.authors
+
+    edges = (page.get("comments") or {}).get("edges") or []
+    stack = [(edge.get("node"), None) for edge in reversed(edges)]
+    while stack:
+        node, parent_id = stack.pop()
+        if not node:
+            continue
+        node_id = node.get("id")
+        comment_id.append(node_id)
+        parent.append(parent_id or _intern(node.get("parentId")))
+        body.append(node.get("body"))
+        created.append(_timestamp(node.get("createdAt")))
+        removed.append(node.get("removedPerGuidelines"))
+        node_badges = node.get("authorBadges")
+        if type(node_badges) is list:
+            node_badges = badge_pool.setdefault(tuple(node_badges), node_badges)
+        badges.append(node_badges)
+        deleted.append(node.get("deleted"))
+        pinned.append(_timestamp(node.get("pinnedAt")))
+        canceled.append(node.get("authorCanceledPledge"))
+        backing.append(node.get("authorBacking"))
+        author_ref.append(author_table.ref(node.get("author") or {}))
+
+        replies = (node.get("replies") or {}).get("nodes") or []
+        for reply_node in reversed(replies):
+            stack.append((reply_node, node_id))
+
+
+def flatten_pages(pages, compact=False):
+    """
+    把 commentable 页展开为按列存放的 {列名: list}。
+    用显式栈代替递归遍历 replies（任意深度都不会触发递归上限），顺序与原先的前序递归一致。
+    时间戳保持原始数值，由 build_dataframe 统一转换。
+    compact=True 时返回 CompactColumns（作者去重、字符串共享、时间戳用数组存放），适合超大项目。
+    """
+    if compact:
+        cols, badge_pool = CompactColumns(), {}
+        for page in pages:
+            _flatten_page_compact(page, cols, badge_pool)
+        return cols
+    cols = _new_columns()
     for page in pages:
-        edges = (page.get("comments") or {}).get("edges") or []
-        for edge in edges:
-            process_comment_node(edge.get("node"))
+        _flatten_page(page, cols)
+    return cols
+
+
+def iter_column_chunks(pages, chunk_rows=100_000, compact=False):
+    """
+    与 flatten_pages 相同，但每累计约 chunk_rows 行就产出一块（按页切分，不拆开一页）。
+    compact=True 时各块共用同一个作者表，产出 CompactColumns.to_dict() 展开后的列。
+    """
+    if compact:
+        authors, badge_pool = AuthorTable(), {}
+        cols = CompactColumns(authors)
+        for page in pages:
+            _flatten_page_compact(page, cols, badge_pool)
+            if len(cols) >= chunk_rows:
+                yield cols.to_dict()
+                cols = CompactColumns(authors)
+        if len(cols):
+            yield cols.to_dict()
+        return
+    cols = _new_columns()
+    for page in pages:
+        _flatten_page(page, cols)
+        if len(cols["comment_id"]) >= chunk_rows:
+            yield cols
+            cols = _new_columns()
+    if cols["comment_id"]:
+        yield cols
+
+
+def build_dataframe(cols):
+    """由 flatten_pages 的列构建 DataFrame；时间戳一次性向量化转换为 UTC，无效值为 NaT"""
+    if isinstance(cols, CompactColumns):
+        cols = cols.to_dict()
+    df = pd.DataFrame(cols, columns=COLUMNS)
+    for name in TIMESTAMP_COLUMNS:
+        seconds = pd.to_numeric(df[name], errors="coerce")
+        df[name] = pd.to_datetime(seconds, unit="s", utc=True, errors="coerce")
+    return df
+
 
-    df = pd.DataFrame(all_comments)
-    df.to_excel(output_file, index=False)
-    print(f"[解析完成] {len(df)} 条评论已保存到 {output_file}")
+def parse_edges(input_file, output_file, fmt=None, chunk_rows=100_000, store=None, project=None, compact=False):
+    """
+    解析 JSON/JSONL 输入并按块写出到 output_file。
+    fmt 为 xlsx / csv / parquet / feather，缺省按 output_file 扩展名推断。返回写出的行数。
+    store 为 comment_store.CommentStore 时，每块同时 upsert 到评论库（project 为项目标识）。
+    compact=True 时用紧凑的列表示（见 CompactColumns），输出内容不变。
+    """
+    return export_pages(iter_pages(input_file), output_file, fmt, chunk_rows, store, project, compact)
+
+
+def export_pages(pages, output_file, fmt=None, chunk_rows=100_000, store=None, project=None, compact=False):
+    """
+    parse_edges 的主体：把 commentable 页的可迭代对象按块写出到 output_file，返回写出的行数。
+    流水线导出（export_pipeline.py）在后台线程中对抓取时的页队列调用本函数，输出与先抓后解析完全相同。
+    """
+    exporter = open_exporter(output_file, fmt)
+    try:
+        for cols in iter_column_chunks(pages, chunk_rows, compact=compact):
+            if store is not None:
+                store.upsert_columns(cols, project)
+            exporter.write(build_dataframe(cols))
+        if exporter.rows == 0:
+            # 没有评论也写出只有表头的文件
+            exporter.write(build_dataframe(_new_columns()))
+    finally:
+        exporter.close()
+    log_event(logger, "parse_done", "解析完成", rows=exporter.rows, output_file=output_file)
+    return exporter.rows
+
+
+def _parse_file(input_file, compact=False):
+    """进程池 worker：把单个输入文件解析为 DataFrame"""
+    return build_dataframe(flatten_pages(iter_pages(input_file), compact=compact))
+
+
+def _bounded_map(pool, fn, paths, window, *args):
+    """按顺序产出 (path, fn(path, *args))，同时提交到进程池的任务不超过 window 个"""
+    pending = collections.deque()
+    paths = iter(paths)
+    for path in itertools.islice(paths, window):
+        pending.append((path, pool.submit(fn, path, *args)))
+    while pending:
+        path, future = pending.popleft()
+        result = future.result()
+        for nxt in itertools.islice(paths, 1):
+            pending.append((nxt, pool.submit(fn, nxt, *args)))
+        yield path, result
+
+
+def parse_many(input_files, output_file, fmt=None, workers=None, chunk_rows=100_000, compact=False, store=None):
+    """
+    用进程池并行解析多个 JSON/JSONL 文件，按 comment_id 跨文件去重后合并写出一个文件。
+    文件按文件名排序（make_output_names 的时间戳），同一条评论以最新的文件为准；
+    从最新的文件开始逐个写出。同时最多 workers 个文件在解析或等待写出（有界窗口，按顺序取结果），
+    内存中是这些文件的 DataFrame 加上已写出的 comment_id 集合，不随文件数增长。返回写出的行数。
+    store 为 comment_store.CommentStore 时，去重后的每个文件同时 upsert 到评论库（project 按文件名推断），
+    直接使用已解析的 DataFrame，不再读第二遍原始文件。
+    """
+    files = sorted(input_files, reverse=True)
+    window = max(1, workers or os.cpu_count() or 1)
+    exporter = open_exporter(output_file, fmt)
+    seen_ids = set()
+    duplicates = 0
+    try:
+        with ProcessPoolExecutor(max_workers=window) as pool:
+            for path, df in _bounded_map(pool, _parse_file, files, window, compact):
+                ids = df["comment_id"]
+                has_id = ids.notna()
+                # 本文件内重复 + 已在更新的文件中出现过的评论都丢弃（没有 id 的行保留）
+                dup = has_id & (ids.duplicated() | ids.isin(seen_ids))
+                duplicates += int(dup.sum())
+                df = df[~dup]
+                seen_ids.update(df["comment_id"].dropna())
+                if store is not None:
+                    store.upsert_frame(df, path=path)
+                for start in range(0, len(df), chunk_rows):
+                    exporter.write(df.iloc[start:start + chunk_rows])
+                log_event(logger, "parse_merge_file", "合并", input_file=path, rows=len(df))
+        if exporter.rows == 0:
+            exporter.write(build_dataframe(_new_columns()))
+    finally:
+        exporter.close()
+    log_event(logger, "parse_done", "解析完成", files=len(files), rows=exporter.rows, duplicates=duplicates,
+              output_file=output_file)
+    return exporter.rows
+
+
+def parse_edges_to_excel(input_file, output_file):
+    """兼容旧接口：输出 Excel"""
+    return parse_edges(input_file, output_file, fmt="xlsx")
 
 if __name__ == "__main__":
     # 单独运行时的默认值
+    setup_logging()
     parse_edges_to_excel("test.json", "kickstarter_comments.xlsx")
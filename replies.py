@@ -0,0 +1,212 @@
+# replies.py
+"""
+回复展开：评论页里每条评论只带前几条回复（replies.pageInfo.hasNextPage 为 True 时不完整）。
+
+抓取过程中记录所有回复被截断的评论；翻页结束后用录制到的回复 GraphQL 请求（页面上点击一次
+"View more replies" 即可录制）并发重放，按评论逐页取完剩余回复。
+取回的回复带上 parentId，作为独立 edge 交给 add_commentable，与评论页共用同一个去重索引。
+"""
+import asyncio
+import copy
+import json
+import inspect
+import logging
+import time
+
+from instrumentation import Timings, log_event
+from resilience import RETRYABLE_KINDS, CircuitOpenError, classify_status, parse_retry_after
+
+logger = logging.getLogger("replies")
+
+# 页面上展开回复的按钮（用于录制回复请求模板）
+MORE_REPLIES_SELECTOR = 'button:has-text("more replies"), button:has-text("View replies"), button:has-text("Load replies")'
+# 回复请求中承载评论 id / 分页游标的变量名（按优先级）
+_REPLY_ID_VARIABLES = ("commentId", "id", "nodeId", "parentId")
+_REPLY_CURSOR_VARIABLES = ("nextCursor", "cursor", "after")
+
+
+def extract_replies(body):
+    """
+    从 /graph 响应中取出一条评论的回复：返回 (comment_id, replies)，不是回复响应时返回 None。
+    回复响应的 data 中是 comment / node（带 replies），而不是 commentable。
+    """
+    if not isinstance(body, (list, tuple)) or not body or not isinstance(body[0], dict):
+        return None
+    data = body[0].get("data") or {}
+    if data.get("commentable"):
+        return None
+    for key in ("comment", "node"):
+        node = data.get(key)
+        if isinstance(node, dict) and isinstance(node.get("replies"), dict):
+            return node.get("id"), node["replies"]
+    return None
+
+
+def iter_truncated_threads(commentable):
+    """产出 (comment_id, endCursor)：回复列表被截断（replies.pageInfo.hasNextPage）的顶层评论"""
+    for edge in (commentable.get("comments") or {}).get("edges") or []:
+        node = edge.get("node") or {}
+        page_info = (node.get("replies") or {}).get("pageInfo") or {}
+        if node.get("id") and page_info.get("hasNextPage"):
+            yield node["id"], page_info.get("endCursor")
+
+
+def replies_page(commentable_id, parent_id, replies):
+    """把一页回复包装成 add_commentable 可接受的 commentable（每条回复一个带 parentId 的 edge）"""
+    edges = []
+    for reply in replies.get("nodes") or []:
+        if not reply:
+            continue
+        node = dict(reply)
+        if not node.get("parentId"):
+            node["parentId"] = parent_id
+        edges.append({"node": node})
+    return {"id": commentable_id, "comments": {"edges": edges, "pageInfo": {}}}
+
+
+class ReplyExpander:
+    """收集被截断的回复线程，并用录制到的回复请求并发补全"""
+
+    def __init__(self, concurrency=4, max_pages_per_thread=50, timeout_ms=15000):
+        self.concurrency = max(1, concurrency)
+        self.max_pages_per_thread = max_pages_per_thread
+        self.timeout_ms = timeout_ms
+        self.pending = {}      # comment_id -> 下一页回复的 endCursor
+        self.template = {}     # {"url", "post_body", "headers", "id_key", "cursor_key"}
+        self.commentable_id = None
+        self.threads_expanded = 0
+        self.threads_truncated = 0   # 达到 max_pages_per_thread 时仍有下一页的线程
+        self.pages_fetched = 0
+        self.errors = 0
+
+    def observe(self, commentable):
+        """记录一页评论中回复被截断的线程"""
+        self.commentable_id = self.commentable_id or commentable.get("id")
+        for comment_id, cursor in iter_truncated_threads(commentable):
+            self.pending.setdefault(comment_id, cursor)
+
+    def record_template(self, url, post_body, headers, comment_id, replies):
+        """从页面发出的回复请求录制模板，并找出承载评论 id 与游标的变量名"""
+        if self.template or not post_body:
+            return
+        op = post_body[0] if isinstance(post_body, list) and post_body else post_body
+        variables = (op.get("variables") if isinstance(op, dict) else None) or {}
+        id_key = next((k for k, v in variables.items() if comment_id and v == comment_id), None)
+        id_key = id_key or next((k for k in _REPLY_ID_VARIABLES if k in variables), None)
+        if not id_key:
+            log_event(logger, "reply_template_unusable", "回复请求中找不到评论 id 变量", logging.WARNING,
+                      variables=sorted(variables))
+            return
+        cursor_key = next((k for k in _REPLY_CURSOR_VARIABLES if k in variables), _REPLY_CURSOR_VARIABLES[0])
+        self.template.update(url=url, post_body=post_body, headers=headers, id_key=id_key, cursor_key=cursor_key)
+        log_event(logger, "reply_template_recorded", "已录制回复 GraphQL 请求模板", id_key=id_key, cursor_key=cursor_key)
+
+    def observe_replies(self, comment_id, replies):
+        """页面自己发出的回复请求：更新该线程的游标（已取完则移出待展开列表）"""
+        page_info = replies.get("pageInfo") or {}
+        if page_info.get("hasNextPage") and page_info.get("endCursor"):
+            self.pending[comment_id] = page_info["endCursor"]
+        else:
+            self.pending.pop(comment_id, None)
+
+    def _request_body(self, comment_id, cursor):
+        payload = copy.deepcopy(self.template["post_body"])
+        for op in payload if isinstance(payload, list) else [payload]:
+            if isinstance(op, dict):
+                variables = op.get("variables") or {}
+                variables[self.template["id_key"]] = comment_id
+                variables[self.template["cursor_key"]] = cursor
+                op["variables"] = variables
+        return json.dumps(payload)
+
+    async def _expand_thread(self, context, comment_id, cursor, sem, on_page, response_cache, project, timings,
+                             guard=None):
+        async with sem:
+            pages = 0
+            while pages < self.max_pages_per_thread:
+                if guard is not None:
+                    await guard.acquire()
+                try:
+                    with timings.time("reply_request"):
+                        resp = await context.request.post(
+                            self.template["url"],
+                            data=self._request_body(comment_id, cursor),
+                            headers=self.template["headers"],
+                            timeout=self.timeout_ms,
+                        )
+                except Exception as e:
+                    if guard is None:
+                        raise
+                    await guard.failure("network", comment_id=comment_id, error=repr(e))
+                    continue
+                kind = None if resp.ok else classify_status(resp.status, resp.headers)
+                if guard is not None and kind in RETRYABLE_KINDS:
+                    # 限流 / 5xx：退避后重试同一页（连续失败过多时熔断）
+                    await guard.failure(kind, retry_after=parse_retry_after(resp.headers.get("retry-after")),
+                                        comment_id=comment_id, status=resp.status)
+                    continue
+                if not resp.ok:
+                    self.errors += 1
+                    log_event(logger, "reply_http_error", "回复请求失败", logging.WARNING,
+                              comment_id=comment_id, status=resp.status)
+                    return
+                raw = await resp.body()
+                with timings.time("json_decode"):
+                    extracted = extract_replies(json.loads(raw))
+                if extracted is None:
+                    self.errors += 1
+                    log_event(logger, "reply_bad_body", "回复响应结构不符合预期", logging.WARNING, comment_id=comment_id)
+                    return
+                if response_cache is not None:
+                    response_cache.put(project, self.template["url"], raw)
+                _, replies = extracted
+                pages += 1
+                self.pages_fetched += 1
+                if guard is not None:
+                    guard.success()
+                result = on_page(replies_page(self.commentable_id, comment_id, replies))
+                if inspect.isawaitable(result):
+                    await result
+                page_info = replies.get("pageInfo") or {}
+                if not page_info.get("hasNextPage") or not page_info.get("endCursor"):
+                    break
+                cursor = page_info["endCursor"]
+            else:
+                self.threads_truncated += 1
+                log_event(logger, "reply_thread_truncated", "回复线程达到页数上限，未完整展开", logging.WARNING,
+                          comment_id=comment_id, pages=pages, max_pages=self.max_pages_per_thread)
+                return
+            self.threads_expanded += 1
+
+    async def expand(self, context, on_page, response_cache=None, project=None, timings=None, guard=None):
+        """
+        并发补全所有被截断的线程（最多 concurrency 个同时进行，线程内按游标顺序翻页）。
+        on_page(commentable) 处理每页回复（通常是 add_commentable；可以是协程函数，等待其完成后再取下一页）。
+        返回完整展开的线程数（达到 max_pages_per_thread 的线程计入 threads_truncated）。
+        guard 为 resilience.FetchGuard 时与评论翻页共用限速与熔断；熔断后放弃剩余线程（计入 errors），
+        已取到的回复照常保存。
+        """
+        timings = timings or Timings()
+        if not self.pending:
+            return 0
+        if not self.template:
+            log_event(logger, "reply_template_missing", "未录制到回复请求，无法展开被截断的回复", logging.WARNING,
+                      threads=len(self.pending))
+            return 0
+        threads = list(self.pending.items())
+        self.pending.clear()
+        sem = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *(self._expand_thread(context, cid, cursor, sem, on_page, response_cache, project, timings, guard)
+              for cid, cursor in threads),
+            return_exceptions=True)
+        for r in results:
+            if isinstance(r, CircuitOpenError):
+                self.errors += 1
+            elif isinstance(r, Exception):
+                self.errors += 1
+                log_event(logger, "reply_error", "展开回复异常", logging.WARNING, error=repr(r))
+        log_event(logger, "replies_expanded", "回复展开完成", threads=len(threads), expanded=self.threads_expanded,
+                  truncated=self.threads_truncated, pages=self.pages_fetched, errors=self.errors, seconds=round(time.monotonic() - started, 2))
+        return self.threads_expanded
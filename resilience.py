@@ -0,0 +1,258 @@
+# resilience.py
+"""
+/graph 请求的重试、熔断与限速（crawler / replies 使用）。
+
+- classify_status：把失败分为 rate_limit（429，或不带 challenge 标记的 403）、challenge（cf-mitigated: challenge
+  或停在 challenge 页）、server（5xx）；超时 / 连接错误为 network，非 JSON 或结构不符为 bad_response；
+  点击 Load more 超时但 /graph 仍在正常返回时为 click_timeout（按钮问题，不是网络故障，不计入熔断）
+- RetryPolicy：指数退避 + jitter；rate_limit 优先按 Retry-After 等待，challenge 用更长的基数
+- TokenBucket / HostRateLimiter：按域名的令牌桶限速；被限流时速率减半，之后每次成功逐步恢复（AIMD）
+- CircuitBreaker：连续失败达到阈值（challenge 的阈值更低）时熔断，抛出 CircuitOpenError；
+  调用方暂停该项目，冷却后重新排队（批量模式在本进程重排，守护 / 分片模式交给任务队列）
+- CrawlStats：有效 pages/min、各类错误数与重试次数
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from instrumentation import Timings, log_event
+
+logger = logging.getLogger("resilience")
+
+ERROR_KINDS = ("rate_limit", "challenge", "server", "network", "bad_response", "click_timeout")
+# 计入熔断的错误类型：bad_response 多半是页面发出的其他 /graph 请求，click_timeout 是按钮没有触发请求，只重试不熔断
+BREAKER_KINDS = ("rate_limit", "challenge", "server", "network")
+# 重放请求（不经过页面）可以原地重试的错误类型；challenge 需要回到页面里处理
+RETRYABLE_KINDS = ("rate_limit", "server", "network")
+
+
+def classify_status(status, headers=None):
+    """HTTP 状态码 -> 错误类型；2xx/3xx 返回 None"""
+    headers = headers or {}
+    if (headers.get("cf-mitigated") or "").lower() == "challenge":
+        return "challenge"
+    if status == 429 or status == 403:
+        return "rate_limit"
+    if status >= 500:
+        return "server"
+    if status >= 400:
+        return "bad_response"
+    return None
+
+
+def parse_retry_after(value):
+    """Retry-After 头（秒数或 HTTP 日期）-> 秒，无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitOpenError(Exception):
+    """项目熔断：连续失败过多，应暂停 retry_after 秒后重新排队（断点续抓）"""
+
+    def __init__(self, project, kind, retry_after):
+        super().__init__(f"{project}: 连续 {kind} 错误，熔断 {retry_after:.0f}s")
+        self.project = project
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """指数退避：第 n 次连续失败等待 [cap/2, cap]，cap = min(max_delay, base * 2^(n-1))"""
+
+    def __init__(self, base_delay=1.0, max_delay=60.0, challenge_delay=15.0, rng=None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.challenge_delay = challenge_delay
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt, kind, retry_after=None):
+        if kind == "rate_limit" and retry_after is not None:
+            return min(self.max_delay, retry_after) + self._rng.uniform(0, self.base_delay)
+        base = self.challenge_delay if kind == "challenge" else self.base_delay * (2 if kind == "rate_limit" else 1)
+        cap = min(self.max_delay, base * 2 ** max(0, attempt - 1))
+        return self._rng.uniform(cap / 2, cap)
+
+
+class TokenBucket:
+    """令牌桶：平均 rate 个请求/秒，允许 burst 个突发；rate <= 0 时不限速"""
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        self.max_rate = float(rate or 0)
+        self.rate = self.max_rate
+        self.min_rate = min_rate if min_rate is not None else self.max_rate / 8
+        self.burst = burst or max(1.0, self.max_rate)
+        self.tokens = self.burst
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """取一个令牌，必要时等待；返回等待秒数"""
+        if self.max_rate <= 0:
+            return 0.0
+        async with self._lock:
+            self._refill()
+            wait = 0.0
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+            self.waited += wait
+            return wait
+
+    def penalize(self, factor=0.5):
+        """被限流：速率乘以 factor（不低于 min_rate），并清空突发额度"""
+        if self.max_rate > 0:
+            self.rate = max(self.min_rate, self.rate * factor)
+            self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        """请求成功：速率每次恢复 max_rate 的 5%"""
+        if self.max_rate > 0 and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class HostRateLimiter:
+    """按域名分配令牌桶（同一进程内的所有项目共用）"""
+
+    def __init__(self, rate_per_host=0.0, burst=None):
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self._buckets = {}
+
+    def bucket(self, url):
+        host = urlparse(url).netloc or url
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return bucket
+
+
+class CircuitBreaker:
+    """连续失败计数：任意可熔断错误达到 failure_threshold，或 challenge 达到 challenge_threshold 时熔断"""
+
+    def __init__(self, failure_threshold=5, challenge_threshold=2, cooldown_seconds=300):
+        self.failure_threshold = max(1, failure_threshold)
+        self.challenge_threshold = max(1, challenge_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.challenges = 0
+        self.trips = 0
+
+    def success(self):
+        self.failures = 0
+        self.challenges = 0
+
+    def failure(self, kind):
+        """记录一次失败，返回是否应熔断"""
+        if kind not in BREAKER_KINDS:
+            return False
+        self.failures += 1
+        if kind == "challenge":
+            self.challenges += 1
+        tripped = self.failures >= self.failure_threshold or self.challenges >= self.challenge_threshold
+        if tripped:
+            self.trips += 1
+        return tripped
+
+
+class CrawlStats:
+    """有效吞吐与错误统计（批量模式下多个项目可共用一个）；paused 为熔断后重新排队的次数（由调用方记录）"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.pages = 0
+        self.retries = 0
+        self.paused = 0
+        self.errors = {}
+
+    def page(self, n=1):
+        self.pages += n
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other):
+        """把一个项目的统计累加进来（起始时间不变，pages/min 按本对象的起点计算）"""
+        self.pages += other.pages
+        self.retries += other.retries
+        self.paused += other.paused
+        for kind, n in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + n
+
+    def pages_per_minute(self):
+        minutes = (time.monotonic() - self.started) / 60
+        return self.pages / minutes if minutes > 0 else 0.0
+
+    def fields(self):
+        return {"pages": self.pages, "pages_per_minute": round(self.pages_per_minute(), 1),
+                "retries": self.retries, "paused": self.paused, "errors": dict(self.errors)}
+
+
+class FetchGuard:
+    """
+    一个项目的 /graph 请求守卫：请求前按域名限速，失败时记录、退避并判断是否熔断。
+    crawl_page 的点击路径、replay_comments 与 ReplyExpander 共用。
+    """
+
+    def __init__(self, project, bucket=None, policy=None, breaker=None, stats=None, timings=None):
+        self.project = project
+        self.bucket = bucket or TokenBucket(0)
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = stats or CrawlStats()
+        self.timings = timings or Timings()
+        self.consecutive = 0
+
+    async def acquire(self):
+        waited = await self.bucket.acquire()
+        if waited:
+            self.timings.observe("rate_wait", waited)
+        return waited
+
+    def success(self, pages=1):
+        self.consecutive = 0
+        self.breaker.success()
+        self.bucket.reward()
+        self.stats.page(pages)
+        self.timings.incr("graph_pages", pages)
+
+    async def failure(self, kind, retry_after=None, **fields):
+        """
+        记录一次失败并退避；连续失败达到熔断阈值时抛出 CircuitOpenError（不再等待）。
+        返回实际等待的秒数。
+        """
+        self.consecutive += 1
+        self.stats.error(kind)
+        self.timings.incr(f"graph_errors_{kind}")
+        if kind == "rate_limit":
+            self.bucket.penalize()
+        if self.breaker.failure(kind):
+            self.timings.incr("circuit_open")
+            log_event(logger, "circuit_open", "连续失败过多，暂停该项目", logging.WARNING, project=self.project,
+                      kind=kind, failures=self.breaker.failures, cooldown=self.breaker.cooldown_seconds)
+            raise CircuitOpenError(self.project, kind, self.breaker.cooldown_seconds)
+        delay = self.policy.delay(self.consecutive, kind, retry_after)
+        log_event(logger, "fetch_retry", "请求失败，退避后重试", logging.WARNING, project=self.project, kind=kind,
+                  retry=self.consecutive, delay=round(delay, 2), **fields)
+        self.stats.retries += 1
+        with self.timings.time("retry_backoff"):
+            await asyncio.sleep(delay)
+        return delay
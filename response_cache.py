@@ -0,0 +1,137 @@
+# response_cache.py
+"""
+原始 /graph 响应的磁盘缓存（录制 / 重放）。
+
+- 内容寻址：按响应原始字节的 SHA-256 存为 objects/<前两位>/<hash>.gz（gzip 压缩），相同响应只存一份
+- index.sqlite 记录每次抓取（run）中各项目按顺序捕获的响应，以及每个对象的大小与最近访问时间
+- 总大小超过 max_bytes 时按最近访问时间淘汰（LRU），被淘汰对象的捕获记录一并删除
+- 多个进程（分片 worker）可共用一个缓存目录：对象用 INSERT OR IGNORE 登记，总大小与淘汰以索引中的
+  SUM(size) 为准（淘汰在写锁内重新统计），不依赖单个进程的计数
+
+重放（crawler.replay_from_cache）按捕获顺序把响应重新送入 add_commentable 与解析流程，不需要浏览器。
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+import uuid
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, compresslevel=6):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self.run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        self._seq = {}
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        # 分片模式下多个进程共用同一个缓存目录，写锁冲突时等待而不是立即报错
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+                hash TEXT PRIMARY KEY, size INTEGER, raw_size INTEGER, last_access REAL);
+            CREATE TABLE IF NOT EXISTS captures (
+                run_id TEXT, project TEXT, seq INTEGER, url TEXT, hash TEXT, captured_at REAL,
+                PRIMARY KEY (run_id, project, seq));
+            CREATE INDEX IF NOT EXISTS captures_project ON captures (project, captured_at);
+            CREATE INDEX IF NOT EXISTS objects_lru ON objects (last_access);
+            """
+        )
+        self._conn.commit()
+        self.total_bytes = self._total_bytes()
+
+    def _object_path(self, h):
+        return os.path.join(self.cache_dir, "objects", h[:2], h + ".gz")
+
+    def put(self, project, url, raw):
+        """记录一条捕获的响应（raw 为 bytes），返回内容哈希；已存在的对象只刷新访问时间"""
+        h = hashlib.sha256(raw).hexdigest()
+        now = time.time()
+        seq = self._seq.get(project, 0)
+        self._seq[project] = seq + 1
+        path = self._object_path(h)
+        if not os.path.exists(path):
+            # 内容寻址，先写对象文件（原子替换）再登记；多个进程同时写同一对象时结果相同
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(raw, compresslevel=self.compresslevel))
+            os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._conn:
+            # INSERT OR IGNORE：多个进程共用缓存目录时，检查与插入不会竞争出唯一键冲突
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO objects (hash, size, raw_size, last_access) VALUES (?, ?, ?, ?)",
+                (h, size, len(raw), now))
+            if cur.rowcount == 0:
+                self._conn.execute("UPDATE objects SET last_access = ? WHERE hash = ?", (now, h))
+            self._conn.execute(
+                "INSERT INTO captures (run_id, project, seq, url, hash, captured_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.run_id, project, seq, url, h, now))
+            # 总大小以索引为准（包括其他进程写入的对象）
+            self.total_bytes = self._total_bytes()
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        return h
+
+    def _total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def get(self, h):
+        """按哈希读取原始字节（已被淘汰时返回 None），并刷新访问时间"""
+        try:
+            with open(self._object_path(h), "rb") as f:
+                raw = gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        with self._conn:
+            self._conn.execute("UPDATE objects SET last_access = ? WHERE hash = ?", (time.time(), h))
+        return raw
+
+    def evict(self, target_bytes=None):
+        """按 LRU 淘汰对象，直到总大小不超过 target_bytes（默认 max_bytes 的 90%），返回淘汰个数"""
+        target = self.max_bytes * 0.9 if target_bytes is None else target_bytes
+        evicted = 0
+        with self._conn:
+            # 先取得写锁再读总大小与 LRU 顺序：其他进程可能刚写入或已淘汰了一部分
+            self._conn.execute("BEGIN IMMEDIATE")
+            total = self._total_bytes()
+            rows = self._conn.execute("SELECT hash, size FROM objects ORDER BY last_access").fetchall()
+            for h, size in rows:
+                if total <= target:
+                    break
+                try:
+                    os.remove(self._object_path(h))
+                except FileNotFoundError:
+                    pass
+                self._conn.execute("DELETE FROM objects WHERE hash = ?", (h,))
+                self._conn.execute("DELETE FROM captures WHERE hash = ?", (h,))
+                total -= size
+                evicted += 1
+        self.total_bytes = total
+        return evicted
+
+    def projects(self):
+        return [r[0] for r in self._conn.execute("SELECT DISTINCT project FROM captures ORDER BY project")]
+
+    def iter_captures(self, project, since=None):
+        """按捕获顺序（run 时间、run 内序号）产出 (url, raw)；since 为时间戳，只取之后的捕获"""
+        rows = self._conn.execute(
+            "SELECT url, hash FROM captures WHERE project = ? AND captured_at >= ? "
+            "ORDER BY captured_at, run_id, seq",
+            (project, since or 0)).fetchall()
+        for url, h in rows:
+            raw = self.get(h)
+            if raw is not None:
+                yield url, raw
+
+    def stats(self):
+        objects, size, raw_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(raw_size), 0) FROM objects").fetchone()
+        captures = self._conn.execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+        return {"objects": objects, "captures": captures, "bytes": size, "raw_bytes": raw_size}
+
+    def close(self):
+        self._conn.close()
@@ -1,25 +1,58 @@
 # run.py
 import argparse
 import asyncio
+import glob
+import json
+import logging
 import os
 import sys
+import time
 import yaml
 from datetime import datetime
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List
 
-# try import crawler.run_crawler and parser.parse_edges_to_excel
+# try import crawler.run_crawler and parser.parse_edges
 try:
-    from crawler import run_crawler
+    from crawler import run_crawler, run_batch, project_slug, replay_from_cache
 except Exception as e:
     run_crawler = None
+    run_batch = None
+    project_slug = None
+    replay_from_cache = None
     _crawler_import_error = e
 
 try:
-    from parser import parse_edges_to_excel
+    from parser import parse_edges, parse_many
+    from export_pipeline import ExportPipeline
 except Exception as e:
-    parse_edges_to_excel = None
+    parse_edges = None
+    parse_many = None
+    ExportPipeline = None
     _parser_import_error = e
 
+from instrumentation import Timings, log_event, setup_logging
+from job_queue import JobQueue
+from response_cache import ResponseCache
+
+LOG_FORMATS = ("text", "json")
+
+logger = logging.getLogger("run")
+
+# 启动时作为 effective_config 事件输出的配置项
+EFFECTIVE_CONFIG_FIELDS = (
+    "comments_page", "max_clicks", "click_timeout_ms", "initial_wait_ms", "headless", "window_width",
+    "window_height", "scroll_min", "scroll_max", "scroll_sleep_min", "scroll_sleep_max", "direct_graphql",
+    "checkpoint_dir", "resume", "block_resources", "expand_replies", "reply_concurrency", "rate_per_host",
+    "retry_base_delay", "retry_max_delay", "circuit_failures", "circuit_cooldown_seconds", "max_pauses",
+    "session_dir", "session_ttl_minutes", "warm_contexts", "store_db", "compact_parse", "pipeline_export",
+    "pipeline_queue_pages", "response_cache_dir", "response_cache_max_mb", "log_level", "log_format",
+    "metrics_file",
+)
+
+
+# 解析输出格式（扩展名与格式名相同，见 exporters.py）
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet", "feather")
+
 
 def load_config(path: str = "config.yaml") -> Dict[str, Any]:
     if os.path.exists(path):
@@ -38,8 +71,10 @@ def parse_args() -> argparse.Namespace:
                    help="覆盖配置中的 comments_page（即要爬取的评论页面 URL）")
 
     # run_crawler 需要的参数（命令行覆盖）
-    p.add_argument("--output_json", type=str, help="覆盖配置：输出 JSON 文件名（可不带 .json）")
-    p.add_argument("--output_excel", type=str, help="覆盖配置：输出 Excel 文件名（.xlsx）")  # <-- 新增
+    p.add_argument("--output_json", type=str, help="覆盖配置：输出文件名（.jsonl 逐页流式写入，.json 为旧的整体列表格式；不带扩展名时为 .jsonl）")
+    p.add_argument("--output_excel", type=str, help="覆盖配置：解析输出文件名（.xlsx/.csv/.parquet/.feather）")
+    p.add_argument("--format", dest="output_format", type=str, choices=OUTPUT_FORMATS,
+                   help="覆盖配置：解析输出格式（缺省按输出文件扩展名推断，默认 xlsx）")
     p.add_argument("--max_clicks", type=int, help="覆盖配置：最大点击次数")
     p.add_argument("--click_timeout_ms", type=int, help="覆盖配置：点击等待超时 毫秒")
     p.add_argument("--initial_wait_ms", type=int, help="覆盖配置：初始等待 毫秒")
@@ -53,34 +88,162 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--scroll_sleep_min", type=float, help="滚动间隔最小秒数")
     p.add_argument("--scroll_sleep_max", type=float, help="滚动间隔最大秒数")
 
+    # 翻页方式
+    p.add_argument("--direct_graphql", type=str, choices=["true", "false"],
+                   help="覆盖配置：录制评论 GraphQL 请求后直接重放翻页（true/false），失败时回退到点击")
+
     # 解析控制
     p.add_argument("--no-parse", action="store_true", help="只爬取 JSON，不解析导出 Excel")
     p.add_argument("--parse-only", action="store_true", help="只解析已有 JSON（跳过爬取）")
     p.add_argument("--input_json", type=str, help="parse-only 模式或解析指定输入 JSON 文件")
+    p.add_argument("--input_glob", type=str, nargs="+",
+                   help="parse-only 多文件模式：glob 或目录（目录取其中的 .json/.jsonl），并行解析并按 comment_id 去重合并")
+    p.add_argument("--workers", type=int, help="多文件解析的进程数（默认 CPU 核数）")
     p.add_argument("--no-timestamp", action="store_true", help="不要在输出文件名上加时间戳")
+    p.add_argument("--compact", type=str, choices=["true", "false"],
+                   help="覆盖配置：紧凑解析（作者表去重、字符串共享、时间戳数组），超大项目降低峰值内存，输出不变")
+    p.add_argument("--store_db", type=str,
+                   help="覆盖配置：解析时同时 upsert 到本地评论库（SQLite），用 comment_store.py query 跨抓取查询")
+    p.add_argument("--pipeline", dest="pipeline_export", type=str, choices=["true", "false"],
+                   help="覆盖配置：边抓边解析导出（有界队列 + 后台导出线程），抓取结束即有结果文件，输出与先抓后解析相同")
+    p.add_argument("--pipeline_queue_pages", type=int, help="覆盖配置：流水线导出队列最多缓存的页数（背压上限）")
+
+    # 回复展开
+    p.add_argument("--expand_replies", type=str, choices=["true", "false"],
+                   help="覆盖配置：翻页结束后并发补全被截断的回复线程（true/false）")
+    p.add_argument("--reply_concurrency", type=int, help="覆盖配置：同时展开的回复线程数")
+
+    # 精简页面模式（拦截图片/媒体/字体/统计请求）
+    p.add_argument("--block_resources", type=str, choices=["true", "false"],
+                   help="覆盖配置：是否拦截图片/媒体/字体与统计请求（true/false）")
+
+    # 断点续爬
+    p.add_argument("--resume", action="store_true", help="从上次中断的断点继续（沿用上次输出文件，跳过已抓取的页）")
+    p.add_argument("--checkpoint_dir", type=str, help="覆盖配置：断点文件目录（每个项目一个 .sqlite）")
+
+    # 增量抓取（只抓新评论）
+    p.add_argument("--incremental_from", type=str, nargs="+",
+                   help="增量模式：上一次（或多次）的输出文件；翻到全部已知评论的页即停止")
+    p.add_argument("--delta_file", type=str, help="增量模式：新增/变化评论的输出文件（默认 <输出名>_delta.jsonl）")
+
+    # 批量模式（一个浏览器并发抓取多个项目）
+    p.add_argument("--batch", action="store_true", help="批量模式：抓取 config.yaml 中 batch_urls 列出的所有项目")
+    p.add_argument("--urls_file", type=str, help="批量模式：从文件读取 URL 列表（每行一个，# 开头为注释），隐含 --batch")
+    p.add_argument("--concurrency", type=int, help="批量模式：同时抓取的项目数")
+    p.add_argument("--per_host_concurrency", type=int, help="批量模式：同一域名的最大并发数")
+    p.add_argument("--output_dir", type=str, help="批量模式：每个项目结果文件的输出目录")
+
+    # 原始响应缓存（录制 / 无浏览器重放）
+    p.add_argument("--response_cache", dest="response_cache_dir", type=str,
+                   help="覆盖配置：原始 /graph 响应缓存目录（抓取时录制；--replay_cache 时从中读取）")
+    p.add_argument("--response_cache_max_mb", type=int, help="覆盖配置：缓存大小上限（MB），超出按 LRU 淘汰")
+    p.add_argument("--replay_cache", action="store_true",
+                   help="重放模式：不启动浏览器，把缓存中的响应重新去重、写出并解析（输出到 output_dir）")
+    p.add_argument("--replay_projects", type=str, nargs="+",
+                   help="重放模式：只重放这些项目（<creator>_<project>，默认缓存中的全部项目）")
+    p.add_argument("--replay_since_days", type=float, help="重放模式：只重放最近 N 天的捕获")
+
+    # 守护进程与任务队列
+    p.add_argument("--daemon", action="store_true",
+                   help="守护进程模式：常驻浏览器，从任务队列领取 crawl/parse 任务（并发数为 --concurrency）")
+    p.add_argument("--submit", action="store_true",
+                   help="把当前 URL（或 --batch/--urls_file 的全部 URL）作为 crawl 任务提交到队列；"
+                        "配合 --parse-only --input_json/--input_glob 时提交 parse 任务")
+    p.add_argument("--priority", type=int, default=0, help="--submit 的任务优先级（越大越先执行）")
+    p.add_argument("--job_status", type=str, nargs="?", const="",
+                   help="查看任务：指定任务 id，或不带值列出最近的任务")
+    p.add_argument("--queue_db", type=str, help="覆盖配置：任务队列 SQLite 文件")
+    p.add_argument("--daemon_port", type=int, help="覆盖配置：守护进程 HTTP 接口端口（0 为不开启）")
+    p.add_argument("--project_interval", dest="project_interval_seconds", type=float,
+                   help="覆盖配置：同一项目两次抓取开始之间的最小间隔（秒）")
+
+    # 分片抓取（多进程 / 多机器共用 queue_db 作为工作账本）
+    p.add_argument("--sharded", action="store_true",
+                   help="分片模式：把 URL 列表作为一次运行提交到 queue_db，启动 shard_processes 个 worker 进程抓取，结束后合并")
+    p.add_argument("--worker", action="store_true",
+                   help="作为 worker 加入分片运行（配合 --run_id；其他机器上 queue_db 与 output_dir 需在共享存储上）")
+    p.add_argument("--shard_processes", type=int, help="覆盖配置：本机 worker 进程数（0 为只提交并等待其他机器）")
+    p.add_argument("--run_id", type=str, help="分片运行标识（--sharded 默认按时间生成；--worker 只领取该运行的任务）")
+    p.add_argument("--lease_seconds", type=float, help="覆盖配置：任务租约时长（秒），worker 失联超过该时间后任务被重新领取")
+    p.add_argument("--max_attempts", dest="job_max_attempts", type=int, help="覆盖配置：每个任务最多执行次数（含重试）")
+
+    # 重试、熔断与限速（/graph 请求）
+    p.add_argument("--rate_per_host", type=float, help="覆盖配置：每个域名的 /graph 请求速率上限（次/秒，0 为不限）")
+    p.add_argument("--retry_base_delay", type=float, help="覆盖配置：失败重试的退避基数（秒，指数增长并加 jitter）")
+    p.add_argument("--retry_max_delay", type=float, help="覆盖配置：单次退避的上限（秒）")
+    p.add_argument("--circuit_failures", type=int, help="覆盖配置：连续失败多少次熔断（challenge 为 2 次）")
+    p.add_argument("--circuit_cooldown", dest="circuit_cooldown_seconds", type=float,
+                   help="覆盖配置：熔断后项目暂停的秒数，之后重新排队续抓")
+    p.add_argument("--max_pauses", type=int, help="覆盖配置：每个项目最多熔断暂停几次，之后判为失败")
+
+    # 会话复用（跳过已通过的 JS challenge）
+    p.add_argument("--session_dir", type=str, help="覆盖配置：按域名保存浏览器会话（cookie/clearance）的目录，留空不保存")
+    p.add_argument("--session_ttl_minutes", type=float, help="覆盖配置：保存的会话有效期（分钟）")
+    p.add_argument("--warm_contexts", type=int, help="覆盖配置：批量模式下每个域名保留的热 context 数")
+
+    # 日志与计时
+    p.add_argument("--log_level", type=str, help="覆盖配置：日志级别（DEBUG/INFO/WARNING/ERROR），DEBUG 时输出每次点击的细节")
+    p.add_argument("--log_format", type=str, choices=LOG_FORMATS, help="覆盖配置：日志格式，json 为每行一个 JSON 对象")
+    p.add_argument("--log_file", type=str, help="覆盖配置：日志输出文件（默认 stderr）")
+    p.add_argument("--metrics_file", type=str, help="覆盖配置：结束时把各阶段耗时直方图写成 Prometheus 文本格式")
+    p.add_argument("--timing_summary", type=str, choices=["true", "false"],
+                   help="覆盖配置：结束时输出各阶段耗时摘要（true/false）")
 
     return p.parse_args()
 
 
+def load_urls_file(path: str) -> List[str]:
+    """读取 URL 列表文件：每行一个 URL，空行与 # 开头的行忽略"""
+    urls = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                urls.append(line)
+    return urls
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """展开 glob / 目录为输入文件列表（目录取其中的 .json 与 .jsonl），去重并排序"""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for ext in ("*.json", "*.jsonl"):
+                files.update(glob.glob(os.path.join(pattern, ext)))
+        else:
+            files.update(glob.glob(pattern))
+    return sorted(f for f in files if os.path.isfile(f))
+
+
 def str_to_bool(s: Optional[str], default: bool) -> bool:
     if s is None:
         return default
     return s.lower() == "true"
 
 
-def make_output_names(base_json: str, add_ts: bool = True) -> Tuple[str, str]:
-    """返回 (json_file, excel_file)"""
+def make_output_names(base_json: str, add_ts: bool = True, fmt: str = "xlsx") -> Tuple[str, str]:
+    """返回 (json_file, output_file)；保留 .json / .jsonl 扩展名（缺省 .jsonl），output_file 按 fmt 取扩展名"""
+    root, ext = os.path.splitext(base_json)
+    if ext.lower() not in (".json", ".jsonl"):
+        root, ext = base_json, ".jsonl"
     if add_ts:
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        if base_json.endswith(".json"):
-            json_file = base_json.replace(".json", f"_{ts}.json")
-        else:
-            json_file = f"{base_json}_{ts}.json"
-    else:
-        json_file = base_json if base_json.endswith(".json") else f"{base_json}.json"
+        root = f"{root}_{ts}"
+
+    json_file = f"{root}{ext}"
+    output_file = f"{root}.{fmt}"
+    return json_file, output_file
 
-    excel_file = json_file.replace(".json", ".xlsx")
-    return json_file, excel_file
+
+def resolve_output_format(output_file: str, fmt: Optional[str]) -> Tuple[str, str]:
+    """返回 (output_file, fmt)：指定了 fmt 时改写扩展名，否则按扩展名推断（默认 xlsx）"""
+    root, ext = os.path.splitext(output_file)
+    if fmt:
+        return f"{root}.{fmt}", fmt
+    ext = ext.lower().lstrip(".")
+    if ext in OUTPUT_FORMATS:
+        return output_file, ext
+    return f"{output_file}.xlsx", "xlsx"
 
 
 def ensure_crawler_available():
@@ -91,8 +254,8 @@ def ensure_crawler_available():
 
 
 def ensure_parser_available():
-    if parse_edges_to_excel is None:
-        print("错误：无法导入 parser.parse_edges_to_excel。请确保 parser.py 在项目根目录，且包含 parse_edges_to_excel 函数。")
+    if parse_edges is None:
+        print("错误：无法导入 parser.parse_edges。请确保 parser.py 在项目根目录，且包含 parse_edges 函数。")
         print("导入错误详情：", repr(_parser_import_error))
         sys.exit(1)
 
@@ -104,8 +267,9 @@ def build_effective_config(args: argparse.Namespace, cfg: Dict[str, Any]) -> Dic
     """
     defaults = {
         "comments_page": "https://www.kickstarter.com",
-        "output_json": "kickstarter_comments.json",
+        "output_json": "kickstarter_comments.jsonl",
         "output_excel": "kickstarter_comments.xlsx",
+        "output_format": None,
         "max_clicks": 30,
         "click_timeout_ms": 15000,
         "initial_wait_ms": 6000,
@@ -117,6 +281,46 @@ def build_effective_config(args: argparse.Namespace, cfg: Dict[str, Any]) -> Dic
         "scroll_sleep_min": 0.1,
         "scroll_sleep_max": 0.4,
         "append_timestamp": True,
+        "direct_graphql": False,
+        "checkpoint_dir": "checkpoints",
+        "block_resources": True,
+        "block_resource_types": None,
+        "block_url_patterns": None,
+        "allow_url_patterns": None,
+        "batch_urls": [],
+        "concurrency": 4,
+        "per_host_concurrency": 2,
+        "output_dir": "outputs",
+        "log_level": "INFO",
+        "log_format": "text",
+        "log_file": None,
+        "metrics_file": None,
+        "timing_summary": True,
+        "response_cache_dir": None,
+        "response_cache_max_mb": 2048,
+        "session_dir": "sessions",
+        "session_ttl_minutes": 30,
+        "warm_contexts": 1,
+        "expand_replies": False,
+        "reply_concurrency": 4,
+        "compact_parse": False,
+        "store_db": None,
+        "pipeline_export": False,
+        "pipeline_queue_pages": 64,
+        "queue_db": "jobs.sqlite",
+        "daemon_port": 8787,
+        "project_interval_seconds": 0,
+        "shard_processes": 2,
+        "lease_seconds": 120,
+        "job_max_attempts": 3,
+        "retry_delay_seconds": 30,
+        "queue_journal_mode": "WAL",
+        "rate_per_host": 0,
+        "retry_base_delay": 1.0,
+        "retry_max_delay": 60.0,
+        "circuit_failures": 5,
+        "circuit_cooldown_seconds": 300,
+        "max_pauses": 2,
     }
 
     eff = {**defaults, **(cfg or {})}
@@ -132,6 +336,8 @@ def build_effective_config(args: argparse.Namespace, cfg: Dict[str, Any]) -> Dic
         eff["output_json"] = args.output_json
     if getattr(args, "output_excel", None):
         eff["output_excel"] = args.output_excel
+    if getattr(args, "output_format", None):
+        eff["output_format"] = args.output_format
 
     # numeric overrides
     if getattr(args, "max_clicks", None) is not None:
@@ -158,36 +364,222 @@ def build_effective_config(args: argparse.Namespace, cfg: Dict[str, Any]) -> Dic
     if getattr(args, "scroll_sleep_max", None) is not None:
         eff["scroll_sleep_max"] = args.scroll_sleep_max
 
+    eff["direct_graphql"] = str_to_bool(getattr(args, "direct_graphql", None), bool(eff.get("direct_graphql", False)))
+
+    eff["compact_parse"] = str_to_bool(getattr(args, "compact", None), bool(eff.get("compact_parse", False)))
+    eff["expand_replies"] = str_to_bool(getattr(args, "expand_replies", None), bool(eff.get("expand_replies", False)))
+    if getattr(args, "reply_concurrency", None) is not None:
+        eff["reply_concurrency"] = args.reply_concurrency
+
+    eff["block_resources"] = str_to_bool(getattr(args, "block_resources", None), bool(eff.get("block_resources", True)))
+
+    if getattr(args, "checkpoint_dir", None):
+        eff["checkpoint_dir"] = args.checkpoint_dir
+    eff["resume"] = bool(getattr(args, "resume", False))
+
+    # batch overrides
+    if getattr(args, "urls_file", None):
+        eff["batch_urls"] = load_urls_file(args.urls_file)
+    eff["batch"] = bool(getattr(args, "batch", False) or getattr(args, "urls_file", None))
+    if getattr(args, "concurrency", None) is not None:
+        eff["concurrency"] = args.concurrency
+    if getattr(args, "per_host_concurrency", None) is not None:
+        eff["per_host_concurrency"] = args.per_host_concurrency
+    if getattr(args, "output_dir", None):
+        eff["output_dir"] = args.output_dir
+
+    # response cache overrides
+    if getattr(args, "response_cache_dir", None):
+        eff["response_cache_dir"] = args.response_cache_dir
+    if getattr(args, "response_cache_max_mb", None) is not None:
+        eff["response_cache_max_mb"] = args.response_cache_max_mb
+
+    if getattr(args, "store_db", None):
+        eff["store_db"] = args.store_db
+    eff["pipeline_export"] = str_to_bool(getattr(args, "pipeline_export", None),
+                                         bool(eff.get("pipeline_export", False)))
+    if getattr(args, "pipeline_queue_pages", None) is not None:
+        eff["pipeline_queue_pages"] = args.pipeline_queue_pages
+
+    # daemon / queue overrides
+    if getattr(args, "queue_db", None):
+        eff["queue_db"] = args.queue_db
+    if getattr(args, "daemon_port", None) is not None:
+        eff["daemon_port"] = args.daemon_port
+    if getattr(args, "project_interval_seconds", None) is not None:
+        eff["project_interval_seconds"] = args.project_interval_seconds
+    for key in ("shard_processes", "lease_seconds", "job_max_attempts"):
+        if getattr(args, key, None) is not None:
+            eff[key] = getattr(args, key)
+
+    # retry / circuit breaker / rate overrides
+    for key in ("rate_per_host", "retry_base_delay", "retry_max_delay", "circuit_failures",
+                "circuit_cooldown_seconds", "max_pauses"):
+        if getattr(args, key, None) is not None:
+            eff[key] = getattr(args, key)
+
+    # session overrides
+    if getattr(args, "session_dir", None):
+        eff["session_dir"] = args.session_dir
+    if getattr(args, "session_ttl_minutes", None) is not None:
+        eff["session_ttl_minutes"] = args.session_ttl_minutes
+    if getattr(args, "warm_contexts", None) is not None:
+        eff["warm_contexts"] = args.warm_contexts
+
+    # logging / metrics overrides
+    for key in ("log_level", "log_format", "log_file", "metrics_file"):
+        if getattr(args, key, None):
+            eff[key] = getattr(args, key)
+    eff["timing_summary"] = str_to_bool(getattr(args, "timing_summary", None), bool(eff.get("timing_summary", True)))
+
     # timestamp flag
     eff["append_timestamp"] = (not args.no_timestamp) and bool(eff.get("append_timestamp", True))
 
     return eff
 
 
+def crawl_options(eff: Dict[str, Any]) -> Dict[str, Any]:
+    """批量模式与守护进程共用的 crawl_page 参数"""
+    keys = ("max_clicks", "click_timeout_ms", "initial_wait_ms", "scroll_min", "scroll_max",
+            "scroll_sleep_min", "scroll_sleep_max", "direct_graphql", "resume", "block_resources",
+            "block_resource_types", "block_url_patterns", "allow_url_patterns", "expand_replies",
+            "reply_concurrency", "retry_base_delay", "retry_max_delay", "circuit_failures",
+            "circuit_cooldown_seconds")
+    return {k: eff[k] for k in keys}
+
+
+def daemon_options(eff: Dict[str, Any], output_format: str) -> Dict[str, Any]:
+    """守护进程与分片 worker 共用的 CrawlDaemon 参数（不含 response_cache / timings 等进程内对象）"""
+    return dict(
+        concurrency=eff["concurrency"],
+        per_host_concurrency=eff["per_host_concurrency"],
+        project_interval_seconds=eff["project_interval_seconds"],
+        output_dir=eff["output_dir"],
+        output_format=output_format,
+        checkpoint_dir=eff["checkpoint_dir"],
+        headless=eff["headless"],
+        window_width=eff["window_width"],
+        window_height=eff["window_height"],
+        session_dir=eff["session_dir"],
+        session_ttl_seconds=eff["session_ttl_minutes"] * 60,
+        warm_contexts=eff["warm_contexts"],
+        store_db=eff["store_db"],
+        queue_journal_mode=eff["queue_journal_mode"],
+        rate_per_host=eff["rate_per_host"],
+        max_pauses=eff["max_pauses"],
+        pipeline_export=eff["pipeline_export"],
+        pipeline_queue_pages=eff["pipeline_queue_pages"],
+        **crawl_options(eff),
+    )
+
+
+def shard_worker_options(eff: Dict[str, Any], output_format: str) -> Dict[str, Any]:
+    """分片 worker 进程的参数（可跨进程传递）：日志与缓存在子进程内重新打开"""
+    return dict(
+        daemon_options(eff, output_format),
+        lease_seconds=eff["lease_seconds"],
+        retry_delay_seconds=eff["retry_delay_seconds"],
+        log_settings={"level": eff["log_level"], "fmt": eff["log_format"], "log_file": eff["log_file"]},
+        response_cache_dir=eff["response_cache_dir"],
+        response_cache_max_mb=int(eff["response_cache_max_mb"]),
+    )
+
+
+def print_jobs(queue: JobQueue, job_id: str):
+    if job_id:
+        job = queue.get(int(job_id))
+        print(json.dumps(job, ensure_ascii=False, indent=2, default=str) if job else f"任务不存在: {job_id}")
+        return
+    print(f"任务统计: {queue.counts()}")
+    for job in queue.list(limit=20):
+        target = job["payload"].get("url") or job["payload"].get("input_json")
+        print(f"#{job['id']:<5} {job['kind']:<6} {job['status']:<9} p={job['priority']:<3} {target}"
+              + (f"  run={job['run_id']} attempts={job['attempts']}/{job['max_attempts']}" if job.get("run_id") else "")
+              + (f"  error={job['error']}" if job.get("error") else ""))
+
+
+def open_response_cache(eff: Dict[str, Any]) -> Optional[ResponseCache]:
+    if not eff.get("response_cache_dir"):
+        return None
+    return ResponseCache(eff["response_cache_dir"], max_bytes=int(eff["response_cache_max_mb"]) * 1024 * 1024)
+
+
+def open_comment_store(eff: Dict[str, Any]):
+    if not eff.get("store_db"):
+        return None
+    from comment_store import CommentStore
+    return CommentStore(eff["store_db"])
+
+
+def report_timings(timings: Timings, eff: Dict[str, Any]):
+    """输出阶段耗时摘要，并按需写出 Prometheus 指标文件"""
+    if eff.get("timing_summary"):
+        timings.log_summary(logging.getLogger("timing"))
+    if eff.get("metrics_file"):
+        timings.write_prometheus(eff["metrics_file"])
+        print(f"指标已写出: {eff['metrics_file']}")
+
+
 if __name__ == "__main__":
     args = parse_args()
     cfg = load_config(args.config)
 
     eff = build_effective_config(args, cfg)
+    setup_logging(eff["log_level"], eff["log_format"], eff["log_file"])
+    timings = Timings()
+
+    json_file, output_file_default = make_output_names(
+        eff["output_json"], add_ts=eff["append_timestamp"], fmt=eff.get("output_format") or "xlsx")
+    # 优先级：命令行 --output_excel > config.yaml output_excel > 根据 json 生成的默认文件名
+    output_excel = args.output_excel or eff.get("output_excel") or output_file_default
+    output_excel, output_format = resolve_output_format(output_excel, eff.get("output_format"))
+
+    # visibility：生效配置作为一条结构化事件输出（--log_format json 时与其他日志同为一行 JSON）
+    log_event(logger, "effective_config", "生效配置", config_file=args.config, output_json=json_file,
+              output_file=output_excel, output_format=output_format,
+              **{key: eff[key] for key in EFFECTIVE_CONFIG_FIELDS})
+
+    # 任务队列：查看状态 / 提交任务（不启动浏览器）
+    if args.job_status is not None:
+        queue = JobQueue(eff["queue_db"], eff["queue_journal_mode"])
+        print_jobs(queue, args.job_status)
+        queue.close()
+        sys.exit(0)
+
+    if args.submit:
+        from daemon import submit_job
+        queue = JobQueue(eff["queue_db"], eff["queue_journal_mode"])
+        if args.parse_only:
+            inputs = expand_inputs(args.input_glob) if args.input_glob else [args.input_json or json_file]
+            job_ids = [submit_job(queue, "parse", {"input_json": inputs, "output_file": output_excel,
+                                                   "format": output_format, "workers": args.workers,
+                                                   "compact": eff["compact_parse"]},
+                                  priority=args.priority, max_attempts=eff["job_max_attempts"])]
+        else:
+            urls = eff.get("batch_urls") if eff["batch"] else [eff["comments_page"]]
+            job_ids = [submit_job(queue, "crawl", {"url": u, "parse": not args.no_parse, "format": output_format},
+                                  priority=args.priority, max_attempts=eff["job_max_attempts"]) for u in urls or []]
+        queue.close()
+        print(f"已提交 {len(job_ids)} 个任务到 {eff['queue_db']}: {job_ids}")
+        sys.exit(0)
 
-    json_file, excel_file_default = make_output_names(eff["output_json"], add_ts=eff["append_timestamp"])
-    # 优先级：命令行 --output_excel > config.yaml output_excel > 根据 json 生成的默认 excel 文件名
-    output_excel = args.output_excel or eff.get("output_excel") or excel_file_default
-
-    # visibility
-    print("=== 生效配置 ===")
-    print(f"config file: {args.config}")
-    print(f"comments_page(url): {eff['comments_page']}")
-    print(f"output json (with ts if enabled): {json_file}")
-    print(f"output excel: {output_excel}")
-    print(f"max_clicks: {eff['max_clicks']}")
-    print(f"click_timeout_ms: {eff['click_timeout_ms']}")
-    print(f"initial_wait_ms: {eff['initial_wait_ms']}")
-    print(f"headless: {eff['headless']}")
-    print(f"window_width: {eff['window_width']}, window_height: {eff['window_height']}")
-    print(f"scroll_min: {eff['scroll_min']}, scroll_max: {eff['scroll_max']}")
-    print(f"scroll_sleep_min: {eff['scroll_sleep_min']}, scroll_sleep_max: {eff['scroll_sleep_max']}")
-    print("=================")
+    # parse-only 多文件模式：进程池并行解析并合并
+    if args.parse_only and args.input_glob:
+        input_files = expand_inputs(args.input_glob)
+        if not input_files:
+            print(f"[错误] 没有匹配的输入文件：{args.input_glob}")
+            sys.exit(1)
+        ensure_parser_available()
+        print(f"解析（parse-only，{len(input_files)} 个文件，workers={args.workers or os.cpu_count()}）-> {output_excel}")
+        store = open_comment_store(eff)
+        # 配置了评论库时合并的同时写入（同一条评论以最新的文件为准），不再重新读取每个文件
+        parse_many(input_files, output_excel, fmt=output_format, workers=args.workers, compact=eff["compact_parse"],
+                   store=store)
+        if store is not None:
+            store.close()
+            print(f"[评论库] 已写入 {eff['store_db']}")
+        print("解析完成。")
+        sys.exit(0)
 
     # parse-only 模式：只解析
     if args.parse_only:
@@ -197,14 +589,216 @@ if __name__ == "__main__":
             sys.exit(1)
         ensure_parser_available()
         print(f"解析（parse-only）: {input_json} -> {output_excel}")
-        parse_edges_to_excel(input_json, output_excel)
+        from comment_store import project_from_filename
+        store = open_comment_store(eff)
+        parse_edges(input_json, output_excel, fmt=output_format, store=store, compact=eff["compact_parse"],
+                    project=project_from_filename(input_json))
+        if store is not None:
+            store.close()
         print("解析完成。")
         sys.exit(0)
 
+    # 分片模式：提交一次运行，本机启动多个 worker 进程（其他机器可用 --worker 加入），结束后合并
+    if args.sharded:
+        urls = (eff.get("batch_urls") or []) if eff["batch"] else [eff["comments_page"]]
+        if args.run_id and not (eff["batch"] or args.comments_page):
+            urls = []   # 只给了 --run_id：加入已有运行并负责合并，不重复提交
+        ensure_crawler_available()
+        ensure_parser_available()
+        from sharding import RunStalledError, run_sharded
+        print(f"分片模式：{len(urls)} 个项目，{eff['shard_processes']} 个本机 worker 进程 × concurrency "
+              f"{eff['concurrency']}，账本 {eff['queue_db']}")
+        try:
+            run_id, rows, counts = run_sharded(
+                urls,
+                queue_path=eff["queue_db"],
+                processes=eff["shard_processes"],
+                run_id=args.run_id,
+                max_attempts=eff["job_max_attempts"],
+                output_file=None if args.no_parse else output_excel,
+                fmt=output_format,
+                parse_workers=args.workers,
+                compact=eff["compact_parse"],
+                **shard_worker_options(eff, output_format),
+            )
+        except RunStalledError as e:
+            print(f"[错误] {e}。未合并；可用 --sharded --run_id {e.run_id} 重新加入该运行（启动 worker，结束后合并）。")
+            sys.exit(1)
+        print(f"运行 {run_id}: {counts}" + ("" if args.no_parse else f"，合并 {rows} 条 -> {output_excel}"))
+        sys.exit(0 if not counts.get("failed") and not counts.get("queued") else 1)
+
+    if args.worker:
+        ensure_crawler_available()
+        from sharding import run_worker
+        options = shard_worker_options(eff, output_format)
+        run_worker(eff["queue_db"], run_id=args.run_id, **options)
+        sys.exit(0)
+
+    response_cache = open_response_cache(eff)
+
+    # 守护进程模式：常驻浏览器，持续执行队列中的任务，直到 Ctrl+C / SIGTERM
+    if args.daemon:
+        from daemon import CrawlDaemon
+        daemon = CrawlDaemon(
+            queue_path=eff["queue_db"],
+            http_port=eff["daemon_port"],
+            response_cache=response_cache,
+            timings=timings,
+            **daemon_options(eff, output_format),
+        )
+        try:
+            asyncio.run(daemon.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if response_cache is not None:
+                response_cache.close()
+            report_timings(timings, eff)
+        sys.exit(0)
+
+    # 重放模式：从原始响应缓存重建每个项目的结果文件并解析（不启动浏览器）
+    if args.replay_cache:
+        if response_cache is None:
+            print("[错误] 重放模式需要缓存目录：请在 config.yaml 设置 response_cache_dir 或使用 --response_cache。")
+            sys.exit(1)
+        ensure_crawler_available()
+        projects = args.replay_projects or response_cache.projects()
+        if not projects:
+            print(f"[错误] 缓存中没有任何捕获：{eff['response_cache_dir']}")
+            sys.exit(1)
+        since = time.time() - args.replay_since_days * 86400 if args.replay_since_days else None
+        os.makedirs(eff["output_dir"], exist_ok=True)
+        ts = f"_{datetime.now().strftime('%Y%m%d_%H%M%S')}" if eff["append_timestamp"] else ""
+        replayed = []
+        for slug in projects:
+            project_json = os.path.join(eff["output_dir"], f"{slug}_replay{ts}.jsonl")
+            pages = replay_from_cache(response_cache, slug, project_json, since=since, timings=timings)
+            print(f"重放 {slug}: {pages} pages -> {project_json}")
+            replayed.append(project_json)
+        response_cache.close()
+        report_timings(timings, eff)
+        if args.no_parse:
+            sys.exit(0)
+        ensure_parser_available()
+        store = open_comment_store(eff)
+        for slug, project_json in zip(projects, replayed):
+            project_output = f"{os.path.splitext(project_json)[0]}.{output_format}"
+            print(f"开始解析: {project_json} -> {project_output}")
+            parse_edges(project_json, project_output, fmt=output_format, store=store, project=slug,
+                        compact=eff["compact_parse"])
+        if store is not None:
+            store.close()
+        print("全部完成。")
+        sys.exit(0)
+
+    # 批量模式：一个浏览器内并发抓取多个项目，每个项目一个结果文件
+    if eff["batch"]:
+        urls = eff.get("batch_urls") or []
+        if not urls:
+            print("[错误] 批量模式需要 URL 列表：请在 config.yaml 设置 batch_urls 或使用 --urls_file。")
+            sys.exit(1)
+        ensure_crawler_available()
+        pipelined = eff["pipeline_export"] and not args.no_parse
+        if pipelined:
+            ensure_parser_available()
+        print(f"批量模式：{len(urls)} 个项目，concurrency={eff['concurrency']}, "
+              f"per_host_concurrency={eff['per_host_concurrency']}, output_dir={eff['output_dir']}")
+        try:
+            results = asyncio.run(
+                run_batch(
+                    urls,
+                    output_dir=eff["output_dir"],
+                    concurrency=eff["concurrency"],
+                    per_host_concurrency=eff["per_host_concurrency"],
+                    append_timestamp=eff["append_timestamp"],
+                    checkpoint_dir=eff["checkpoint_dir"],
+                    headless=eff["headless"],
+                    window_width=eff["window_width"],
+                    window_height=eff["window_height"],
+                    max_clicks=eff["max_clicks"],
+                    click_timeout_ms=eff["click_timeout_ms"],
+                    initial_wait_ms=eff["initial_wait_ms"],
+                    scroll_min=eff["scroll_min"],
+                    scroll_max=eff["scroll_max"],
+                    scroll_sleep_min=eff["scroll_sleep_min"],
+                    scroll_sleep_max=eff["scroll_sleep_max"],
+                    direct_graphql=eff["direct_graphql"],
+                    resume=eff["resume"],
+                    block_resources=eff["block_resources"],
+                    block_resource_types=eff["block_resource_types"],
+                    block_url_patterns=eff["block_url_patterns"],
+                    allow_url_patterns=eff["allow_url_patterns"],
+                    expand_replies=eff["expand_replies"],
+                    reply_concurrency=eff["reply_concurrency"],
+                    rate_per_host=eff["rate_per_host"],
+                    retry_base_delay=eff["retry_base_delay"],
+                    retry_max_delay=eff["retry_max_delay"],
+                    circuit_failures=eff["circuit_failures"],
+                    circuit_cooldown_seconds=eff["circuit_cooldown_seconds"],
+                    max_pauses=eff["max_pauses"],
+                    pipeline_format=output_format if pipelined else None,
+                    pipeline_compact=eff["compact_parse"],
+                    pipeline_store_db=eff["store_db"],
+                    pipeline_queue_pages=eff["pipeline_queue_pages"],
+                    timings=timings,
+                    response_cache=response_cache,
+                    session_dir=eff["session_dir"],
+                    session_ttl_seconds=eff["session_ttl_minutes"] * 60,
+                    warm_contexts=eff["warm_contexts"],
+                )
+            )
+        except KeyboardInterrupt:
+            print("\n[中断] 用户取消运行。")
+            sys.exit(1)
+        finally:
+            if response_cache is not None:
+                response_cache.close()
+        report_timings(timings, eff)
+
+        if args.no_parse:
+            print("[提示] 已选择 --no-parse（只爬取不解析）。")
+            sys.exit(0)
+        if pipelined:
+            # 已边抓边导出，失败的项目没有结果文件
+            print("全部完成。")
+            sys.exit(0)
+
+        ensure_parser_available()
+        store = open_comment_store(eff)
+        for url, project_json in results.items():
+            if not project_json:
+                continue
+            project_output = f"{os.path.splitext(project_json)[0]}.{output_format}"
+            print(f"开始解析: {project_json} -> {project_output}")
+            parse_edges(project_json, project_output, fmt=output_format, store=store, project=project_slug(url),
+                        compact=eff["compact_parse"])
+        if store is not None:
+            store.close()
+        print("全部完成。")
+        sys.exit(0)
+
     # 正常流程：先爬取（除非用户指定只解析）
     ensure_crawler_available()
+    delta_file = None
+    if args.incremental_from:
+        missing = [p for p in args.incremental_from if not os.path.exists(p)]
+        if missing:
+            print(f"[错误] 增量模式的输入文件不存在：{missing}")
+            sys.exit(1)
+        delta_file = args.delta_file or f"{os.path.splitext(json_file)[0]}_delta.jsonl"
+        print(f"incremental_from: {args.incremental_from} -> delta: {delta_file}")
+
+    checkpoint_file = None
+    if eff.get("checkpoint_dir"):
+        checkpoint_file = os.path.join(eff["checkpoint_dir"], project_slug(eff["comments_page"]) + ".sqlite")
+    export = None
+    if eff["pipeline_export"] and not args.no_parse:
+        ensure_parser_available()
+        export = ExportPipeline(output_file=output_excel, fmt=output_format, compact=eff["compact_parse"],
+                                store_db=eff["store_db"], queue_pages=eff["pipeline_queue_pages"])
     try:
-        asyncio.run(
+        # --resume 时 run_crawler 会返回上次的输出文件
+        json_file = asyncio.run(
             run_crawler(
                 url=eff["comments_page"],
                 output_file=json_file,
@@ -218,14 +812,40 @@ if __name__ == "__main__":
                 scroll_max=eff["scroll_max"],
                 scroll_sleep_min=eff["scroll_sleep_min"],
                 scroll_sleep_max=eff["scroll_sleep_max"],
+                direct_graphql=eff["direct_graphql"],
+                checkpoint_file=checkpoint_file,
+                resume=eff["resume"],
+                incremental_from=args.incremental_from,
+                delta_file=delta_file,
+                block_resources=eff["block_resources"],
+                block_resource_types=eff["block_resource_types"],
+                block_url_patterns=eff["block_url_patterns"],
+                allow_url_patterns=eff["allow_url_patterns"],
+                timings=timings,
+                response_cache=response_cache,
+                session_dir=eff["session_dir"],
+                session_ttl_seconds=eff["session_ttl_minutes"] * 60,
+                expand_replies=eff["expand_replies"],
+                reply_concurrency=eff["reply_concurrency"],
+                rate_per_host=eff["rate_per_host"],
+                retry_base_delay=eff["retry_base_delay"],
+                retry_max_delay=eff["retry_max_delay"],
+                circuit_failures=eff["circuit_failures"],
+                circuit_cooldown_seconds=eff["circuit_cooldown_seconds"],
+                max_pauses=eff["max_pauses"],
+                export=export,
             )
         )
     except KeyboardInterrupt:
-        print("\n[中断] 用户取消运行。")
+        print("\n[中断] 用户取消运行。可使用 --resume 从断点继续。")
         sys.exit(1)
     except Exception as e:
         print("运行爬虫时发生未处理异常：", repr(e))
         raise
+    finally:
+        if response_cache is not None:
+            response_cache.close()
+        report_timings(timings, eff)
 
     print(f"爬取完成，JSON 保存到: {json_file}")
 
@@ -234,8 +854,17 @@ if __name__ == "__main__":
         print("[提示] 已选择 --no-parse（只爬取不解析）。")
         sys.exit(0)
 
+    if export is not None:
+        print(f"边抓边导出完成: {export.rows} 条 -> {export.output_file}")
+        print("全部完成。")
+        sys.exit(0)
+
     # 否则调用 parser
     ensure_parser_available()
     print(f"开始解析: {json_file} -> {output_excel}")
-    parse_edges_to_excel(json_file, output_excel)
+    store = open_comment_store(eff)
+    parse_edges(json_file, output_excel, fmt=output_format, store=store, project=project_slug(eff["comments_page"]),
+                compact=eff["compact_parse"])
+    if store is not None:
+        store.close()
     print("全部完成。")
@@ -0,0 +1,166 @@
+# session_pool.py
+"""
+浏览器会话池：按域名保存并复用 storage_state（cookie、cf_clearance 等），避免每次抓取都重新通过 JS challenge。
+
+- 每个域名一个 <session_dir>/<host>.json，记录 saved_at 与 storage_state；超过 ttl 或 cf_clearance 已过期即视为失效
+- 项目抓取成功后保存最新的 storage_state，并把 context 留在池中（每个域名最多 warm_contexts 个）供下一个项目直接使用
+- 复用的会话在 goto 后仍遇到 challenge 页时记为过期；抓取失败的会话直接丢弃（删除保存的状态并关闭 context）
+"""
+import json
+import logging
+import os
+import time
+from urllib.parse import urlparse
+
+from instrumentation import log_event
+
+logger = logging.getLogger("session_pool")
+
+# Cloudflare challenge 页的特征
+CHALLENGE_TITLES = ("just a moment", "attention required", "请稍候")
+CHALLENGE_SELECTOR = '#challenge-form, #cf-challenge-running, iframe[src*="challenges.cloudflare.com"]'
+CLEARANCE_COOKIES = ("cf_clearance",)
+
+
+async def is_challenge_page(page, response=None):
+    """判断当前页是否停在 Cloudflare challenge（响应头 cf-mitigated、标题或 challenge 表单）"""
+    try:
+        if response is not None and (response.headers.get("cf-mitigated") or "").lower() == "challenge":
+            return True
+        title = (await page.title() or "").lower()
+        if any(t in title for t in CHALLENGE_TITLES):
+            return True
+        return await page.query_selector(CHALLENGE_SELECTOR) is not None
+    except Exception:
+        return False
+
+
+def _clearance_expired(storage_state, now):
+    for cookie in storage_state.get("cookies") or []:
+        if cookie.get("name") in CLEARANCE_COOKIES:
+            expires = cookie.get("expires")
+            if isinstance(expires, (int, float)) and 0 < expires < now:
+                return True
+    return False
+
+
+class Session:
+    """池中取出的一个会话：context 与来源信息；crawl_page 在遇到 challenge 时设置 challenged"""
+
+    def __init__(self, host, context, reused=False, created_at=None):
+        self.host = host
+        self.context = context
+        self.reused = reused
+        self.created_at = created_at or time.time()
+        self.challenged = False
+
+
+class SessionPool:
+    def __init__(self, browser, session_dir="sessions", ttl_seconds=1800, warm_contexts=1):
+        self.browser = browser
+        self.session_dir = session_dir
+        self.ttl_seconds = ttl_seconds
+        self.warm_contexts = warm_contexts
+        self._warm = {}   # host -> [Session]
+        self.stats = {"warm_hits": 0, "state_hits": 0, "fresh": 0, "expired": 0, "discarded": 0}
+        if session_dir:
+            os.makedirs(session_dir, exist_ok=True)
+
+    def _state_path(self, host):
+        return os.path.join(self.session_dir, host.replace(":", "_") + ".json")
+
+    def load_state(self, host):
+        """读取未过期的 storage_state；过期或损坏时删除文件并返回 None"""
+        if not self.session_dir:
+            return None
+        path = self._state_path(host)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self.discard_state(host)
+            return None
+        now = time.time()
+        state = saved.get("storage_state") or {}
+        if now - saved.get("saved_at", 0) > self.ttl_seconds or _clearance_expired(state, now):
+            self.stats["expired"] += 1
+            log_event(logger, "session_expired", "保存的会话已过期", host=host,
+                      age=round(now - saved.get("saved_at", 0), 1))
+            self.discard_state(host)
+            return None
+        return state
+
+    async def save_state(self, session):
+        if not self.session_dir:
+            return
+        state = await session.context.storage_state()
+        path = self._state_path(session.host)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.time(), "storage_state": state}, f)
+        os.replace(tmp, path)
+
+    def discard_state(self, host):
+        if self.session_dir:
+            try:
+                os.remove(self._state_path(host))
+            except FileNotFoundError:
+                pass
+
+    async def acquire(self, url):
+        """取一个会话：优先池中的热 context，其次用保存的 storage_state 新建，最后新建空 context"""
+        host = urlparse(url).netloc
+        warm = self._warm.get(host) or []
+        while warm:
+            session = warm.pop()
+            if time.time() - session.created_at <= self.ttl_seconds:
+                self.stats["warm_hits"] += 1
+                session.reused = True
+                session.challenged = False
+                return session
+            await session.context.close()
+        state = self.load_state(host)
+        if state is not None:
+            self.stats["state_hits"] += 1
+            return Session(host, await self.browser.new_context(storage_state=state), reused=True)
+        self.stats["fresh"] += 1
+        return Session(host, await self.browser.new_context())
+
+    async def release(self, session, ok=True):
+        """
+        归还会话：ok 时保存 storage_state，并在池未满时保留 context；
+        否则（抓取失败）删除保存的状态并关闭 context。
+        """
+        if session.reused and session.challenged:
+            log_event(logger, "session_challenged", "复用的会话仍遇到 challenge，视为过期", logging.WARNING,
+                      host=session.host)
+            self.stats["expired"] += 1
+        if not ok:
+            self.stats["discarded"] += 1
+            self.discard_state(session.host)
+            await session.context.close()
+            return
+        try:
+            await self.save_state(session)
+        except Exception as e:
+            log_event(logger, "session_save_error", "保存会话失败", logging.WARNING,
+                      host=session.host, error=repr(e))
+        warm = self._warm.setdefault(session.host, [])
+        if len(warm) < self.warm_contexts:
+            # 关闭残留页面，只保留 context（cookie 与缓存）
+            for page in list(session.context.pages):
+                await page.close()
+            if session.challenged:
+                session.created_at = time.time()
+            warm.append(session)
+        else:
+            await session.context.close()
+
+    async def close(self):
+        for sessions in self._warm.values():
+            for session in sessions:
+                await session.context.close()
+        self._warm.clear()
+        log_event(logger, "session_pool_stats", "会话池统计", **self.stats)
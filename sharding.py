@@ -0,0 +1,174 @@
+# sharding.py
+"""
+分片抓取：把一批项目 URL 作为一次运行（run_id）提交到共享的 SQLite 工作账本（job_queue.py），
+启动多个 worker 进程领取执行（每个进程一个浏览器与事件循环，哈希 / JSON 解码分摊到多个核），
+全部结束后用 parse_many 按 comment_id 去重合并为一个文件。
+
+- 每个 worker 是一个 exit_when_idle 的 CrawlDaemon：领取任务时加租约并定期续约；进程崩溃或失联后
+  租约过期，任务由其他 worker 接手；失败的任务按 max_attempts 指数退避重试
+- 其他机器加入同一次运行：把 queue_db 与 output_dir 放在共享存储上（网络文件系统上 queue_journal_mode
+  用 DELETE），在该机器上执行
+    python run.py --worker --run_id <run_id> --queue_db /mnt/shared/jobs.sqlite --output_dir /mnt/shared/outputs
+- 扩容只需修改 shard_processes（本机 worker 进程数）或在更多机器上启动 --worker
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from instrumentation import Timings, log_event, setup_logging
+from job_queue import JobQueue
+
+logger = logging.getLogger("sharding")
+
+
+def new_run_id():
+    return time.strftime("run_%Y%m%d_%H%M%S")
+
+
+def submit_run(queue, urls, run_id, max_attempts=3, priority=0):
+    """把 URL 列表作为一次运行提交（只抓取不解析，解析在合并时统一做），返回任务 id 列表"""
+    from daemon import submit_job
+    return [submit_job(queue, "crawl", {"url": url, "parse": False}, priority=priority, run_id=run_id,
+                       max_attempts=max_attempts) for url in urls]
+
+
+def run_worker(queue_path, run_id=None, log_settings=None, response_cache_dir=None, response_cache_max_mb=2048,
+               **daemon_kwargs):
+    """
+    worker 进程入口（也用于 run.py --worker）：领取 run_id 的任务直到该次运行全部结束。
+    response_cache 在进程内打开（sqlite 连接不能跨进程传递）。
+    """
+    from daemon import CrawlDaemon
+    from response_cache import ResponseCache
+
+    if log_settings:
+        setup_logging(**log_settings)
+    response_cache = (ResponseCache(response_cache_dir, max_bytes=response_cache_max_mb * 1024 * 1024)
+                      if response_cache_dir else None)
+    timings = Timings()
+    daemon_kwargs.setdefault("lease_seconds", 120)
+    daemon = CrawlDaemon(queue_path=queue_path, run_id=run_id, exit_when_idle=True, http_port=0,
+                         response_cache=response_cache, timings=timings, **daemon_kwargs)
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if response_cache is not None:
+            response_cache.close()
+        timings.log_summary(logger)
+
+
+class RunStalledError(Exception):
+    """运行还有未完成的任务，但已没有 worker 在执行（本机 worker 全部退出，也没有有效租约）"""
+
+    def __init__(self, run_id, counts):
+        super().__init__(f"{run_id}: 仍有未完成的任务 {counts}，但没有存活的 worker")
+        self.run_id = run_id
+        self.counts = counts
+
+
+def wait_for_run(queue, run_id, poll_interval=2.0, stall_seconds=None):
+    """
+    等待一次运行的任务全部结束（包括其他机器上的 worker），返回各状态计数。
+    stall_seconds 不为 None 时：仍有排队 / 进行中的任务，但没有租约有效的任务、也没有在等重试时间的任务，
+    持续 stall_seconds 秒（其他 worker 足以领取它们）后抛出 RunStalledError，而不是把未完成的运行当作结束。
+    """
+    idle_since = None
+    while True:
+        counts = queue.counts(run_id)
+        if not counts.get("queued") and not counts.get("running"):
+            return counts
+        if stall_seconds is not None:
+            live, waiting_until = queue.activity(run_id)
+            now = time.time()
+            if live or waiting_until:
+                idle_since = None
+            elif idle_since is None:
+                idle_since = now
+            elif now - idle_since >= stall_seconds:
+                raise RunStalledError(run_id, counts)
+        time.sleep(poll_interval)
+
+
+def merge_run(queue, run_id, output_file, fmt=None, workers=None, compact=False):
+    """把一次运行中已完成任务的输出合并为 output_file，返回 (行数, 输入文件列表)"""
+    from parser import parse_many
+
+    jobs = queue.list(status="done", run_id=run_id, limit=1_000_000)
+    inputs = [job["result"]["output_file"] for job in jobs if (job.get("result") or {}).get("output_file")]
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        log_event(logger, "merge_missing_outputs", "部分输出文件在本机不可见（output_dir 需要放在共享存储上）",
+                  logging.WARNING, missing=missing)
+        inputs = [path for path in inputs if path not in missing]
+    if not inputs:
+        return 0, []
+    return parse_many(inputs, output_file, fmt=fmt, workers=workers, compact=compact), inputs
+
+
+def run_sharded(
+    urls,
+    queue_path="jobs.sqlite",
+    processes=2,
+    run_id=None,
+    max_attempts=3,
+    output_file=None,
+    fmt=None,
+    parse_workers=None,
+    compact=False,
+    queue_journal_mode="WAL",
+    poll_interval=2.0,
+    **worker_kwargs,
+):
+    """
+    提交一次分片运行并在本机启动 processes 个 worker 进程（0 则只等待其他机器上的 worker），
+    等待全部任务结束后合并结果。urls 为空时加入已有的 run_id（不重复提交）。
+    本机 worker 全部退出后仍有任务未完成且无人接手时抛出 RunStalledError（不合并）。
+    返回 (run_id, 合并后的行数, 各状态计数)。
+    """
+    run_id = run_id or new_run_id()
+    queue = JobQueue(queue_path, queue_journal_mode)
+    try:
+        job_ids = submit_run(queue, urls, run_id, max_attempts=max_attempts) if urls else []
+        log_event(logger, "run_submitted", "已提交分片运行", run_id=run_id, jobs=len(job_ids), processes=processes)
+
+        # spawn：子进程重新导入模块，不继承父进程的事件循环与 sqlite 连接
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=run_worker, name=f"shard-{i}",
+                             args=(queue_path, run_id),
+                             kwargs={**worker_kwargs, "queue_journal_mode": queue_journal_mode})
+                 for i in range(max(0, processes))]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            while proc.is_alive():
+                try:
+                    proc.join()
+                except KeyboardInterrupt:
+                    # Ctrl+C 同时发给了子进程，它们会完成进行中的任务后退出
+                    log_event(logger, "run_interrupted", "收到中断，等待 worker 退出", run_id=run_id)
+            if proc.exitcode:
+                log_event(logger, "worker_exit", "worker 异常退出，其任务将在租约过期后由其他 worker 接手",
+                          logging.WARNING, worker=proc.name, exitcode=proc.exitcode)
+
+        # 本机 worker 全部退出后仍以账本为准：可能有 worker 崩溃，或其他机器上的 worker 仍持有租约。
+        # 有本机 worker 时，若剩余任务在一个租约周期内无人领取则判为停滞（不合并未完成的运行）；
+        # 没有本机 worker 时一直等待其他机器上的 worker 加入
+        stall_seconds = (worker_kwargs.get("lease_seconds") or 120) if procs else None
+        counts = wait_for_run(queue, run_id, poll_interval, stall_seconds=stall_seconds)
+        log_event(logger, "run_finished", "分片运行结束", run_id=run_id, **counts)
+        for job in queue.list(status="failed", run_id=run_id, limit=1000):
+            log_event(logger, "job_gave_up", "任务重试次数用尽", logging.WARNING, job_id=job["id"],
+                      url=job["payload"].get("url"), attempts=job["attempts"], error=job.get("error"))
+
+        rows = 0
+        if output_file:
+            rows, inputs = merge_run(queue, run_id, output_file, fmt=fmt, workers=parse_workers, compact=compact)
+            log_event(logger, "run_merged", "已合并分片结果", run_id=run_id, files=len(inputs), rows=rows,
+                      output=output_file)
+        return run_id, rows, counts
+    finally:
+        queue.close()
@@ -0,0 +1,11 @@
+# tests/conftest.py
+"""测试数据：benchmarks/synthetic.py 生成的页，结构与 /graph 返回的 commentable 一致"""
+import pytest
+
+from synthetic import iter_synthetic_pages
+
+
+@pytest.fixture
+def pages():
+    """3 页，每页 5 条顶层评论、每条 2 条回复（共 45 条评论）"""
+    return list(iter_synthetic_pages(45, page_size=5, replies_per_comment=2))
@@ -0,0 +1,74 @@
+# tests/test_checkpoint.py
+import pytest
+
+from checkpoint import CrawlCheckpoint
+from dedup import DedupIndex, page_fingerprint
+from page_store import JsonlPageWriter, iter_pages
+
+pytest.importorskip("playwright")
+from crawler import add_commentable, reconcile_last_page  # noqa: E402
+
+
+def _crawl(pages, output_file, checkpoint, append=False):
+    """按 crawl_page 的方式接受一批页：写入 JSONL 并记入断点，返回每页是否为新页"""
+    index = DedupIndex(*checkpoint.load_seen())
+    writer = JsonlPageWriter(output_file, append=append)
+    try:
+        return [add_commentable(p, writer, index, checkpoint=checkpoint) for p in pages]
+    finally:
+        writer.close()
+
+
+def test_resume_skips_pages_already_saved(tmp_path, pages):
+    output_file = str(tmp_path / "out.jsonl")
+    cp_path = str(tmp_path / "cp" / "proj.sqlite")
+    cp = CrawlCheckpoint(cp_path)
+    assert _crawl(pages[:2], output_file, cp) == [True, True]
+    cp.close()
+
+    cp = CrawlCheckpoint(cp_path)
+    assert cp.last_page_info() == pages[1]["comments"]["pageInfo"]
+    assert _crawl(pages[1:], output_file, cp, append=True) == [False, True]
+    cp.close()
+    saved = list(iter_pages(output_file))
+    assert [p["comments"]["pageInfo"]["endCursor"] for p in saved] == ["cursor-1", "cursor-2", "cursor-3"]
+
+
+def test_load_seen_restores_cursors_hashes_and_comment_ids(tmp_path, pages):
+    cp = CrawlCheckpoint(str(tmp_path / "proj.sqlite"))
+    _crawl(pages[:1], str(tmp_path / "out.jsonl"), cp)
+    cursors, hashes, comments = cp.load_seen()
+    assert cursors == {"cursor-1"}
+    assert hashes == {page_fingerprint(pages[0])}
+    root = pages[0]["comments"]["edges"][0]["node"]
+    assert {root["id"], *(r["id"] for r in root["replies"]["nodes"])} <= comments
+    assert len(comments) == 15
+    cp.close()
+
+
+def test_page_written_but_not_recorded_is_reconciled(tmp_path, pages):
+    """add_commentable 写完页、记断点之前崩溃：续抓时补记最后一页，不再重复写出"""
+    output_file = str(tmp_path / "out.jsonl")
+    cp = CrawlCheckpoint(str(tmp_path / "proj.sqlite"))
+    _crawl(pages[:1], output_file, cp)
+    with JsonlPageWriter(output_file, append=True) as w:
+        w.append(pages[1])
+
+    index = DedupIndex(*cp.load_seen())
+    assert reconcile_last_page(output_file, index, cp) == pages[1]["comments"]["pageInfo"]
+    assert cp.last_page_info()["endCursor"] == "cursor-2"
+    assert reconcile_last_page(output_file, index, cp) is None
+    assert _crawl(pages[1:], output_file, cp, append=True) == [False, True]
+    assert len(list(iter_pages(output_file))) == 3
+    cp.close()
+
+
+def test_reset_clears_everything(tmp_path, pages):
+    cp = CrawlCheckpoint(str(tmp_path / "proj.sqlite"))
+    _crawl(pages, str(tmp_path / "out.jsonl"), cp)
+    cp.set("started", "1")
+    cp.reset()
+    assert cp.load_seen() == (set(), set(), set())
+    assert cp.last_page_info() == {}
+    assert cp.get("started") is None
+    cp.close()
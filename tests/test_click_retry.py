@@ -0,0 +1,181 @@
+# tests/test_click_retry.py
+"""crawl_page 点击模式的重试与熔断：用脚本化的假页面模拟超时、429/5xx 与 Cloudflare 挑战"""
+import asyncio
+import json
+
+import pytest
+
+from page_store import iter_pages
+from resilience import CircuitOpenError, CrawlStats
+from synthetic import iter_synthetic_pages
+
+pytest.importorskip("playwright")
+from crawler import LOAD_MORE_SELECTOR, PlaywrightTimeoutError, crawl_page  # noqa: E402
+
+URL = "https://www.kickstarter.com/projects/creator/project/comments"
+PAGES = list(iter_synthetic_pages(25, page_size=5, replies_per_comment=0))
+
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.url = "https://www.kickstarter.com/graph"
+        self.status = status
+        self.ok = 200 <= status < 300
+        self.headers = headers or {}
+        self._body = json.dumps(body).encode() if body is not None else b""
+
+    async def body(self):
+        return self._body
+
+
+class FakeButton:
+    def __init__(self, page):
+        self.page = page
+
+    async def evaluate(self, js):
+        pass
+
+    async def is_visible(self):
+        return True
+
+    async def is_enabled(self):
+        return True
+
+    async def bounding_box(self):
+        return {"x": 0, "y": 0, "width": 10, "height": 10}
+
+    async def click(self, force=False):
+        await self.page.click_load_more()
+
+
+class FakeExpect:
+    def __init__(self, page):
+        self.page = page
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def value(self):
+        if self.page.last is None:
+            raise PlaywrightTimeoutError("timeout")
+        return self.page.last
+
+
+class FakeMouse:
+    async def move(self, *args):
+        pass
+
+
+class FakePage:
+    """
+    每次点击 Load more 按 script 依次得到：'ok'（下一页评论）、'timeout'、'challenge'（403 + cf-mitigated）
+    或一个 HTTP 状态码；script 用完后都是 'ok'。hidden 为 True 的点击轮次找不到按钮（挑战页替换了评论区）。
+    """
+
+    def __init__(self, script=(), hidden=()):
+        self.script = list(script)
+        self.hidden = list(hidden)
+        self.handlers = []
+        self.next_page = 0
+        self.last = None
+        self.clicks = 0
+        self.challenged = False
+        self.mouse = FakeMouse()
+
+    def on(self, event, handler):
+        self.handlers.append(handler)
+
+    async def _emit(self, resp):
+        for handler in self.handlers:
+            await handler(resp)
+
+    async def _next_page(self):
+        resp = FakeResponse(200, [{"data": {"commentable": PAGES[self.next_page]}}])
+        self.next_page += 1
+        await self._emit(resp)
+        return resp
+
+    async def goto(self, url):
+        await self._next_page()
+        return FakeResponse(200)
+
+    async def wait_for_selector(self, *args, **kwargs):
+        return True
+
+    async def evaluate(self, js):
+        return 900 if "innerHeight" in js else None
+
+    async def title(self):
+        return "Just a moment..." if self.challenged else "Comments"
+
+    async def query_selector(self, selector):
+        if selector != LOAD_MORE_SELECTOR:
+            return None
+        self.challenged = self.hidden.pop(0) if self.hidden else False
+        if self.challenged or self.next_page >= len(PAGES):
+            return None
+        return FakeButton(self)
+
+    def expect_response(self, predicate, timeout=None):
+        self.last = None
+        return FakeExpect(self)
+
+    async def click_load_more(self):
+        self.clicks += 1
+        outcome = self.script.pop(0) if self.script else "ok"
+        if outcome == "ok":
+            self.last = await self._next_page()
+        elif outcome == "challenge":
+            self.last = FakeResponse(403, headers={"cf-mitigated": "challenge"})
+            await self._emit(self.last)
+        elif outcome != "timeout":
+            self.last = FakeResponse(outcome, headers={"retry-after": "0"})
+            await self._emit(self.last)
+
+
+def _crawl(tmp_path, page, max_clicks=4, **kwargs):
+    output_file = str(tmp_path / "out.jsonl")
+    stats = CrawlStats()
+    kwargs.setdefault("checkpoint_file", str(tmp_path / "checkpoint.sqlite"))
+    error = None
+    try:
+        asyncio.run(crawl_page(page, URL, output_file=output_file, max_clicks=max_clicks, initial_wait_ms=0,
+                               scroll_sleep_min=0, scroll_sleep_max=0, block_resources=False,
+                               retry_base_delay=0.001, retry_max_delay=0.005, stats=stats, **kwargs))
+    except CircuitOpenError as e:
+        error = e
+    return list(iter_pages(output_file)), stats, error
+
+
+def test_failed_clicks_do_not_use_max_clicks(tmp_path):
+    page = FakePage(["ok", 429, "timeout", "timeout", 500, "ok", "ok", "ok"])
+    saved, stats, error = _crawl(tmp_path, page)
+    assert error is None and saved == PAGES
+    assert page.clicks == 8
+    # 超时后 force click 也超时，记为一次 network 失败
+    assert stats.errors == {"rate_limit": 1, "network": 1, "server": 1}
+    assert stats.retries == 3 and stats.pages == 4
+
+
+def test_consecutive_rate_limits_open_the_circuit_and_resume_finishes(tmp_path):
+    saved, stats, error = _crawl(tmp_path, FakePage(["ok", 429, 429, 429, 429, 429]))
+    assert isinstance(error, CircuitOpenError) and error.kind == "rate_limit"
+    assert saved == PAGES[:2]
+
+    saved, _, error = _crawl(tmp_path, FakePage(), resume=True)
+    assert error is None and saved == PAGES
+
+
+def test_challenge_page_opens_the_circuit(tmp_path):
+    _, _, error = _crawl(tmp_path, FakePage(hidden=[False, True, True]))
+    assert isinstance(error, CircuitOpenError) and error.kind == "challenge"
+
+
+def test_challenge_response_then_recovery(tmp_path):
+    saved, stats, error = _crawl(tmp_path, FakePage(["challenge", "ok", "ok", "ok", "ok"]))
+    assert error is None and saved == PAGES
+    assert stats.errors == {"challenge": 1}
@@ -0,0 +1,118 @@
+# tests/test_comment_store.py
+import copy
+
+import pandas as pd
+import pytest
+
+from comment_store import CommentStore, project_from_filename
+from page_store import JsonlPageWriter
+from parser import build_dataframe, flatten_pages
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = CommentStore(str(tmp_path / "comments.db"))
+    yield s
+    s.close()
+
+
+def _write(path, pages):
+    with JsonlPageWriter(str(path)) as w:
+        for p in pages:
+            w.append(p)
+    return str(path)
+
+
+def _pinned(pages):
+    """第一条评论带 pinnedAt，其余为 None：覆盖时间戳列中的缺失值"""
+    pages = copy.deepcopy(pages)
+    pages[0]["comments"]["edges"][0]["node"]["pinnedAt"] = 1_700_000_100
+    return pages
+
+
+def _sorted(df):
+    return df.sort_values("comment_id", ignore_index=True)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_upsert_frame_matches_ingest_file(tmp_path, pages, compact):
+    pages = _pinned(pages)
+    path = _write(tmp_path / "creator_project_20250101_000000.jsonl", pages)
+    ingested = CommentStore(str(tmp_path / "ingested.db"))
+    framed = CommentStore(str(tmp_path / "framed.db"))
+    try:
+        assert ingested.ingest_file(path) == 45
+        assert framed.upsert_frame(build_dataframe(flatten_pages(pages, compact=compact)), path=path) == 45
+        pd.testing.assert_frame_equal(_sorted(framed.query()), _sorted(ingested.query()))
+        assert framed.stats()[1][0][:2] == ("creator_project", 45)
+    finally:
+        ingested.close()
+        framed.close()
+
+
+def test_query_round_trips_parsed_columns(store, pages):
+    pages = _pinned(pages)
+    store.ingest_pages(pages, project="p")
+    out = _sorted(store.query())
+    expected = _sorted(build_dataframe(flatten_pages(pages)))
+    pd.testing.assert_frame_equal(out.drop(columns="project"), expected, check_dtype=False)
+    assert store.query()["created_at"].is_monotonic_decreasing
+
+
+def test_filters(store, pages):
+    store.ingest_pages(pages[:2], project="a")
+    store.ingest_pages(pages[2:], project="b")
+    df = build_dataframe(flatten_pages(pages))
+
+    assert len(store.query(project="a")) == 30 and len(store.query(project="b")) == 15
+    root = df["comment_id"][0]
+    assert sorted(store.query(parent_id=root)["comment_id"]) == sorted(df.loc[df["parent_id"] == root, "comment_id"])
+    author = df["author_id"][0]
+    assert set(store.query(author_id=author)["comment_id"]) == set(df.loc[df["author_id"] == author, "comment_id"])
+    name = df["author_name"][0]
+    assert len(store.query(author_name=name)) == (df["author_name"] == name).sum()
+
+    cut = df["created_at"].sort_values().iloc[20]
+    since = store.query(since=cut.isoformat())
+    until = store.query(until=cut.tz_localize(None).isoformat())
+    assert len(since) == (df["created_at"] >= cut).sum()
+    assert len(since) + len(until) == 45
+    assert len(store.query(limit=7)) == 7
+    assert store.query(project="missing").empty
+
+
+def test_last_write_wins_and_keeps_project(store, pages):
+    store.ingest_pages(pages, project="p")
+    edited = copy.deepcopy(pages[0])
+    node = edited["comments"]["edges"][0]["node"]
+    node["body"] = "edited"
+    node["deleted"] = True
+    store.ingest_pages([edited])
+    row = store.query(project="p")
+    row = row[row["comment_id"] == node["id"]].iloc[0]
+    assert row["body"] == "edited" and row["deleted"] is True
+    assert store.stats()[0] == 45
+
+
+def test_export(store, pages, tmp_path):
+    store.ingest_pages(pages, project="p")
+    output_file = str(tmp_path / "out.csv")
+    assert store.export(output_file, project="p") == 45
+    assert len(pd.read_csv(output_file, encoding="utf-8-sig")) == 45
+    empty = str(tmp_path / "empty.parquet")
+    assert store.export(empty, project="missing") == 0
+    assert list(pd.read_parquet(empty).columns) == list(store.query().columns)
+
+
+def test_stats(store, pages):
+    store.ingest_pages(pages[:1], project="a")
+    store.ingest_pages(pages[1:], project="b")
+    total, projects = store.stats()
+    assert total == 45
+    assert sorted((p, n) for p, n, _, _ in projects) == [("a", 15), ("b", 30)]
+
+
+def test_project_from_filename():
+    assert project_from_filename("outputs/creator_project_20250101_120000.jsonl") == "creator_project"
+    assert project_from_filename("creator_project_replay_20250101_120000.json") == "creator_project"
+    assert project_from_filename("dump.jsonl") == "dump"
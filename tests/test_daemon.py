@@ -0,0 +1,121 @@
+# tests/test_daemon.py
+import asyncio
+import http.client
+import json
+import threading
+
+import pytest
+
+from job_queue import JobQueue
+
+pytest.importorskip("playwright")
+from daemon import CrawlDaemon, start_http_server, submit_job  # noqa: E402
+
+URL = "https://www.kickstarter.com/projects/creator/project/comments"
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    JobQueue(path).close()
+    return path
+
+
+@pytest.fixture
+def api(queue_path):
+    server = start_http_server(queue_path, port=0)
+    port = server.server_address[1]
+
+    def request(method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        data = json.loads(resp.read() or b"null")
+        conn.close()
+        return resp.status, data
+
+    yield request
+    server.shutdown()
+
+
+def test_submit_and_fetch_jobs(api):
+    status, data = api("POST", "/jobs", {"url": URL, "priority": 3, "max_clicks": 5})
+    assert status == 201
+    job_id = data["id"]
+    status, job = api("GET", f"/jobs/{job_id}")
+    assert status == 200
+    assert job["project"] == "creator_project" and job["priority"] == 3
+    assert job["payload"] == {"url": URL, "max_clicks": 5}
+    assert api("GET", "/jobs?status=queued&limit=1")[1][0]["id"] == job_id
+    assert api("GET", "/health")[1]["jobs"] == {"queued": 1}
+    assert api("POST", f"/jobs/{job_id}/cancel") == (200, {"cancelled": True})
+    assert api("POST", f"/jobs/{job_id}/cancel") == (409, {"cancelled": False})
+    assert api("GET", "/jobs/999")[0] == 404
+
+
+def test_string_incremental_from_is_wrapped(api, queue_path):
+    _, data = api("POST", "/jobs", {"url": URL, "incremental_from": "outputs/prev.jsonl"})
+    queue = JobQueue(queue_path)
+    assert queue.get(data["id"])["payload"]["incremental_from"] == ["outputs/prev.jsonl"]
+    queue.close()
+
+
+@pytest.mark.parametrize("path", ["/jobs?limit=abc", "/jobs?limit=0", "/jobs?limit=-1"])
+def test_bad_limit(api, path):
+    assert api("GET", path)[0] == 400
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    [1, 2],
+    {"kind": "scrape", "url": URL},
+    {"url": 5},
+    {"kind": "parse"},
+    {"url": URL, "priority": "high"},
+    {"url": URL, "max_attempts": 0},
+    {"url": URL, "max_clicks": "many"},
+    {"url": URL, "resume": "yes"},
+    {"url": URL, "incremental_from": ["a.jsonl", 3]},
+])
+def test_bad_payload(api, queue_path, body):
+    status, data = api("POST", "/jobs", body)
+    assert status == 400 and data["error"]
+    queue = JobQueue(queue_path)
+    assert queue.counts() == {}
+    queue.close()
+
+
+def test_bad_content_length(api):
+    assert api("POST", "/jobs", b"{}", {"Content-Length": "abc"})[0] == 400
+
+
+def test_submit_job_requires_parse_inputs(queue_path):
+    queue = JobQueue(queue_path)
+    with pytest.raises(ValueError):
+        submit_job(queue, "parse", {"input_json": []})
+    job_id = submit_job(queue, "parse", {"input_json": "a.jsonl"})
+    assert queue.get(job_id)["payload"]["input_json"] == ["a.jsonl"]
+    queue.close()
+
+
+def test_queue_calls_run_off_the_event_loop(queue_path):
+    daemon = CrawlDaemon(queue_path=queue_path)
+    queue = JobQueue(queue_path, check_same_thread=False)
+    submit_job(queue, "crawl", {"url": URL})
+
+    async def run():
+        loop_thread = threading.get_ident()
+        seen = []
+
+        def claim(**kwargs):
+            seen.append(threading.get_ident())
+            return queue.claim(**kwargs)
+
+        job = await daemon._queue_call(claim, worker="w")
+        return job, seen[0] != loop_thread
+
+    job, off_loop = asyncio.run(run())
+    assert job["kind"] == "crawl" and off_loop
+    queue.close()
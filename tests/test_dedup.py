@@ -0,0 +1,64 @@
+# tests/test_dedup.py
+import copy
+
+from dedup import DedupIndex, page_fingerprint
+
+
+def _ids(edges):
+    return [e["node"]["id"] for e in edges]
+
+
+def test_overlapping_page_keeps_only_new_comments(pages):
+    index = DedupIndex()
+    edges, keys = index.filter_new_edges(pages[0])
+    assert len(edges) == 5 and len(keys) == 15
+    index.mark("cursor-1", page_fingerprint(pages[0]), keys)
+
+    # 下一页重复返回了上一页的最后两条评论
+    overlap = copy.deepcopy(pages[1])
+    overlap["comments"]["edges"][:0] = copy.deepcopy(pages[0]["comments"]["edges"][-2:])
+    edges, keys = index.filter_new_edges(overlap)
+    assert _ids(edges) == _ids(pages[1]["comments"]["edges"])
+    assert len(keys) == 15
+    assert index.dropped_comments == 6   # 2 条顶层评论 + 它们的 4 条回复
+
+
+def test_edited_comment_is_not_emitted_again(pages):
+    index = DedupIndex()
+    _, keys = index.filter_new_edges(pages[0])
+    index.mark("cursor-1", page_fingerprint(pages[0]), keys)
+
+    edited = copy.deepcopy(pages[0])
+    edited["comments"]["edges"][0]["node"]["updatedAt"] = 1800000000
+    assert page_fingerprint(edited) != page_fingerprint(pages[0])
+    edges, keys = index.filter_new_edges(edited)
+    assert edges == [] and keys == []
+
+
+def test_new_reply_under_seen_comment_is_split_out(pages):
+    index = DedupIndex()
+    _, keys = index.filter_new_edges(pages[0])
+    index.mark(None, None, keys)
+
+    page = copy.deepcopy(pages[0])
+    parent = page["comments"]["edges"][0]["node"]
+    reply = copy.deepcopy(parent["replies"]["nodes"][0])
+    reply.update(id="Q29tbWVudC1uZXc=", parentId=None)
+    parent["replies"]["nodes"].append(reply)
+    edges, keys = index.filter_new_edges(page)
+    assert keys == [reply["id"]]
+    assert edges == [{"node": {**reply, "parentId": parent["id"]}}]
+
+
+def test_fingerprint_depends_only_on_comment_ids_and_updates(pages):
+    page = copy.deepcopy(pages[0])
+    page["comments"]["pageInfo"]["endCursor"] = "other"
+    page["comments"]["edges"][0]["node"]["body"] = "changed"
+    assert page_fingerprint(page) == page_fingerprint(pages[0])
+    assert page_fingerprint(pages[0]) != page_fingerprint(pages[1])
+
+
+def test_page_without_comments_falls_back_to_whole_page():
+    empty = {"id": "UHJvamVjdC0x", "comments": {"edges": [], "pageInfo": {"endCursor": None, "hasNextPage": False}}}
+    assert page_fingerprint(empty) == page_fingerprint(copy.deepcopy(empty))
+    assert page_fingerprint(empty) != page_fingerprint({**empty, "id": "UHJvamVjdC0y"})
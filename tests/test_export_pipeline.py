@@ -0,0 +1,94 @@
+# tests/test_export_pipeline.py
+import asyncio
+import filecmp
+
+import pandas as pd
+import pytest
+
+from comment_store import CommentStore
+from export_pipeline import ExportPipeline
+from page_store import open_page_writer
+from parser import parse_edges
+from synthetic import iter_synthetic_pages
+
+@pytest.fixture(scope="module")
+def many_pages():
+    return list(iter_synthetic_pages(600, page_size=10, replies_per_comment=2))
+
+
+def _write_pages(path, pages, append=False):
+    with open_page_writer(path, append=append) as w:
+        for p in pages:
+            w.append(p)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "feather"])
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("resume", [False, True])
+def test_pipeline_output_equals_sequential_parse(tmp_path, many_pages, fmt, compact, resume):
+    pages_file = str(tmp_path / "pages.jsonl")
+    split = 7 if resume else 0
+    if resume:
+        _write_pages(pages_file, many_pages[:split])
+
+    pipeline = ExportPipeline(fmt=fmt, compact=compact, chunk_rows=100, queue_pages=2,
+                              store_db=str(tmp_path / "pipeline.db"))
+    writer = pipeline.wrap(open_page_writer(pages_file, append=resume), pages_file, append=resume, project="demo")
+    for page in many_pages[split:]:
+        writer.append(page)
+    writer.close()
+    assert pipeline.error is None
+    assert pipeline.output_file == str(tmp_path / f"pages.{fmt}")
+
+    sequential = str(tmp_path / f"sequential.{fmt}")
+    store = CommentStore(str(tmp_path / "sequential.db"))
+    assert parse_edges(pages_file, sequential, chunk_rows=100, compact=compact, store=store, project="demo") \
+        == pipeline.rows == 600
+    store.close()
+    assert filecmp.cmp(sequential, pipeline.output_file, shallow=False)
+
+    stores = [CommentStore(str(tmp_path / name)) for name in ("pipeline.db", "sequential.db")]
+    try:
+        pd.testing.assert_frame_equal(*(s.query() for s in stores))
+    finally:
+        for s in stores:
+            s.close()
+
+
+def test_backpressure_keeps_the_queue_bounded(tmp_path, many_pages):
+    pages_file = str(tmp_path / "pages.jsonl")
+    pipeline = ExportPipeline(fmt="csv", queue_pages=1)
+    writer = pipeline.wrap(open_page_writer(pages_file), pages_file)
+
+    async def crawl():
+        backlog = 0
+        for page in many_pages:
+            writer.append(page)
+            backlog = max(backlog, writer._queue.qsize() + len(writer._pending))
+            await writer.wait_writable()
+            assert not writer._pending
+        await writer.aclose()
+        return backlog
+
+    assert asyncio.run(crawl()) <= 2
+    assert pipeline.error is None and pipeline.rows == 600
+    assert len(pd.read_csv(pipeline.output_file, encoding="utf-8-sig")) == 600
+
+
+def test_export_failure_is_recorded_and_pages_are_still_saved(tmp_path, pages):
+    pages_file = str(tmp_path / "pages.jsonl")
+    pipeline = ExportPipeline(output_file=str(tmp_path / "out.txt"), fmt="txt", queue_pages=1)
+    writer = pipeline.wrap(open_page_writer(pages_file), pages_file)
+    for page in pages:
+        writer.append(page)
+    writer.close()
+    assert isinstance(pipeline.error, ValueError)
+    assert len(writer) == len(pages)
+
+
+def test_empty_crawl_writes_header_only(tmp_path):
+    pages_file = str(tmp_path / "pages.jsonl")
+    pipeline = ExportPipeline(fmt="csv")
+    pipeline.wrap(open_page_writer(pages_file), pages_file).close()
+    assert pipeline.rows == 0
+    assert pd.read_csv(pipeline.output_file, encoding="utf-8-sig").empty
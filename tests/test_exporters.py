@@ -0,0 +1,88 @@
+# tests/test_exporters.py
+import pandas as pd
+import pytest
+
+import exporters
+from exporters import format_from_path, open_exporter, with_format_extension
+from page_store import JsonlPageWriter
+from parser import build_dataframe, flatten_pages, parse_edges
+
+
+def _parse(tmp_path, pages, output_file):
+    """把页写成 JSONL 后用 parse_edges 解析导出，返回行数"""
+    src = str(tmp_path / "pages.jsonl")
+    with JsonlPageWriter(src) as w:
+        for p in pages:
+            w.append(p)
+    return parse_edges(src, output_file)
+
+
+def _read(path, fmt):
+    if fmt == "csv":
+        return pd.read_csv(path, encoding="utf-8-sig")
+    if fmt == "xlsx":
+        return pd.read_excel(path)
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_feather(path)
+
+
+def test_format_from_path():
+    assert format_from_path("a/b.PARQUET") == "parquet"
+    assert format_from_path("b.arrow") == "feather"
+    assert format_from_path("b.txt", default="csv") == "csv"
+    assert with_format_extension("out/a.xlsx", "feather") == "out/a.feather"
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        open_exporter("a.xlsx", "txt")
+
+
+@pytest.mark.parametrize("fmt", ["xlsx", "csv", "parquet", "feather"])
+def test_chunked_write_matches_whole_frame(tmp_path, pages, fmt):
+    df = build_dataframe(flatten_pages(pages))
+    path = str(tmp_path / f"out.{fmt}")
+    exporter = open_exporter(path)
+    for start in range(0, len(df), 7):
+        exporter.write(df.iloc[start:start + 7])
+    exporter.close()
+    assert exporter.rows == len(df)
+    out = _read(path, fmt)
+    assert list(out.columns) == list(df.columns)
+    assert out["comment_id"].tolist() == df["comment_id"].tolist()
+    assert out["body"].tolist() == df["body"].tolist()
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_arrow_types(tmp_path, pages, fmt):
+    path = str(tmp_path / f"out.{fmt}")
+    rows = _parse(tmp_path, pages, path)
+    out = _read(path, fmt)
+    assert len(out) == rows == 45
+    assert isinstance(out["created_at"].dtype, pd.DatetimeTZDtype)
+    assert out["author_blocked"].dtype == bool
+    assert list(out["author_badges"].iloc[0]) == pages[0]["comments"]["edges"][0]["node"]["authorBadges"]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet", "feather", "xlsx"])
+def test_empty_input_writes_header_only(tmp_path, fmt):
+    path = str(tmp_path / f"out.{fmt}")
+    assert _parse(tmp_path, [], path) == 0
+    out = _read(path, fmt)
+    assert len(out) == 0 and "comment_id" in out.columns
+
+
+def test_xlsx_row_limit(tmp_path, pages, monkeypatch):
+    df = build_dataframe(flatten_pages(pages))   # 45 行
+    monkeypatch.setattr(exporters, "EXCEL_MAX_ROWS", 46)   # 表头 + 45 行正好放得下
+    exporter = open_exporter(str(tmp_path / "ok.xlsx"))
+    exporter.write(df)
+    exporter.close()
+
+    monkeypatch.setattr(exporters, "EXCEL_MAX_ROWS", 45)
+    exporter = open_exporter(str(tmp_path / "full.xlsx"))
+    exporter.write(df.iloc[:40])
+    with pytest.raises(ValueError):
+        exporter.write(df.iloc[40:])
+    exporter.close()
@@ -0,0 +1,91 @@
+# tests/test_incremental.py
+import copy
+
+from dedup import DedupIndex
+from incremental import IncrementalState, comment_fingerprint, load_previous_comments
+from page_store import JsonlPageWriter, iter_pages
+from replies import replies_page
+
+
+def _write(path, pages):
+    with JsonlPageWriter(path) as w:
+        for p in pages:
+            w.append(p)
+    return path
+
+
+def _without_parent_ids(page):
+    """嵌套在父评论下的回复不带 parentId（只有拆成独立 edge 时才由抓取端注入）"""
+    page = copy.deepcopy(page)
+    for edge in page["comments"]["edges"]:
+        for reply in edge["node"]["replies"]["nodes"]:
+            reply.pop("parentId", None)
+    return page
+
+
+def test_load_previous_comments(tmp_path, pages):
+    path = _write(str(tmp_path / "prev.jsonl"), pages[:2])
+    known, newest = load_previous_comments(path)
+    assert len(known) == 30
+    assert newest == max(n["createdAt"] for p in pages[:2] for e in p["comments"]["edges"]
+                         for n in [e["node"], *e["node"]["replies"]["nodes"]])
+
+
+def test_known_page_is_caught_up(tmp_path, pages):
+    known, newest = load_previous_comments([_write(str(tmp_path / "prev.jsonl"), pages[1:])])
+    state = IncrementalState(known, newest)
+    assert state.observe(pages[0]) == 15
+    assert not state.caught_up
+    assert state.observe(pages[1]) == 0
+    assert state.caught_up
+    assert (state.new_count, state.changed_count) == (15, 0)
+
+
+def test_edited_comment_is_written_to_delta(tmp_path, pages):
+    known, newest = load_previous_comments([_write(str(tmp_path / "prev.jsonl"), pages)])
+    delta_file = str(tmp_path / "delta.jsonl")
+    state = IncrementalState(known, newest, delta_file)
+    edited = copy.deepcopy(pages[0])
+    reply = edited["comments"]["edges"][2]["node"]["replies"]["nodes"][0]
+    reply["body"] = "edited"
+    assert state.observe(edited) == 1
+    assert not state.caught_up
+    state.close()
+    delta = list(iter_pages(delta_file))
+    expected = {k: v for k, v in reply.items() if k != "replies"}
+    assert [e["node"] for e in delta[0]["comments"]["edges"]] == [expected]
+    assert state.changed_count == 1
+
+
+def test_split_reply_matches_nested_reply(tmp_path, pages):
+    """同一条回复上次嵌套在父评论下，这次被拆成带 parentId 的独立 edge：不算变化"""
+    nested = _without_parent_ids(pages[0])
+    known, _ = load_previous_comments([_write(str(tmp_path / "prev.jsonl"), [nested])])
+
+    parent = nested["comments"]["edges"][0]["node"]
+    split = replies_page(nested["id"], parent["id"], parent["replies"])
+    assert all(e["node"]["parentId"] == parent["id"] for e in split["comments"]["edges"])
+    state = IncrementalState(known)
+    assert state.observe(split) == 0
+    assert state.caught_up
+
+    index = DedupIndex(seen_comments=[parent["id"]])
+    edges, _ = index.filter_new_edges(nested)
+    state = IncrementalState(known)
+    assert state.observe({"comments": {"edges": edges}}) == 0
+
+
+def test_nested_reply_matches_split_reply(tmp_path, pages):
+    nested = _without_parent_ids(pages[0])
+    parent = nested["comments"]["edges"][0]["node"]
+    split = replies_page(nested["id"], parent["id"], parent["replies"])
+    known, _ = load_previous_comments([_write(str(tmp_path / "prev.jsonl"), [split])])
+    state = IncrementalState(known)
+    state.observe({"comments": {"edges": [{"node": parent}]}})
+    assert state.changed_count == 0 and state.new_count == 1   # 只有父评论是新的
+
+
+def test_fingerprint_ignores_parent_id_but_not_content():
+    node = {"id": "c1", "body": "hi", "deleted": False}
+    assert comment_fingerprint(node) == comment_fingerprint({**node, "parentId": "p", "replies": {"nodes": []}})
+    assert comment_fingerprint(node) != comment_fingerprint({**node, "deleted": True})
@@ -0,0 +1,55 @@
+# tests/test_instrumentation.py
+import json
+import logging
+
+from instrumentation import Histogram, JsonFormatter, Timings, log_event
+
+
+def test_histogram_memory_is_bounded():
+    h = Histogram(reservoir_size=100)
+    for i in range(100_000):
+        h.observe(i / 100_000)
+    assert h.count == 100_000
+    assert len(h.samples) == 100
+    assert sum(h.counts) == 100_000
+    assert abs(h.quantile(0.5) - 0.5) < 0.15
+
+
+def test_quantiles_are_exact_below_the_reservoir_size():
+    h = Histogram(reservoir_size=1024)
+    for v in range(1, 101):
+        h.observe(v)
+    assert (h.quantile(0.5), h.quantile(0.95), h.max) == (51, 96, 100)
+
+
+def test_timings_summary_and_counters():
+    t = Timings()
+    t.observe("goto", 0.2)
+    t.observe("goto", 0.4)
+    t.incr("graph_pages", 3)
+    assert t.summary()["goto"]["count"] == 2
+    assert t.counters == {"graph_pages": 3}
+    assert "ks_crawl_graph_pages" in t.prometheus_text()
+
+
+def test_log_event_json_line():
+    records = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(self.format(record))
+
+    logger = logging.getLogger("test_instrumentation")
+    handler = Capture()
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        log_event(logger, "effective_config", "生效配置", max_clicks=30, output_file="a.csv")
+        log_event(logger, "click_page", "debug only", logging.DEBUG)
+    finally:
+        logger.removeHandler(handler)
+    assert len(records) == 1
+    data = json.loads(records[0])
+    assert (data["event"], data["msg"], data["max_clicks"], data["output_file"]) == (
+        "effective_config", "生效配置", 30, "a.csv")
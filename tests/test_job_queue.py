@@ -0,0 +1,160 @@
+# tests/test_job_queue.py
+import time
+
+import pytest
+
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite"))
+    yield q
+    q.close()
+
+
+def _expire(queue, job_id):
+    """把租约改到过去，模拟 worker 失联"""
+    queue._conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_claim_order_is_priority_then_submission(queue):
+    low = queue.submit("crawl", {"url": "a"})
+    high = queue.submit("crawl", {"url": "b"}, priority=5)
+    later = queue.submit("parse", {"input_json": ["x.jsonl"]})
+    assert [queue.claim()["id"] for _ in range(3)] == [high, low, later]
+    assert queue.claim() is None
+
+
+def test_claim_skips_running_and_blocked_projects(queue):
+    queue.submit("crawl", {"url": "a"}, project="p")
+    second = queue.submit("crawl", {"url": "b"}, project="p")
+    other = queue.submit("crawl", {"url": "c"}, project="q")
+    queue.claim()
+    assert queue.claim(skip_projects={"q"}) is None
+    assert queue.claim()["id"] == other
+    assert queue.get(second)["status"] == "queued"
+
+
+def test_finish_stores_result(queue):
+    job_id = queue.submit("crawl", {"url": "a"})
+    job = queue.claim()
+    assert job["payload"] == {"url": "a"} and job["attempts"] == 1
+    assert queue.finish(job_id, {"rows": 3})
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"rows": 3}
+    assert queue.counts() == {"done": 1}
+
+
+def test_cancel_only_queued_jobs(queue):
+    queued = queue.submit("crawl", {"url": "a"})
+    running = queue.submit("crawl", {"url": "b"})
+    queue.cancel(queued)
+    queue.claim()
+    assert queue.get(queued)["status"] == "cancelled"
+    assert queue.cancel(running) is False
+
+
+def test_requeue_running_after_a_crash(queue):
+    job_id = queue.submit("crawl", {"url": "a"})
+    queue.claim(worker="daemon")
+    assert queue.requeue_running() == 1
+    assert queue.get(job_id)["status"] == "queued"
+
+
+def test_unknown_kind(queue):
+    with pytest.raises(ValueError):
+        queue.submit("scrape", {})
+
+
+def test_list_filters_and_limit(queue):
+    for url in "abc":
+        queue.submit("crawl", {"url": url})
+    queue.claim()
+    assert [j["payload"]["url"] for j in queue.list(limit=2)] == ["c", "b"]
+    assert [j["payload"]["url"] for j in queue.list(status="running")] == ["a"]
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue):
+    job_id = queue.submit("crawl", {"url": "u"}, project="p", max_attempts=3)
+    job = queue.claim(worker="w1", lease_seconds=60)
+    assert job["id"] == job_id and job["attempts"] == 1
+    assert queue.claim(worker="w2", lease_seconds=60) is None
+
+    _expire(queue, job_id)
+    job = queue.claim(worker="w2", lease_seconds=60)
+    assert job["id"] == job_id and job["worker"] == "w2" and job["attempts"] == 2
+
+    # 原 worker 的结果不再生效
+    assert queue.finish(job_id, {"rows": 1}, worker="w1") is False
+    assert queue.fail(job_id, "late", worker="w1") is None
+    assert queue.heartbeat([job_id], "w1", 60) == set()
+    assert queue.heartbeat([job_id], "w2", 60) == {job_id}
+    assert queue.finish(job_id, {"rows": 1}, worker="w2") is True
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_expired_lease_with_no_attempts_left_fails(queue):
+    job_id = queue.submit("crawl", {"url": "u"}, max_attempts=1)
+    queue.claim(worker="w1", lease_seconds=60)
+    _expire(queue, job_id)
+    assert queue.claim(worker="w2", lease_seconds=60) is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "lease expired"
+
+
+def test_project_with_live_lease_is_skipped(queue):
+    queue.submit("crawl", {"url": "a"}, project="p")
+    second = queue.submit("crawl", {"url": "b"}, project="p")
+    other = queue.submit("crawl", {"url": "c"}, project="q")
+    first = queue.claim(worker="w1", lease_seconds=60)
+    assert queue.claim(worker="w2", lease_seconds=60)["id"] == other
+    assert queue.claim(worker="w3", lease_seconds=60) is None
+    assert queue.get(second)["status"] == "queued"
+
+    # 租约过期后同项目的下一个任务可以被领取
+    _expire(queue, first["id"])
+    assert queue.claim(worker="w3", lease_seconds=60)["id"] in (first["id"], second)
+
+
+def test_fail_retries_with_backoff_then_fails(queue):
+    job_id = queue.submit("crawl", {"url": "u"}, max_attempts=2)
+    queue.claim(worker="w1", lease_seconds=60)
+    assert queue.fail(job_id, "boom", worker="w1", retry_delay=30) == "queued"
+    assert queue.claim(worker="w1", lease_seconds=60) is None   # 退避中
+    live, waiting_until = queue.activity()
+    assert live == 0 and waiting_until > time.time()
+
+    queue._conn.execute("UPDATE jobs SET available_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    queue.claim(worker="w1", lease_seconds=60)
+    assert queue.fail(job_id, "boom", worker="w1") == "failed"
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_pause_does_not_use_an_attempt(queue):
+    job_id = queue.submit("crawl", {"url": "u"}, max_attempts=1)
+    queue.claim(worker="w1", lease_seconds=60)
+    assert queue.pause(job_id, 0, "circuit open", worker="w2") is False
+    assert queue.pause(job_id, 0, "circuit open", worker="w1") is True
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 0 and job["pauses"] == 1
+    assert queue.claim(worker="w1", lease_seconds=60)["attempts"] == 1
+
+
+def test_requeue_running_leaves_leased_jobs(queue):
+    plain = queue.submit("crawl", {"url": "a"})
+    leased = queue.submit("crawl", {"url": "b"})
+    queue.claim(worker="daemon")
+    queue.claim(worker="w1", lease_seconds=60)
+    assert queue.requeue_running() == 1
+    assert queue.get(plain)["status"] == "queued"
+    assert queue.get(leased)["status"] == "running"
+
+
+def test_run_scoping(queue):
+    queue.submit("crawl", {"url": "a"}, run_id="r1")
+    other = queue.submit("crawl", {"url": "b"}, run_id="r2")
+    assert queue.claim(worker="w", lease_seconds=60, run_id="r2")["id"] == other
+    assert queue.counts("r1") == {"queued": 1}
+    assert queue.activity("r2") == (1, None)
+    assert [j["id"] for j in queue.list(run_id="r2")] == [other]
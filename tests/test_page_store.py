@@ -0,0 +1,130 @@
+# tests/test_page_store.py
+import io
+import json
+
+import pytest
+
+from page_store import (JsonlPageWriter, JsonPageWriter, iter_json_array, iter_pages, open_page_writer,
+                        read_last_page)
+
+
+@pytest.mark.parametrize("name", ["pages.jsonl", "pages.json"])
+def test_round_trip(tmp_path, pages, name):
+    path = str(tmp_path / name)
+    with open_page_writer(path) as w:
+        for p in pages:
+            w.append(p)
+        assert len(w) == len(pages)
+    assert list(iter_pages(path)) == pages
+
+
+@pytest.mark.parametrize("name", ["pages.jsonl", "pages.json"])
+def test_append_keeps_existing_pages(tmp_path, pages, name):
+    path = str(tmp_path / name)
+    with open_page_writer(path) as w:
+        w.append(pages[0])
+    with open_page_writer(path, append=True) as w:
+        for p in pages[1:]:
+            w.append(p)
+    assert list(iter_pages(path)) == pages
+
+
+def test_jsonl_pages_are_on_disk_before_close(tmp_path, pages):
+    path = str(tmp_path / "pages.jsonl")
+    w = JsonlPageWriter(path)
+    w.append(pages[0])
+    assert list(iter_pages(path)) == pages[:1]
+    w.close()
+
+
+def test_json_writer_writes_on_close(tmp_path, pages):
+    path = str(tmp_path / "pages.json")
+    w = JsonPageWriter(path)
+    w.append(pages[0])
+    w.close()
+    w.close()
+    assert list(iter_pages(path)) == pages[:1]
+
+
+def test_iter_pages_stop_at_reads_only_existing_pages(tmp_path, pages):
+    path = str(tmp_path / "pages.jsonl")
+    with JsonlPageWriter(path) as w:
+        w.append(pages[0])
+    size = len(open(path, "rb").read())
+    with JsonlPageWriter(path, append=True) as w:
+        w.append(pages[1])
+    assert list(iter_pages(path, stop_at=size)) == pages[:1]
+
+
+def test_iter_pages_skips_unparseable_lines(tmp_path, pages):
+    path = str(tmp_path / "pages.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(pages[0]) + "\n\n{broken\n" + json.dumps(pages[1]) + "\n")
+    assert list(iter_pages(path)) == pages[:2]
+
+
+def test_resume_drops_partial_last_line(tmp_path, pages):
+    path = str(tmp_path / "pages.jsonl")
+    with JsonlPageWriter(path) as w:
+        w.append(pages[0])
+        w.append(pages[1])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(pages[2])[:200])   # 写到一半时崩溃
+    with JsonlPageWriter(path, append=True) as w:
+        w.append(pages[2])
+    assert list(iter_pages(path)) == pages
+
+
+def test_read_last_page(tmp_path, pages):
+    path = str(tmp_path / "pages.jsonl")
+    JsonlPageWriter(path).close()
+    assert read_last_page(path) is None
+    with JsonlPageWriter(path) as w:
+        for p in pages:
+            w.append(p)
+    assert read_last_page(path, block_size=64) == pages[-1]
+
+
+def _items(text, chunk_size=4):
+    return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("text", ["[]", "  [ ]  ", "\n\t[\n]\n"])
+def test_iter_json_array_empty(text):
+    assert _items(text) == []
+
+
+def test_iter_json_array_leading_whitespace_longer_than_a_chunk():
+    assert _items(" " * 50 + '[{"a": 1}]') == [{"a": 1}]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 20])
+def test_iter_json_array_elements_span_chunks(pages, chunk_size):
+    assert _items(json.dumps(pages), chunk_size) == pages
+
+
+def test_iter_json_array_numbers_split_across_chunks():
+    for chunk_size in range(1, 8):
+        assert _items("[1, 23, 4.5, -6e2, 1234567]", chunk_size) == [1, 23, 4.5, -600.0, 1234567]
+
+
+def test_iter_json_array_strings_with_brackets_and_commas():
+    items = ["a, b", "[x]", "]", {"k": "},{"}]
+    assert _items(json.dumps(items), 3) == items
+
+
+@pytest.mark.parametrize("text", ["", "   ", '{"a": 1}'])
+def test_iter_json_array_not_a_list(text):
+    with pytest.raises(ValueError):
+        _items(text)
+
+
+@pytest.mark.parametrize("text", ["[", '[{"a": 1}', '[{"a": 1},', '[{"a": '])
+def test_iter_json_array_truncated(text):
+    with pytest.raises(ValueError):
+        _items(text)
+
+
+def test_iter_json_array_missing_comma():
+    with pytest.raises(ValueError):
+        _items('[{"a": 1} {"b": 2}]')
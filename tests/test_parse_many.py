@@ -0,0 +1,73 @@
+# tests/test_parse_many.py
+import copy
+from concurrent.futures import Future
+
+import pandas as pd
+
+from page_store import JsonlPageWriter
+from parser import _bounded_map, build_dataframe, flatten_pages, parse_many
+
+
+def _write(path, pages):
+    with JsonlPageWriter(str(path)) as w:
+        for p in pages:
+            w.append(p)
+    return str(path)
+
+
+def test_newest_file_wins_and_is_written_first(tmp_path, pages):
+    edited = copy.deepcopy(pages[1])
+    node = edited["comments"]["edges"][0]["node"]
+    node["body"] = "edited later"
+    old = _write(tmp_path / "a_b_20250101_000000.jsonl", pages[:2])
+    new = _write(tmp_path / "a_b_20250102_000000.jsonl", [edited, pages[2]])
+    output_file = str(tmp_path / "merged.csv")
+
+    assert parse_many([old, new], output_file, workers=2) == 45
+    out = pd.read_csv(output_file, encoding="utf-8-sig")
+    expected = build_dataframe(flatten_pages([edited, pages[2], pages[0]]))
+    assert out["comment_id"].tolist() == expected["comment_id"].tolist()
+    assert out.loc[out["comment_id"] == node["id"], "body"].item() == "edited later"
+
+
+def test_duplicates_inside_one_file_are_dropped(tmp_path, pages):
+    path = _write(tmp_path / "a_b_20250101_000000.jsonl", [pages[0], pages[0], pages[1]])
+    output_file = str(tmp_path / "merged.parquet")
+    assert parse_many([path], output_file, workers=1) == 30
+    assert pd.read_parquet(output_file)["comment_id"].is_unique
+
+
+def test_no_input_rows_writes_header(tmp_path):
+    path = _write(tmp_path / "empty.jsonl", [])
+    output_file = str(tmp_path / "merged.csv")
+    assert parse_many([path], output_file, workers=1) == 0
+    assert list(pd.read_csv(output_file).columns)[0] == "comment_id"
+
+
+class _CountingPool:
+    """同步执行的假进程池：记录同时未取走结果的任务数"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    def submit(self, fn, *args):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        future = Future()
+        future.set_result(fn(*args))
+        pool = self
+
+        class Tracked:
+            def result(self):
+                pool.in_flight -= 1
+                return future.result()
+
+        return Tracked()
+
+
+def test_bounded_map_keeps_order_and_window():
+    pool = _CountingPool()
+    results = list(_bounded_map(pool, lambda path, k: path * k, range(10), 3, 2))
+    assert results == [(i, i * 2) for i in range(10)]
+    assert pool.peak == 3
@@ -0,0 +1,115 @@
+# tests/test_parser.py
+import copy
+
+import pandas as pd
+import pytest
+
+from parser import COLUMNS, CompactColumns, build_dataframe, flatten_pages, iter_column_chunks
+from synthetic import iter_synthetic_pages
+
+
+def _preorder(pages):
+    """按页、按评论前序（父评论在前，回复紧随其后）列出 (id, parent_id)"""
+    out = []
+
+    def walk(node, parent_id):
+        out.append((node["id"], parent_id or node.get("parentId")))
+        for reply in node["replies"]["nodes"]:
+            walk(reply, node["id"])
+
+    for page in pages:
+        for edge in page["comments"]["edges"]:
+            walk(edge["node"], None)
+    return out
+
+
+def test_flatten_keeps_preorder_and_parents():
+    pages = list(iter_synthetic_pages(120, page_size=4, replies_per_comment=2, reply_depth=3))
+    cols = flatten_pages(pages)
+    assert list(zip(cols["comment_id"], cols["parent_id"])) == _preorder(pages)
+
+
+def test_deep_reply_chain_does_not_recurse():
+    page = next(iter_synthetic_pages(1))
+    node = page["comments"]["edges"][0]["node"]
+    for depth in range(5000):
+        reply = {"id": f"r{depth}", "body": "", "replies": {"nodes": []}}
+        node["replies"]["nodes"].append(reply)
+        node = reply
+    cols = flatten_pages([page])
+    assert len(cols["comment_id"]) == 5001
+    assert cols["parent_id"][-1] == "r4998"
+
+
+def test_build_dataframe_converts_timestamps(pages):
+    page = pages[0]
+    nodes = [e["node"] for e in page["comments"]["edges"]]
+    nodes[0]["pinnedAt"] = 1700000000
+    nodes[1]["createdAt"] = "bad"
+    df = build_dataframe(flatten_pages([page]))
+    assert list(df.columns) == COLUMNS
+    assert df["pinned_at"].iloc[0] == pd.Timestamp(1700000000, unit="s", tz="UTC")
+    assert df["pinned_at"].iloc[1:].isna().all()
+    assert isinstance(df["created_at"].dtype, pd.DatetimeTZDtype) and str(df["created_at"].dt.tz) == "UTC"
+    row = df.index[df["comment_id"] == nodes[1]["id"]][0]
+    assert pd.isna(df["created_at"].iloc[row])
+
+
+def test_author_fields(pages):
+    df = build_dataframe(flatten_pages(pages))
+    first = pages[0]["comments"]["edges"][0]["node"]
+    row = df.iloc[0]
+    assert (row["author_id"], row["author_name"], row["author_avatar"]) == (
+        first["author"]["id"], first["author"]["name"], first["author"]["imageUrl"])
+    assert row["author_badges"] == first["authorBadges"]
+
+
+def test_chunks_split_on_page_boundaries(pages):
+    chunks = list(iter_column_chunks(pages, chunk_rows=20))
+    assert [len(c["comment_id"]) for c in chunks] == [30, 15]
+    assert sum((c["comment_id"] for c in chunks), []) == flatten_pages(pages)["comment_id"]
+
+
+def _with_gaps(pages):
+    """缺失的时间戳、被屏蔽的作者、没有作者的评论：紧凑模式里最容易与默认模式产生列类型差异的情况"""
+    pages = copy.deepcopy(pages)
+    nodes = [e["node"] for e in pages[0]["comments"]["edges"]]
+    nodes[0]["pinnedAt"] = 1700000000
+    nodes[1]["createdAt"] = None
+    nodes[2]["author"]["isBlocked"] = True
+    nodes[3]["author"] = None
+    return pages
+
+
+@pytest.mark.parametrize("make_pages", [
+    lambda pages: pages,
+    _with_gaps,
+    lambda pages: [],
+    lambda pages: [{"id": "UHJvamVjdC0x", "comments": {"edges": [], "pageInfo": {}}}],
+], ids=["plain", "gaps", "no-pages", "empty-page"])
+def test_compact_matches_default(pages, make_pages):
+    pages = make_pages(pages)
+    compact = flatten_pages(pages, compact=True)
+    assert isinstance(compact, CompactColumns) and len(compact) == len(flatten_pages(pages)["comment_id"])
+    expected = build_dataframe(flatten_pages(pages))
+    pd.testing.assert_frame_equal(build_dataframe(compact), expected)
+
+
+def test_compact_shares_authors_and_strings(pages):
+    nodes = [e["node"] for e in pages[0]["comments"]["edges"]]
+    for node in nodes[1:]:
+        node["author"] = copy.deepcopy(nodes[0]["author"])
+    cols = flatten_pages(pages, compact=True)
+    assert len(cols.authors) == len(set(cols.author_ref)) <= len(cols) - (len(nodes) - 1)
+    badges = cols.values["author_badges"]
+    same = [b for b in badges if b == badges[0]]
+    assert all(b is same[0] for b in same)
+
+
+def test_compact_chunks_match_default(pages):
+    pages = _with_gaps(pages)
+    default = [build_dataframe(c) for c in iter_column_chunks(pages, chunk_rows=20)]
+    compact = [build_dataframe(c) for c in iter_column_chunks(pages, chunk_rows=20, compact=True)]
+    assert len(compact) == len(default) == 2
+    for a, b in zip(compact, default):
+        pd.testing.assert_frame_equal(a, b)
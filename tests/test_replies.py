@@ -0,0 +1,134 @@
+# tests/test_replies.py
+import asyncio
+import json
+
+from replies import ReplyExpander, extract_replies, iter_truncated_threads, replies_page
+
+
+class FakeResponse:
+    def __init__(self, body, status=200):
+        self.status = status
+        self.ok = 200 <= status < 300
+        self.headers = {}
+        self._body = json.dumps(body).encode()
+
+    async def body(self):
+        return self._body
+
+
+class FakeRequest:
+    """每个线程有固定页数；请求体里的 commentId / cursor 决定返回哪一页"""
+
+    def __init__(self, thread_pages, failing=()):
+        self.thread_pages = thread_pages
+        self.failing = set(failing)
+        self.requests = []
+
+    async def post(self, url, data, headers, timeout):
+        variables = json.loads(data)["variables"]
+        cid, cursor = variables["commentId"], variables["cursor"]
+        self.requests.append((cid, cursor))
+        if cid in self.failing:
+            return FakeResponse(None, status=404)
+        n = int(cursor.rsplit("-", 1)[1]) + 1
+        replies = {"nodes": [{"id": f"{cid}-r{n}"}],
+                   "pageInfo": {"hasNextPage": n < self.thread_pages[cid], "endCursor": f"{cid}-{n}"}}
+        return FakeResponse([{"data": {"node": {"id": cid, "replies": replies}}}])
+
+
+class FakeContext:
+    def __init__(self, request):
+        self.request = request
+
+
+def _expander(threads, **kwargs):
+    expander = ReplyExpander(**kwargs)
+    expander.commentable_id = "UHJvamVjdC0x"
+    expander.template = {"url": "https://example.test/graph", "headers": {},
+                         "post_body": {"variables": {"commentId": None, "cursor": None}},
+                         "id_key": "commentId", "cursor_key": "cursor"}
+    expander.pending = {cid: f"{cid}-0" for cid in threads}
+    return expander
+
+
+def test_truncated_threads_are_counted_separately():
+    request = FakeRequest({"short": 2, "exact": 3, "long": 10})
+    expander = _expander(request.thread_pages, max_pages_per_thread=3)
+    pages = []
+    assert asyncio.run(expander.expand(FakeContext(request), pages.append)) == 2
+    assert expander.threads_expanded == 2      # short、exact（第 3 页恰好是最后一页）
+    assert expander.threads_truncated == 1     # long
+    assert expander.pages_fetched == 2 + 3 + 3 == len(pages)
+    assert expander.errors == 0 and expander.pending == {}
+
+
+def test_pages_are_fetched_in_cursor_order_with_parent_id():
+    request = FakeRequest({"a": 3})
+    expander = _expander(["a"])
+    pages = []
+
+    async def on_page(commentable):
+        pages.append(commentable)
+
+    asyncio.run(expander.expand(FakeContext(request), on_page))
+    assert request.requests == [("a", "a-0"), ("a", "a-1"), ("a", "a-2")]
+    nodes = [edge["node"] for page in pages for edge in page["comments"]["edges"]]
+    assert [n["id"] for n in nodes] == ["a-r1", "a-r2", "a-r3"]
+    assert {n["parentId"] for n in nodes} == {"a"}
+    assert {page["id"] for page in pages} == {"UHJvamVjdC0x"}
+
+
+def test_http_error_counts_as_error_not_truncation():
+    request = FakeRequest({"ok": 1, "gone": 1}, failing=["gone"])
+    expander = _expander(request.thread_pages)
+    asyncio.run(expander.expand(FakeContext(request), lambda page: None))
+    assert (expander.threads_expanded, expander.threads_truncated, expander.errors) == (1, 0, 1)
+
+
+def test_missing_template_skips_expansion():
+    expander = ReplyExpander()
+    expander.pending = {"a": "c"}
+    assert asyncio.run(expander.expand(FakeContext(FakeRequest({})), lambda page: None)) == 0
+    assert expander.pages_fetched == 0
+
+
+def test_observe_and_observe_replies(pages):
+    page = pages[0]
+    node = page["comments"]["edges"][0]["node"]
+    node["replies"]["pageInfo"] = {"hasNextPage": True, "endCursor": "r-1"}
+    assert list(iter_truncated_threads(page)) == [(node["id"], "r-1")]
+
+    expander = ReplyExpander()
+    expander.observe(page)
+    assert expander.pending == {node["id"]: "r-1"}
+    assert expander.commentable_id == page["id"]
+    expander.observe_replies(node["id"], {"pageInfo": {"hasNextPage": True, "endCursor": "r-2"}})
+    assert expander.pending == {node["id"]: "r-2"}
+    expander.observe_replies(node["id"], {"pageInfo": {"hasNextPage": False}})
+    assert expander.pending == {}
+
+
+def test_record_template_finds_variables():
+    expander = ReplyExpander()
+    body = [{"variables": {"commentId": "Q29tbWVudC0x", "nextCursor": None, "first": 10}}]
+    expander.record_template("https://example.test/graph", body, {}, "Q29tbWVudC0x", {})
+    assert (expander.template["id_key"], expander.template["cursor_key"]) == ("commentId", "nextCursor")
+
+    unusable = ReplyExpander()
+    unusable.record_template("https://example.test/graph", {"variables": {"first": 10}}, {}, "x", {})
+    assert unusable.template == {}
+
+
+def test_extract_replies():
+    replies = {"nodes": [], "pageInfo": {}}
+    assert extract_replies([{"data": {"node": {"id": "a", "replies": replies}}}]) == ("a", replies)
+    assert extract_replies([{"data": {"comment": {"id": "a", "replies": replies}}}]) == ("a", replies)
+    assert extract_replies([{"data": {"commentable": {"id": "p"}}}]) is None
+    assert extract_replies({"data": {}}) is None
+    assert extract_replies([]) is None
+
+
+def test_replies_page_keeps_existing_parent_id():
+    page = replies_page("p", "a", {"nodes": [{"id": "r1"}, None, {"id": "r2", "parentId": "b"}]})
+    assert [edge["node"] for edge in page["comments"]["edges"]] == [
+        {"id": "r1", "parentId": "a"}, {"id": "r2", "parentId": "b"}]
@@ -0,0 +1,145 @@
+# tests/test_resilience.py
+import asyncio
+import random
+import time
+
+import pytest
+
+from resilience import (CircuitBreaker, CircuitOpenError, CrawlStats, FetchGuard, HostRateLimiter, RetryPolicy,
+                        TokenBucket, classify_status, parse_retry_after)
+
+
+def test_breaker_trips_on_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, challenge_threshold=2)
+    assert breaker.failure("server") is False
+    assert breaker.failure("network") is False
+    assert breaker.failure("rate_limit") is True
+    assert breaker.trips == 1
+
+
+def test_breaker_success_resets_counts():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.failure("server")
+    breaker.success()
+    assert breaker.failure("server") is False
+    assert breaker.failures == 1
+
+
+def test_challenge_has_lower_threshold():
+    breaker = CircuitBreaker(failure_threshold=5, challenge_threshold=2)
+    assert breaker.failure("challenge") is False
+    assert breaker.failure("challenge") is True
+
+
+@pytest.mark.parametrize("kind", ["bad_response", "click_timeout"])
+def test_non_breaker_kinds_never_trip(kind):
+    breaker = CircuitBreaker(failure_threshold=1)
+    assert breaker.failure(kind) is False
+    assert breaker.failures == 0
+
+
+def test_thresholds_are_at_least_one():
+    breaker = CircuitBreaker(failure_threshold=0, challenge_threshold=0)
+    assert breaker.failure("server") is True
+
+
+def test_guard_raises_circuit_open_without_sleeping():
+    guard = FetchGuard("proj", policy=RetryPolicy(base_delay=0, max_delay=0),
+                       breaker=CircuitBreaker(failure_threshold=2, cooldown_seconds=42))
+
+    async def run():
+        await guard.failure("server")
+        with pytest.raises(CircuitOpenError) as info:
+            await guard.failure("server")
+        return info.value
+
+    err = asyncio.run(run())
+    assert (err.project, err.kind, err.retry_after) == ("proj", "server", 42)
+    assert guard.stats.errors == {"server": 2}
+    assert guard.stats.retries == 1
+
+
+def test_classify_status():
+    assert classify_status(429) == "rate_limit"
+    assert classify_status(503) == "server"
+    assert classify_status(403, {"cf-mitigated": "challenge"}) == "challenge"
+    assert classify_status(403) == "rate_limit"
+    assert classify_status(404) == "bad_response"
+    assert classify_status(200) is None
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Thu, 01 Jan 1970 00:00:00 GMT") == 0.0
+
+
+def test_retry_policy_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(base_delay=1, max_delay=8, challenge_delay=5, rng=random.Random(0))
+    for attempt, cap in ((1, 1), (2, 2), (3, 4), (4, 8), (10, 8)):
+        assert cap / 2 <= policy.delay(attempt, "server") <= cap
+    assert 2 <= policy.delay(2, "rate_limit") <= 4
+    assert 2.5 <= policy.delay(1, "challenge") <= 5
+    assert 3 <= policy.delay(1, "rate_limit", retry_after=3) <= 4
+    assert 8 <= policy.delay(1, "rate_limit", retry_after=600) <= 9
+
+
+def test_token_bucket_penalize_and_reward():
+    bucket = TokenBucket(10, burst=2)
+    bucket.penalize()
+    assert bucket.rate == 5 and bucket.tokens <= 0
+    for _ in range(3):
+        bucket.penalize()
+    assert bucket.rate == bucket.min_rate == 1.25
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate == 10
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(50, burst=1)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+    assert asyncio.run(TokenBucket(0).acquire()) == 0.0
+
+
+def test_host_rate_limiter_shares_a_bucket_per_host():
+    limiter = HostRateLimiter(5)
+    a = limiter.bucket("https://www.kickstarter.com/graph")
+    assert limiter.bucket("https://www.kickstarter.com/projects/a/b") is a
+    assert limiter.bucket("https://example.test/graph") is not a
+
+
+def test_guard_success_resets_backoff_and_counts_pages():
+    guard = FetchGuard("proj", policy=RetryPolicy(base_delay=0, max_delay=0),
+                       breaker=CircuitBreaker(failure_threshold=3))
+
+    async def run():
+        for _ in range(2):
+            await guard.failure("network")
+        guard.success(pages=2)
+        await guard.failure("network")
+        await guard.failure("network")
+
+    asyncio.run(run())
+    assert guard.consecutive == 2
+    assert guard.stats.pages == 2 and guard.stats.errors == {"network": 4}
+
+
+def test_crawl_stats_merge():
+    total, project = CrawlStats(), CrawlStats()
+    project.page(3)
+    project.error("server")
+    project.retries = 1
+    project.paused = 1
+    total.merge(project)
+    total.merge(project)
+    fields = total.fields()
+    assert (fields["pages"], fields["retries"], fields["paused"], fields["errors"]) == (6, 2, 2, {"server": 2})
@@ -0,0 +1,100 @@
+# tests/test_response_cache.py
+import json
+import multiprocessing
+
+import pytest
+
+from page_store import iter_pages
+from response_cache import ResponseCache
+
+
+def _body(page):
+    """/graph 响应的原始字节（与页面收到的格式相同）"""
+    return json.dumps([{"data": {"commentable": page}}]).encode()
+
+
+def test_put_get_and_content_addressing(tmp_path, pages):
+    cache = ResponseCache(str(tmp_path))
+    h1 = cache.put("a_b", "https://x/graph", _body(pages[0]))
+    h2 = cache.put("a_b", "https://x/graph", _body(pages[0]))
+    assert h1 == h2
+    assert cache.get(h1) == _body(pages[0])
+    assert cache.get("0" * 64) is None
+    stats = cache.stats()
+    assert (stats["objects"], stats["captures"]) == (1, 2)
+    assert stats["bytes"] == cache.total_bytes < stats["raw_bytes"]
+    cache.close()
+
+
+def test_iter_captures_in_capture_order(tmp_path, pages):
+    first = ResponseCache(str(tmp_path))
+    for p in pages[:2]:
+        first.put("a_b", "https://x/graph", _body(p))
+    first.put("c_d", "https://x/graph", _body(pages[2]))
+    first.close()
+    second = ResponseCache(str(tmp_path))   # 之后的另一次抓取
+    second.put("a_b", "https://x/graph", _body(pages[2]))
+    assert second.projects() == ["a_b", "c_d"]
+    assert [raw for _, raw in second.iter_captures("a_b")] == [_body(p) for p in pages]
+    assert list(second.iter_captures("a_b", since=2 ** 40)) == []
+    second.close()
+
+
+def test_lru_eviction_drops_objects_and_captures(tmp_path, pages):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 9)
+    hashes = [cache.put("a_b", "u", _body(p)) for p in pages]
+    cache.get(hashes[0])   # 最近访问过，最后淘汰
+    size = cache.total_bytes
+    assert cache.evict(target_bytes=size - 1) == 1
+    assert cache.get(hashes[1]) is None
+    assert cache.get(hashes[0]) is not None and cache.get(hashes[2]) is not None
+    assert cache.stats()["captures"] == 2
+    cache.close()
+
+
+def test_size_limit_counts_objects_from_other_processes(tmp_path, pages):
+    a = ResponseCache(str(tmp_path))
+    b = ResponseCache(str(tmp_path))
+    a.put("a_b", "u", _body(pages[0]))
+    a.put("a_b", "u", _body(pages[1]))
+    b.max_bytes = a.total_bytes + 1    # b 自己写入的部分远小于上限，加上 a 的就超了
+    b.put("c_d", "u", _body(pages[2]))
+    assert b.total_bytes <= b.max_bytes * 0.9
+    assert b.stats()["objects"] < 3
+    a.close()
+    b.close()
+
+
+def _store_many(cache_dir, bodies):
+    cache = ResponseCache(cache_dir)
+    for i in range(100):
+        cache.put("a_b", "u", bodies[i % len(bodies)])
+    cache.close()
+
+
+def test_concurrent_processes_store_the_same_bodies(tmp_path, pages):
+    bodies = [_body(p) for p in pages]
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_store_many, args=(str(tmp_path), bodies)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+    assert [p.exitcode for p in procs] == [0] * 4
+    cache = ResponseCache(str(tmp_path))
+    assert cache.stats()["objects"] == 3 and cache.stats()["captures"] == 400
+    cache.close()
+
+
+def test_replay_rebuilds_the_captured_pages(tmp_path, pages):
+    pytest.importorskip("playwright")
+    from crawler import replay_from_cache
+
+    cache = ResponseCache(str(tmp_path / "cache"))
+    for p in [pages[0], pages[1], pages[1], pages[2]]:   # 重复捕获的页只保存一次
+        cache.put("a_b", "https://x/graph", _body(p))
+    cache.put("a_b", "https://x/graph", b"not json")
+    output_file = str(tmp_path / "replay.jsonl")
+    assert replay_from_cache(cache, "a_b", output_file) == 3
+    assert list(iter_pages(output_file)) == pages
+    cache.close()
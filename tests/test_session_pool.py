@@ -0,0 +1,161 @@
+# tests/test_session_pool.py
+import asyncio
+import json
+import os
+import time
+
+from session_pool import SessionPool, is_challenge_page
+
+URL = "https://www.kickstarter.com/projects/a/b/comments"
+HOST = "www.kickstarter.com"
+
+
+class FakeContext:
+    def __init__(self, storage_state=None):
+        self.state = storage_state or {"cookies": [], "origins": []}
+        self.pages = []
+        self.closed = False
+
+    async def storage_state(self):
+        return self.state
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    async def new_context(self, storage_state=None):
+        ctx = FakeContext(storage_state)
+        self.contexts.append(ctx)
+        return ctx
+
+
+def _cookie(expires):
+    return {"name": "cf_clearance", "value": "x", "domain": ".kickstarter.com", "path": "/", "expires": expires}
+
+
+def _save(session_dir, state, saved_at):
+    with open(os.path.join(session_dir, HOST + ".json"), "w", encoding="utf-8") as f:
+        json.dump({"saved_at": saved_at, "storage_state": state}, f)
+
+
+def test_saved_state_is_reused_by_the_next_run(tmp_path):
+    async def run():
+        state = {"cookies": [_cookie(time.time() + 3600)], "origins": []}
+        pool = SessionPool(FakeBrowser(), str(tmp_path), ttl_seconds=600, warm_contexts=0)
+        session = await pool.acquire(URL)
+        assert not session.reused
+        session.context.state = state
+        await pool.release(session)
+        assert session.context.closed   # warm_contexts=0：不保留 context
+
+        browser = FakeBrowser()
+        pool = SessionPool(browser, str(tmp_path), ttl_seconds=600)
+        session = await pool.acquire(URL)
+        assert session.reused and browser.contexts[0].state == state
+        assert pool.stats["state_hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_state_older_than_ttl_is_discarded(tmp_path):
+    _save(str(tmp_path), {"cookies": []}, time.time() - 601)
+    pool = SessionPool(FakeBrowser(), str(tmp_path), ttl_seconds=600)
+    assert pool.load_state(HOST) is None
+    assert pool.stats["expired"] == 1
+    assert not os.listdir(tmp_path)
+
+
+def test_expired_cf_clearance_is_discarded(tmp_path):
+    _save(str(tmp_path), {"cookies": [_cookie(time.time() - 1)]}, time.time())
+    pool = SessionPool(FakeBrowser(), str(tmp_path), ttl_seconds=600)
+    assert pool.load_state(HOST) is None
+    assert pool.stats["expired"] == 1
+
+
+def test_session_cookie_without_expiry_is_kept(tmp_path):
+    state = {"cookies": [_cookie(-1), {"name": "other", "expires": time.time() - 10}]}
+    _save(str(tmp_path), state, time.time())
+    assert SessionPool(FakeBrowser(), str(tmp_path)).load_state(HOST) == state
+
+
+def test_corrupt_state_file_is_removed(tmp_path):
+    with open(tmp_path / (HOST + ".json"), "w") as f:
+        f.write("{not json")
+    assert SessionPool(FakeBrowser(), str(tmp_path)).load_state(HOST) is None
+    assert not os.listdir(tmp_path)
+
+
+def test_warm_context_reuse_and_ttl(tmp_path):
+    async def run():
+        browser = FakeBrowser()
+        pool = SessionPool(browser, str(tmp_path), ttl_seconds=600, warm_contexts=1)
+        first = await pool.acquire(URL)
+        await pool.release(first)
+        again = await pool.acquire(URL)
+        assert again is first and again.reused and pool.stats["warm_hits"] == 1
+
+        await pool.release(again)
+        first.created_at = time.time() - 601   # 热 context 超过 ttl：关闭后改用保存的状态
+        third = await pool.acquire(URL)
+        assert first.context.closed
+        assert third is not first and pool.stats["state_hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_failed_session_is_dropped(tmp_path):
+    async def run():
+        pool = SessionPool(FakeBrowser(), str(tmp_path))
+        ok = await pool.acquire(URL)
+        await pool.release(ok)
+        failed = await pool.acquire(URL)
+        await pool.release(failed, ok=False)
+        assert failed.context.closed
+        assert pool.load_state(HOST) is None
+        assert pool.stats["discarded"] == 1
+
+    asyncio.run(run())
+
+
+def test_warm_pool_is_bounded(tmp_path):
+    async def run():
+        pool = SessionPool(FakeBrowser(), str(tmp_path), warm_contexts=1)
+        a, b = await pool.acquire(URL), await pool.acquire(URL)
+        await pool.release(a)
+        await pool.release(b)
+        assert not a.context.closed and b.context.closed
+        await pool.close()
+        assert a.context.closed
+
+    asyncio.run(run())
+
+
+class FakePage:
+    def __init__(self, title, challenge_form=False):
+        self._title = title
+        self._form = challenge_form
+
+    async def title(self):
+        return self._title
+
+    async def query_selector(self, selector):
+        return object() if self._form else None
+
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_is_challenge_page():
+    async def run():
+        assert await is_challenge_page(FakePage("Just a moment..."))
+        assert await is_challenge_page(FakePage("Comments", challenge_form=True))
+        assert await is_challenge_page(FakePage("Comments"), FakeResponse({"cf-mitigated": "challenge"}))
+        assert not await is_challenge_page(FakePage("Comments — Kickstarter"), FakeResponse({}))
+
+    asyncio.run(run())
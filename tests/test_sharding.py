@@ -0,0 +1,88 @@
+# tests/test_sharding.py
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from job_queue import JobQueue
+from page_store import JsonlPageWriter
+from sharding import RunStalledError, merge_run, wait_for_run
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite"), check_same_thread=False)
+    yield q
+    q.close()
+
+
+def test_wait_for_finished_run_returns_counts(queue):
+    job_id = queue.submit("crawl", {"url": "a"}, run_id="r1")
+    queue.submit("crawl", {"url": "b"}, run_id="r2")
+    queue.claim(worker="w", run_id="r1")
+    queue.finish(job_id, {"rows": 1})
+    assert wait_for_run(queue, "r1", poll_interval=0.01, stall_seconds=0) == {"done": 1}
+
+
+def test_stalled_run_raises(queue):
+    queue.submit("crawl", {"url": "a"}, run_id="r1")
+    started = time.monotonic()
+    with pytest.raises(RunStalledError) as exc:
+        wait_for_run(queue, "r1", poll_interval=0.01, stall_seconds=0.1)
+    assert time.monotonic() - started >= 0.1
+    assert exc.value.run_id == "r1" and exc.value.counts == {"queued": 1}
+
+
+def test_live_lease_is_not_a_stall(queue):
+    job_id = queue.submit("crawl", {"url": "a"}, run_id="r1")
+    queue.claim(worker="w", lease_seconds=60, run_id="r1")
+    timer = threading.Timer(0.3, queue.finish, (job_id, {"rows": 1}))
+    timer.start()
+    try:
+        assert wait_for_run(queue, "r1", poll_interval=0.01, stall_seconds=0.05) == {"done": 1}
+    finally:
+        timer.join()
+
+
+def test_retry_backoff_is_not_a_stall(queue):
+    job_id = queue.submit("crawl", {"url": "a"}, run_id="r1", max_attempts=2)
+    queue.claim(worker="w", lease_seconds=60, run_id="r1")
+    queue.fail(job_id, "boom", worker="w", retry_delay=60)
+    timer = threading.Timer(0.3, queue.cancel, (job_id,))
+    timer.start()
+    try:
+        assert wait_for_run(queue, "r1", poll_interval=0.01, stall_seconds=0.05) == {"cancelled": 1}
+    finally:
+        timer.join()
+
+
+def test_merge_run_dedups_done_outputs(queue, tmp_path, pages):
+    outputs = []
+    for i, chunk in enumerate((pages[:2], pages[1:])):
+        path = str(tmp_path / f"creator_project_2025010{i + 1}_000000.jsonl")
+        with JsonlPageWriter(path) as w:
+            for page in chunk:
+                w.append(page)
+        outputs.append(path)
+    for path in outputs + [str(tmp_path / "missing.jsonl")]:
+        job_id = queue.submit("crawl", {"url": path}, run_id="r1")
+        queue.claim(worker="w", run_id="r1")
+        queue.finish(job_id, {"output_file": path})
+
+    output_file = str(tmp_path / "merged.csv")
+    rows, inputs = merge_run(queue, "r1", output_file, workers=1)
+    assert rows == 45 and sorted(inputs) == outputs
+    assert pd.read_csv(output_file, encoding="utf-8-sig")["comment_id"].is_unique
+    assert merge_run(queue, "r2", output_file) == (0, [])
+
+
+def test_submit_run(queue):
+    pytest.importorskip("playwright")
+    from sharding import submit_run
+
+    ids = submit_run(queue, ["https://www.kickstarter.com/projects/a/b", "https://www.kickstarter.com/projects/a/c"],
+                     "r1")
+    jobs = [queue.get(i) for i in ids]
+    assert {j["run_id"] for j in jobs} == {"r1"} and {j["max_attempts"] for j in jobs} == {3}
+    assert all(j["payload"]["parse"] is False for j in jobs)